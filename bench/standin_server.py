@@ -0,0 +1,29 @@
+# bench/standin_server.py
+
+"""
+Stand-in server
+-x-x-
+Runs the real server app against the in-memory Mongo/RabbitMQ stand-ins, so the
+swarm benchmark works offline:
+
+    python -m bench.standin_server --port 8000
+"""
+
+import argparse
+import uvicorn
+
+from bench import standins
+
+def main():
+    parser = argparse.ArgumentParser(description="T-REX server backed by in-memory Mongo/RabbitMQ stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    standins.install()
+    from server.server import app  # imported after the stand-ins are in place
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="critical", ws_max_queue=1024, backlog=4096)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# bench/standins.py
+
+"""
+Local stand-ins
+-x-x-
+In-memory replacements for MongoDB (Motor) and RabbitMQ (aio_pika) so the server
+can be load-tested offline. They implement just the driver surface the server
+uses, answer immediately and keep everything in process memory.
+
+`install()` swaps them in; it must run before the FastAPI lifespan starts.
+"""
+
+import asyncio
+import itertools
+
+from collections import defaultdict
+from types import SimpleNamespace
+
+# --- Mongo ---------------------------------------------------------------
+
+def _matches(doc: dict, query: dict) -> bool:
+    # plain equality only; enough for the lookups the server does
+    for key, expected in (query or {}).items():
+        if isinstance(expected, dict):
+            continue  # operator queries ($gte, $in, ...) aren't evaluated by the stand-in
+        if doc.get(key) != expected:
+            return False
+    return True
+
+class StandInCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class StandInCollection:
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = {}
+        self.write_ops = 0
+        self.inserted = 0
+
+    def _insert(self, doc: dict, retain: bool = False):
+        # plain inserts (telemetry) are only counted, so the stand-in doesn't inflate the server's RSS;
+        # upserted documents are kept since the server reads them back
+        doc.setdefault("_id", next(self._ids))
+        self.inserted += 1
+        if retain:
+            self.docs[doc["_id"]] = doc
+
+    def _upsert(self, query: dict, update: dict, upsert: bool):
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        if doc is None:
+            if not upsert:
+                return 0
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            self._insert(doc, retain=True)
+        doc.update(update.get("$set", {}))
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key, value in update.get("$min", {}).items():
+            doc[key] = min(doc.get(key, value), value)
+        for key, value in update.get("$max", {}).items():
+            doc[key] = max(doc.get(key, value), value)
+        return 1
+
+    async def insert_one(self, doc):
+        self.write_ops += 1
+        self._insert(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self.write_ops += 1
+        for doc in docs:
+            self._insert(doc)
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    async def update_one(self, query, update, upsert=False):
+        self.write_ops += 1
+        return SimpleNamespace(modified_count=self._upsert(query, update, upsert))
+
+    async def bulk_write(self, ops, ordered=True):
+        self.write_ops += 1
+        for op in ops:
+            # pymongo write ops keep their arguments in private attributes
+            if hasattr(op, "_doc") and not hasattr(op, "_filter"):
+                self._insert(op._doc)
+            elif hasattr(op, "_doc"):
+                self._upsert(op._filter, op._doc, bool(getattr(op, "_upsert", False)))
+        return SimpleNamespace(bulk_api_result={})
+
+    async def delete_one(self, query):
+        self.write_ops += 1
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        if doc is not None:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        self.write_ops += 1
+        doomed = [d["_id"] for d in self.docs.values() if _matches(d, query)]
+        for _id in doomed:
+            del self.docs[_id]
+        return SimpleNamespace(deleted_count=len(doomed))
+
+    async def find_one(self, query=None, projection=None):
+        return next((d for d in self.docs.values() if _matches(d, query)), None)
+
+    def find(self, query=None, projection=None):
+        return StandInCursor([d for d in self.docs.values() if _matches(d, query)])
+
+    def aggregate(self, pipeline, **kwargs):
+        return StandInCursor([])
+
+    async def count_documents(self, query=None):
+        return sum(1 for d in self.docs.values() if _matches(d, query))
+
+    async def create_index(self, keys, **kwargs):
+        return kwargs.get("name", "standin_index")
+
+class StandInDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> StandInCollection:
+        if name not in self.collections:
+            self.collections[name] = StandInCollection(name)
+        return self.collections[name]
+
+    async def create_collection(self, name, **kwargs):
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self.collections)
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+class StandInMotorClient:
+    def __init__(self, *args, **kwargs):
+        self.databases = defaultdict(StandInDatabase)
+        self.admin = self.databases["admin"]
+
+    def __getitem__(self, name: str) -> StandInDatabase:
+        return self.databases[name]
+
+    def close(self):
+        pass
+
+# --- RabbitMQ ------------------------------------------------------------
+
+class StandInIncomingMessage:
+    def __init__(self, message, routing_key: str):
+        self.body = message.body
+        self.routing_key = routing_key
+        self.correlation_id = getattr(message, "correlation_id", None)
+        self.reply_to = getattr(message, "reply_to", None)
+        self.content_type = getattr(message, "content_type", None)
+        self.headers = getattr(message, "headers", None) or {}
+
+    def process(self, *args, **kwargs):
+        return _NullContext()
+
+    async def ack(self, *args, **kwargs):
+        pass
+
+    async def nack(self, *args, **kwargs):
+        pass
+
+    async def reject(self, *args, **kwargs):
+        pass
+
+class _NullContext:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class StandInQueue:
+    def __init__(self, broker, name: str):
+        self.broker = broker
+        self.name = name
+        self.consumers = []
+
+    async def bind(self, exchange, routing_key: str = ""):
+        exchange.bindings.append((routing_key, self))
+
+    async def consume(self, callback, no_ack: bool = False, **kwargs):
+        self.consumers.append(callback)
+        return f"ctag.{self.name}"
+
+    def deliver(self, message, routing_key: str):
+        for callback in self.consumers:
+            asyncio.get_running_loop().create_task(callback(StandInIncomingMessage(message, routing_key)))
+
+class StandInExchange:
+    def __init__(self, broker, name: str, kind: str = "direct"):
+        self.broker = broker
+        self.name = name
+        self.kind = kind
+        self.bindings = []
+        self.published = 0
+
+    async def publish(self, message, routing_key: str = "", **kwargs):
+        self.published += 1
+        if not self.name:
+            queue = self.broker.queues.get(routing_key)  # default exchange routes by queue name
+            if queue:
+                queue.deliver(message, routing_key)
+            return None
+
+        for key, queue in self.bindings:
+            if self.kind == "fanout" or key == routing_key:
+                queue.deliver(message, routing_key)
+        return None
+
+class StandInChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.default_exchange = broker.default_exchange
+
+    async def declare_exchange(self, name: str, kind=None, **kwargs):
+        kind = getattr(kind, "value", kind) or "direct"
+        if name not in self.broker.exchanges:
+            self.broker.exchanges[name] = StandInExchange(self.broker, name, kind)
+        return self.broker.exchanges[name]
+
+    async def get_exchange(self, name: str, ensure: bool = True):
+        return await self.declare_exchange(name)
+
+    async def declare_queue(self, name: str = "", **kwargs):
+        name = name or f"standin.{len(self.broker.queues)}"
+        if name not in self.broker.queues:
+            self.broker.queues[name] = StandInQueue(self.broker, name)
+        return self.broker.queues[name]
+
+    async def set_qos(self, *args, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+class StandInRabbitConnection:
+    def __init__(self):
+        self.is_closed = False
+        self.exchanges = {}
+        self.queues = {}
+        self.default_exchange = StandInExchange(self, "")
+
+    async def channel(self, *args, **kwargs):
+        return StandInChannel(self)
+
+    async def close(self):
+        self.is_closed = True
+
+async def connect_standin_rabbit(*args, **kwargs):
+    return StandInRabbitConnection()
+
+def install():
+    """
+    Point the server's Mongo and RabbitMQ managers at the in-memory stand-ins.
+    """
+    from server.comms import mongo_manager, rmq_manager
+
+    mongo_manager.AsyncIOMotorClient = StandInMotorClient
+    rmq_manager.aio_pika.connect_robust = connect_standin_rabbit
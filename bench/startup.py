@@ -0,0 +1,77 @@
+# bench/startup.py
+
+"""
+Agent startup
+-x-x-
+Measures how long a freshly (re)started agent takes before it can connect:
+process start, `import client.client` (config, logger, spool, collectors),
+system UUID resolution and loading the network stack (httpx, websockets).
+
+Every run is a new interpreter, the way a supervisor restarts the agent. Runs
+alternate between a cold UUID cache (first start on a machine) and a warm one.
+
+    python -m bench.startup --runs 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT_SCRIPT = os.path.join(ROOT, "client", "client.py")
+
+# runs inside the child interpreter; prints its phase timings as JSON
+CHILD = """
+import sys, time, json
+t0 = time.perf_counter()
+sys.argv[0] = {script!r}  # config.jsonc is looked up next to the agent binary
+import client.client as agent
+t1 = time.perf_counter()
+from client.utils import get_system_uuid
+uuid = get_system_uuid({cache!r})
+t2 = time.perf_counter()
+agent.load_network_modules()
+t3 = time.perf_counter()
+print(json.dumps({{"import": t1 - t0, "uuid": t2 - t1, "network": t3 - t2, "uuid_found": bool(uuid)}}))
+"""
+
+def run_once(cache_path: str) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(script=CLIENT_SCRIPT, cache=cache_path)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="T-REX agent startup benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="interpreter starts per cache state")
+    args = parser.parse_args()
+
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="trex-startup-"), "system_uuid")
+    results = {"cold": [], "warm": []}
+    for _ in range(args.runs):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        results["cold"].append(run_once(cache_path))
+        results["warm"].append(run_once(cache_path))
+
+    print(f"{'':6}{'total':>10}{'import':>10}{'uuid':>10}{'network':>10}   (median of {args.runs}, ms)")
+    for state, runs in results.items():
+        row = [median([r[phase] for r in runs]) * 1000 for phase in ("total", "import", "uuid", "network")]
+        print(f"{state:6}" + "".join(f"{v:10.1f}" for v in row))
+    if not any(r["uuid_found"] for r in results["cold"]):
+        print("note: the system UUID could not be resolved here (dmidecode needs sudo), so the cache stayed empty")
+
+if __name__ == "__main__":
+    main()
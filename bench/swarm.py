@@ -0,0 +1,321 @@
+# bench/swarm.py
+
+"""
+Agent swarm
+-x-x-
+Load generator & end-to-end throughput benchmark. Simulates many agents with
+synthetic UUIDs, following the same connect flow as `client/client.py`
+(POST /auth/get_token, then websockets.connect to /auth/ws/{uuid}), spread over
+one or more processes.
+
+Reports connect rate, messages/sec, ping round-trip p50/p99 and server RSS.
+
+    # offline: spawns the server against in-memory Mongo/RabbitMQ stand-ins
+    python -m bench.swarm --spawn-server --agents 5000 --procs 4 --ramp 500 --rate 2 --payload 256
+
+    # against a running server (pass its pid to sample RSS)
+    python -m bench.swarm --host 10.0.0.5 --port 8000 --server-pid 4242 --agents 20000
+
+Each agent holds one socket; past ~60k agents per source IP the kernel runs out of
+ephemeral ports, and `ulimit -n` must allow one fd per agent.
+"""
+
+import os
+import sys
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import resource
+import subprocess
+import multiprocessing
+
+import httpx
+import websockets
+
+from client.utils import BINARY_SUBPROTOCOL, PROTO_BINARY, PROTO_TEXT
+from client.utils import pack_records, unpack_message
+
+# --- worker process ------------------------------------------------------
+
+class SwarmStats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failed = 0
+        self.disconnected = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.connect_times = []  # seconds from token request to open websocket
+        self.rtts = []  # ping round trips (seconds)
+        self.first_connect_at = None
+        self.last_connect_at = None
+
+    def snapshot(self, proc: int, final: bool = False) -> dict:
+        snap = {
+            "proc": proc,
+            "final": final,
+            "connected": self.connected,
+            "connect_failed": self.connect_failed,
+            "disconnected": self.disconnected,
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+            "first_connect_at": self.first_connect_at,
+            "last_connect_at": self.last_connect_at,
+        }
+        if final:
+            snap["connect_times"] = self.connect_times
+            snap["rtts"] = self.rtts
+        return snap
+
+async def answer_pings(ws, protocol: str):
+    """
+    Read what the server pushes and answer its heartbeat pings, as `client/client.py`
+    does; an agent that only sends protocol-level pings looks idle to the server.
+    """
+    try:
+        async for message in ws:
+            for record in unpack_message(message, protocol):
+                if record.get("type") == "heartbeat.ping":
+                    await ws.send(pack_records([{"type": "heartbeat.pong"}], protocol))
+    except websockets.ConnectionClosed:
+        pass
+
+async def run_agent(n: int, args, http: httpx.AsyncClient, stats: SwarmStats, stop: asyncio.Event):
+    system_uuid = f"swarm-{uuid.uuid4()}"
+    base = f"{args.host}:{args.port}"
+    started = time.perf_counter()
+
+    try:
+        response = await http.post(
+            f"http://{base}/auth/get_token",
+            json={"system_uuid": system_uuid, "password": args.password}
+        )
+        response.raise_for_status()
+        token = response.json()["data"]["access_token"]
+
+        subprotocols = [BINARY_SUBPROTOCOL] if args.protocol == PROTO_BINARY else None
+        ws_url = f"ws://{base}/auth/ws/{system_uuid}?token={token}&org={args.org}"
+        ws = await websockets.connect(ws_url, subprotocols=subprotocols, ping_interval=None, open_timeout=30)
+    except Exception:
+        stats.connect_failed += 1
+        return
+
+    now = time.perf_counter()
+    stats.connected += 1
+    stats.connect_times.append(now - started)
+    stats.first_connect_at = stats.first_connect_at or time.time()
+    stats.last_connect_at = time.time()
+
+    protocol = PROTO_BINARY if ws.subprotocol == BINARY_SUBPROTOCOL else PROTO_TEXT
+    blob = "x" * args.payload
+    interval = 1.0 / args.rate if args.rate > 0 else None
+    next_ping = time.monotonic() + args.ping_interval * (1 + n % 7) / 7  # spread pings out
+    seq = 0
+    reader = asyncio.create_task(answer_pings(ws, protocol))
+
+    try:
+        while not stop.is_set():
+            if reader.done():
+                raise ConnectionError("closed by the server")
+            if interval:
+                records = []
+                for _ in range(args.batch):
+                    seq += 1
+                    records.append({"type": "telemetry", "seq": seq, "ts": time.time(), "payload": {"values": {"blob": blob}}})
+                frame = pack_records(records, protocol)
+                await ws.send(frame)
+                stats.messages_sent += len(records)
+                stats.bytes_sent += len(frame)
+
+            if time.monotonic() >= next_ping:
+                next_ping += args.ping_interval
+                pong_waiter = await ws.ping()
+                stats.rtts.append(await asyncio.wait_for(pong_waiter, timeout=30))
+
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval or args.ping_interval)
+            except asyncio.TimeoutError:
+                pass
+    except Exception:
+        stats.disconnected += 1
+    finally:
+        reader.cancel()
+        await ws.close()
+
+async def worker_main(proc: int, n_agents: int, args, results):
+    stats = SwarmStats()
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.http_connections, max_keepalive_connections=args.http_connections)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        tasks = []
+        ramp_per_proc = args.ramp / args.procs
+
+        async def report():
+            while not stop.is_set():
+                results.put(stats.snapshot(proc))
+                await asyncio.sleep(1)
+
+        reporter = asyncio.create_task(report())
+        ramp_start = time.monotonic()
+        for n in range(n_agents):
+            tasks.append(asyncio.create_task(run_agent(n, args, http, stats, stop)))
+            # ramp: the n-th agent of this process starts at n / ramp_per_proc seconds
+            delay = ramp_start + (n + 1) / ramp_per_proc - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        reporter.cancel()
+
+    results.put(stats.snapshot(proc, final=True))
+
+def worker_entry(proc: int, n_agents: int, args, results):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent coordinates shutdown
+    raise_fd_limit()
+    asyncio.run(worker_main(proc, n_agents, args, results))
+
+# --- parent / reporting --------------------------------------------------
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def read_rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def percentile(values, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def wait_for_server(host: str, port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://{host}:{port}/", timeout=1).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    return False
+
+def ms(value):
+    return f"{value * 1000:.1f}ms" if value is not None else "n/a"
+
+def main():
+    parser = argparse.ArgumentParser(description="T-REX agent swarm load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--password", default="treacle_authpass")
+    parser.add_argument("--org", default="swarm")
+    parser.add_argument("--agents", type=int, default=1000, help="total simulated agents")
+    parser.add_argument("--procs", type=int, default=1, help="load generator processes")
+    parser.add_argument("--ramp", type=float, default=200, help="new agents per second (all processes)")
+    parser.add_argument("--rate", type=float, default=1, help="frames per second per agent (0 = idle)")
+    parser.add_argument("--batch", type=int, default=1, help="records per frame")
+    parser.add_argument("--payload", type=int, default=128, help="payload bytes per record")
+    parser.add_argument("--protocol", choices=[PROTO_BINARY, PROTO_TEXT], default=PROTO_BINARY)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to hold load after the ramp")
+    parser.add_argument("--ping-interval", type=float, default=5, help="seconds between latency pings per agent")
+    parser.add_argument("--http-connections", type=int, default=100, help="keep-alive pool size for token requests")
+    parser.add_argument("--spawn-server", action="store_true", help="start the server against in-memory stand-ins")
+    parser.add_argument("--server-pid", type=int, help="pid of an already running server (for RSS)")
+    args = parser.parse_args()
+
+    server_proc = None
+    server_pid = args.server_pid
+    if args.spawn_server:
+        server_proc = subprocess.Popen(
+            [sys.executable, "-m", "bench.standin_server", "--host", args.host, "--port", str(args.port)],
+            env={**os.environ, "LOG_LEVEL": "WARNING"},
+            stdout=subprocess.DEVNULL
+        )
+        server_pid = server_proc.pid
+        if not wait_for_server(args.host, args.port):
+            server_proc.terminate()
+            sys.exit("swarm: stand-in server did not come up")
+
+    results = multiprocessing.Queue()
+    per_proc = [args.agents // args.procs + (1 if i < args.agents % args.procs else 0) for i in range(args.procs)]
+    workers = [
+        multiprocessing.Process(target=worker_entry, args=(i, n, args, results), daemon=True)
+        for i, n in enumerate(per_proc)
+    ]
+
+    started = time.time()
+    for worker in workers:
+        worker.start()
+
+    latest, finals = {}, {}
+    rss_peak = 0.0
+    try:
+        while len(finals) < len(workers):
+            while not results.empty():
+                snap = results.get()
+                (finals if snap["final"] else latest)[snap["proc"]] = snap
+
+            rss = read_rss_mb(server_pid) if server_pid else None
+            if rss:
+                rss_peak = max(rss_peak, rss)
+            connected = sum(s["connected"] for s in latest.values())
+            sent = sum(s["messages_sent"] for s in latest.values())
+            print(
+                f"\r[{time.time() - started:6.1f}s] connected={connected:<7} sent={sent:<10} rss={rss or 0:.0f}MB ",
+                end="", flush=True
+            )
+
+            if not any(w.is_alive() for w in workers) and results.empty():
+                break
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("\nswarm: interrupted")
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+        rss_final = read_rss_mb(server_pid) if server_pid else None
+        if server_proc:
+            server_proc.terminate()
+            try:
+                server_proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                print("\nswarm: stand-in server did not exit, killing it")
+                server_proc.kill()
+                server_proc.wait()
+
+    snaps = list(finals.values()) or list(latest.values())
+    connected = sum(s["connected"] for s in snaps)
+    failed = sum(s["connect_failed"] for s in snaps)
+    dropped = sum(s["disconnected"] for s in snaps)
+    sent = sum(s["messages_sent"] for s in snaps)
+    sent_bytes = sum(s["bytes_sent"] for s in snaps)
+    connect_times = [t for s in snaps for t in s.get("connect_times", [])]
+    rtts = [t for s in snaps for t in s.get("rtts", [])]
+    firsts = [s["first_connect_at"] for s in snaps if s["first_connect_at"]]
+    lasts = [s["last_connect_at"] for s in snaps if s["last_connect_at"]]
+    ramp_window = (max(lasts) - min(firsts)) if firsts and lasts else 0
+    elapsed = time.time() - started
+
+    print("\n")
+    print(f"agents        : {connected} connected, {failed} failed, {dropped} dropped mid-run")
+    print(f"connect rate  : {connected / ramp_window if ramp_window else connected:.0f} agents/s "
+          f"(p50 {ms(percentile(connect_times, 50))}, p99 {ms(percentile(connect_times, 99))})")
+    print(f"throughput    : {sent / elapsed:.0f} msgs/s, {sent_bytes / elapsed / 1024 / 1024:.2f} MiB/s "
+          f"({args.protocol}, {args.batch} record(s)/frame)")
+    print(f"ping rtt      : p50 {ms(percentile(rtts, 50))}, p99 {ms(percentile(rtts, 99))} ({len(rtts)} samples)")
+    if server_pid:
+        print(f"server rss    : peak {rss_peak:.0f}MB, final {rss_final or 0:.0f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,137 @@
+import os
+import random
 import asyncio
-import httpx
 import signal
-import websockets
 import sys
+import time
 
 from urllib.parse import urlencode
-from websockets.exceptions import ConnectionClosed
 
 from client.config import load_config
-from client.config import logger
+from client.config import logger, console_handler
+from client.config.sys_config import BIN_DIR
 from client.utils import get_system_uuid
+from client.utils import BINARY_SUBPROTOCOL, PROTO_BINARY, PROTO_TEXT
+from client.utils import pack_records, unpack_message, get_token_expiry
+from client.utils import FileUploader, TelemetrySpool
+from client.utils import decorrelated_jitter
+from client.utils import TelemetryPipeline, load_average, process_stats
 
 config = load_config()
 
-# Agent runtime flag
-running = True
+# httpx, websockets & rich (the log console) are most of the agent's import time; they're
+# loaded by load_network_modules() off the event loop, once collectors and signal handlers are up
+httpx = websockets = ConnectionClosed = InvalidStatus = None
+
+def load_network_modules():
+    global httpx, websockets, ConnectionClosed, InvalidStatus
+    import httpx
+    import websockets
+    from websockets.exceptions import ConnectionClosed, InvalidStatus
+    console_handler.load()
+
+# Set on SIGINT/SIGTERM; every wait in the agent also waits on it (created on the agent's loop)
+shutdown = None
+
+# Resumable file uploads; requested paths survive reconnects
+uploader = FileUploader(
+    chunk_size=config.get("UPLOAD_CHUNK_SIZE", 256 * 1024),
+    window=config.get("UPLOAD_WINDOW", 4),
+    allowed_dirs=config.get("UPLOAD_DIRS", [])
+)
+
+# Telemetry produced while the server is unreachable; drained after reconnect
+spool = TelemetrySpool(
+    os.path.join(BIN_DIR, config.get("SPOOL_DIR", "spool")),
+    max_bytes=config.get("SPOOL_MAX_BYTES", 64 * 1024 * 1024),
+    segment_size=config.get("SPOOL_SEGMENT_SIZE", 4 * 1024 * 1024)
+)
+
+# Collectors sample on their own intervals; one frame of series records per flush window
+telemetry = TelemetryPipeline(
+    flush_interval=config.get("TELEMETRY_FLUSH_INTERVAL", 5),
+    max_samples=config.get("TELEMETRY_MAX_SAMPLES", 1000)
+)
+
+def spool_stats():
+    return {"pending": len(spool), "dropped": spool.dropped}
+
+# collector name -> sampling function; enabled (with an interval) through COLLECTORS
+BUILTIN_COLLECTORS = {
+    "system.load": load_average,
+    "agent.process": process_stats,
+    "agent.spool": spool_stats,
+}
+
+for name, interval in config.get("COLLECTORS", {}).items():
+    if name in BUILTIN_COLLECTORS:
+        telemetry.register(name, BUILTIN_COLLECTORS[name], interval)
+    else:
+        logger.warning(f"client: unknown collector '{name}' in config")
+
+# The open websocket, its negotiated protocol and send_loop's queue (None while disconnected)
+link = {"ws": None, "protocol": None, "outbox": None}
 
 # Shutdown signal handler
-def handle_shutdown(signum, frame):
+def handle_shutdown():
     """
     Signal handler to gracefully shut down the agent process.
     """
-    global running
     sys.stdout.write("\n")        # move to next line
     sys.stdout.write("\033[F")    # move cursor up one line
     sys.stdout.write("\033[K")    # clear the line
     logger.info("client: received shutdown signal, shutting down gracefully...")
-    running = False
+    shutdown.set()
 
-signal.signal(signal.SIGINT, handle_shutdown)
-signal.signal(signal.SIGTERM, handle_shutdown)
+def install_signal_handlers(loop):
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, handle_shutdown)
+        except NotImplementedError:
+            # Windows has no loop signal handlers; hop onto the loop from the plain handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(handle_shutdown))
 
 async def interruptible_sleep(duration):
     """
-    Custom sleep that checks for shutdown signal and interrupts if necessary.
+    Sleep for `duration` seconds, returning as soon as shutdown is requested.
     """
-    step = 1  # Sleep in 1-second intervals
-    for _ in range(duration):
-        if not running:
-            break  # Stop sleeping if shutdown signal received
-        await asyncio.sleep(step)
+    try:
+        await asyncio.wait_for(shutdown.wait(), duration)
+    except asyncio.TimeoutError:
+        pass
 
-async def obtain_jwt(system_uuid, password, max_retries=5, backoff_factor=2, max_backoff_time=120):
-    url = f"http://{config['SERVER_IP']}:{config['SERVER_PORT']}/auth/get_token"
+async def obtain_jwt(http, system_uuid, password, max_retries=5, backoff_factor=2, max_backoff_time=120, org=None):
+    """
+    Fetch a JWT over the agent's long-lived HTTP client (`http`), so retries and
+    later re-authentications reuse the same keep-alive connection.
+    Returns the token response: access_token, expires_in and, on a sharded
+    cluster, the ws_endpoint of the node that owns this agent.
+    """
+    url = "/auth/get_token"
     retry_attempts = 0
+    wait_time = backoff_factor
 
     while retry_attempts < max_retries:
-        if not running:
+        if shutdown.is_set():
             logger.info("client: shutdown triggered during auth. routine...")
             return None
 
         try:
             logger.debug(f"client: sending request to obtain JWT at {url}")
-            payload = {"system_uuid": system_uuid, "password": password}
+            payload = {"system_uuid": system_uuid, "password": password, "org": org}
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload)
+            response = await http.post(url, json=payload)
 
             # logger.debug(f"client: raw response: {response.status_code} - {response.text}")
             response.raise_for_status()
 
             token_data = response.json()
             # logger.debug(f"client: parsed token data: {token_data}")
-            token = token_data["data"]["access_token"]
+            token_response = token_data["data"]
+            if "access_token" not in token_response:
+                raise KeyError("access_token")
             logger.info("client: successfully obtained JWT.")
-            return token
+            return token_response
 
         except httpx.HTTPError as e:
             logger.exception("client: HTTP error occurred during token acquisition... is the server up?", exc_info=False)
@@ -72,16 +139,216 @@ async def obtain_jwt(system_uuid, password, max_retries=5, backoff_factor=2, max
             logger.exception("client: unexpected error during token acquisition.")
 
         retry_attempts += 1
-        wait_time = min(backoff_factor ** retry_attempts, max_backoff_time)
-        logger.info(f"client: retrying auth. in {wait_time} seconds...")
+        wait_time = decorrelated_jitter(wait_time, backoff_factor, max_backoff_time)
+        logger.info(f"client: retrying auth. in {wait_time:.1f} seconds...")
         await interruptible_sleep(wait_time)
 
     logger.error("client: failed to authenticate despite multiple attempts.")
     return None
 
+def token_is_fresh(token_state, margin):
+    """
+    True while the held token is still usable for (re)connecting.
+    """
+    return bool(token_state["token"]) and token_state["exp"] - margin > time.time()
+
+def handle_token(record, token_state):
+    payload = record.get("payload") or {}
+    token_state["token"] = payload["access_token"]
+    token_state["exp"] = time.time() + payload.get("expires_in", 0)
+    logger.debug("client: access token refreshed over ws.")
+
+    endpoint = payload.get("ws_endpoint")
+    if endpoint and endpoint != token_state.get("endpoint"):
+        # the cluster moved this agent's shard; reconnect to its new node with the fresh token
+        token_state["endpoint"] = endpoint
+        logger.info(f"client: shard moved to {endpoint}, reconnecting.")
+        if link["ws"] is not None:
+            asyncio.create_task(link["ws"].close(code=1000, reason="shard moved"))
+
+def handle_file_request(record, token_state):
+    path = (record.get("payload") or {}).get("path")
+    if path and uploader.request(path):
+        logger.info(f"client: server requested upload of '{path}'")
+
+def action_collect(collector):
+    if collector not in BUILTIN_COLLECTORS:
+        raise ValueError(f"unknown collector '{collector}'")
+    return BUILTIN_COLLECTORS[collector]()
+
+def action_upload(path):
+    if not uploader.request(path):
+        raise PermissionError(f"'{path}' is outside UPLOAD_DIRS")
+    return {"queued": path}
+
+# action name -> callable(**params) (sync or async); invoked through action.request records
+ACTIONS = {
+    "ping": lambda: {"ts": time.time()},
+    "collect": action_collect,
+    "upload": action_upload,
+}
+
+action_tasks = set()  # running actions (kept referenced until they finish)
+
+async def run_action(request):
+    """
+    Run one server-issued action and answer with an action.result carrying the request's id.
+    """
+    name = request.get("action")
+    reply = {"id": request.get("id"), "node": request.get("node")}
+    try:
+        fn = ACTIONS.get(name)
+        if fn is None:
+            raise ValueError(f"unknown action '{name}'")
+        result = fn(**(request.get("params") or {}))
+        if asyncio.iscoroutine(result):
+            result = await asyncio.wait_for(result, request.get("timeout"))
+        reply.update(ok=True, result=result)
+    except Exception as e:
+        logger.warning(f"client: action '{name}' failed: {e}")
+        reply.update(ok=False, error=str(e) or type(e).__name__)
+
+    ws = link["ws"]
+    if ws is None:
+        return  # disconnected meanwhile; the server has timed the task out
+    try:
+        await ws.send(pack_records([{"type": "action.result", "payload": reply}], link["protocol"]))
+    except ConnectionClosed:
+        pass
+
+async def send_pong():
+    ws = link["ws"]
+    if ws is None:
+        return
+    try:
+        await ws.send(pack_records([{"type": "heartbeat.pong"}], link["protocol"]))
+    except ConnectionClosed:
+        pass
+
+def handle_ping(record, token_state):
+    # the server pings agents that have been quiet for a while and drops the ones that don't answer
+    asyncio.create_task(send_pong())
+
+def handle_action(record, token_state):
+    task = asyncio.create_task(run_action(record.get("payload") or {}))
+    action_tasks.add(task)
+    task.add_done_callback(action_tasks.discard)
+
+# server-pushed record type -> handler(record, token_state)
+RECORD_HANDLERS = {
+    "auth.token": handle_token,
+    "file.ack": lambda record, _: uploader.on_ack(record),
+    "file.done": lambda record, _: uploader.on_done(record),
+    "file.request": handle_file_request,
+    "action.request": handle_action,
+    "heartbeat.ping": handle_ping,
+}
+
+async def receive_loop(ws, protocol, token_state):
+    """
+    Handle messages pushed by the server over the open websocket.
+    """
+    try:
+        async for message in ws:
+            for record in unpack_message(message, protocol):
+                handler = RECORD_HANDLERS.get(record.get("type"))
+                if handler:
+                    handler(record, token_state)
+                else:
+                    logger.debug(f"client: received '{record.get('type')}' from server")
+    except ConnectionClosed:
+        pass
+
+async def upload_loop(ws, protocol):
+    """
+    Ship requested files over the open websocket, resuming interrupted uploads first.
+    """
+    async def send(records):
+        await ws.send(pack_records(records, protocol))
+
+    try:
+        while True:
+            await uploader.run(send, protocol)
+            # sleep until a file is requested; a stalled upload is retried after a minute
+            await uploader.wait_for_work(60 if uploader.pending else None)
+    except ConnectionClosed:
+        pass
+
+def spool_records(records):
+    for record in records:
+        spool.append(record)
+
+async def send_telemetry(records):
+    """
+    Queue telemetry records for send_loop, or spool them while disconnected.
+    While a backlog is still draining new records queue behind it, so the server sees them in order.
+    """
+    if link["outbox"] is not None and not len(spool):
+        link["outbox"].put_nowait(records)
+    else:
+        spool_records(records)
+
+async def send_loop(ws, protocol, outbox):
+    """
+    Write queued telemetry to the open websocket, coalescing whatever queued up
+    while the previous frame was being sent into one frame.
+    Records that didn't make it onto the socket go to the spool.
+    """
+    while True:
+        records = list(await outbox.get())
+        while not outbox.empty():
+            records.extend(outbox.get_nowait())
+        try:
+            await ws.send(pack_records(records, protocol, compress=True))
+        except ConnectionClosed:
+            spool_records(records)
+            return
+        except asyncio.CancelledError:
+            spool_records(records)
+            raise
+
+async def drain_loop(ws, protocol, batch_size, rate, jitter):
+    """
+    Replay the spool over the open websocket in large batches, at most `rate` records/s.
+    The first batch waits a random 0..`jitter` seconds, so a fleet coming back from the
+    same outage doesn't replay its backlog in lockstep.
+    Returns once the spool is empty; from then on send_telemetry bypasses it.
+    """
+    if not len(spool):
+        return
+    logger.info(f"client: {len(spool)} spooled records to replay")
+    await asyncio.sleep(random.uniform(0, jitter))
+
+    try:
+        while len(spool):
+            records, cursor = spool.peek(batch_size)
+            await ws.send(pack_records(records, protocol, compress=True))
+            spool.commit(cursor)
+            await asyncio.sleep(len(records) / rate)
+        logger.info("client: spool drained.")
+    except ConnectionClosed:
+        pass
+
+async def token_refresh_loop(ws, protocol, token_state, margin):
+    """
+    Ask for a fresh token over the open websocket shortly before the current one expires,
+    so reconnects don't need a new /auth/get_token round trip.
+    """
+    retry_interval = 10  # if the server didn't answer, ask again after this many seconds
+    try:
+        while True:
+            await asyncio.sleep(max(token_state["exp"] - margin - time.time(), retry_interval))
+            if token_state["exp"] - margin > time.time():
+                continue  # refreshed while we were sleeping
+
+            logger.debug("client: requesting token refresh over ws.")
+            await ws.send(pack_records([{"type": "auth.refresh"}], protocol))
+    except ConnectionClosed:
+        pass
+
 # main agent loop
 async def agent():
-    global config
+    global config, shutdown
     SERVER_IP = config.get("SERVER_IP")
     SERVER_PORT = config.get("SERVER_PORT")
     ORG = config.get("ORG")
@@ -89,63 +356,129 @@ async def agent():
     MAX_RETRIES = config.get("MAX_RETRIES")
     BACKOFF_FACTOR = config.get("BACKOFF_FACTOR")
     MAX_BACKOFF_TIME = config.get("MAX_BACKOFF_TIME")
+    WS_PROTOCOL = config.get("WS_PROTOCOL", PROTO_TEXT)
+    TOKEN_REFRESH_MARGIN = config.get("TOKEN_REFRESH_MARGIN", 60)
+    SPOOL_DRAIN_BATCH = config.get("SPOOL_DRAIN_BATCH", 500)
+    SPOOL_DRAIN_RATE = config.get("SPOOL_DRAIN_RATE", 2000)
+    SPOOL_DRAIN_JITTER = config.get("SPOOL_DRAIN_JITTER", 30)
+    PING_INTERVAL = config.get("PING_INTERVAL", 20)
+    PING_TIMEOUT = config.get("PING_TIMEOUT", 10)
 
     if not SERVER_IP:
         logger.error("client: missing [red]SERVER_IP[/] in config!")
         return
 
-    system_uuid = get_system_uuid()
+    shutdown = asyncio.Event()
+    install_signal_handlers(asyncio.get_running_loop())
+
+    # collectors keep sampling through outages; send_telemetry spools while disconnected
+    collecting = asyncio.create_task(telemetry.run(send_telemetry, shutdown))
+
+    # the UUID is resolved once, then read back from the cache file on every restart;
+    # the network stack is imported alongside it, both off the event loop
+    system_uuid, _ = await asyncio.gather(
+        asyncio.to_thread(get_system_uuid, os.path.join(BIN_DIR, config.get("UUID_CACHE_FILE", ".system_uuid"))),
+        asyncio.to_thread(load_network_modules)
+    )
     if not system_uuid:
         logger.error("client: [red]system UUID[/] not found!")
+        shutdown.set()
+        await collecting
         return
-    
-    retry_attempts = 0
+
+    wait_time = BACKOFF_FACTOR  # reconnect delay, grown with decorrelated jitter while the server is down
     rabbit_connection = None
+    # latest token; refreshed over ws while connected. `endpoint` is the ws base of the
+    # node that owns this agent on a sharded cluster (None: the configured server)
+    token_state = {"token": None, "exp": 0, "endpoint": None}
+
+    # one keep-alive HTTP client for the life of the agent
+    http = httpx.AsyncClient(base_url=f"http://{SERVER_IP}:{SERVER_PORT}", timeout=10)
 
     logger.debug("client: agent loop initializing")
-    while running:
+    while not shutdown.is_set():
         try:
-            token = await obtain_jwt(system_uuid, PASSWORD)
-            if not token:
-                logger.error("client: failed to authenticate.")
-                return
+            if token_is_fresh(token_state, TOKEN_REFRESH_MARGIN):
+                token = token_state["token"]  # still valid (e.g. refreshed over the previous connection)
+            else:
+                token_response = await obtain_jwt(
+                    http, system_uuid, PASSWORD, MAX_RETRIES, BACKOFF_FACTOR, MAX_BACKOFF_TIME, org=ORG
+                )
+                if not token_response:
+                    logger.error("client: failed to authenticate.")
+                    break
+                token = token_response["access_token"]
+                token_state["token"] = token
+                token_state["exp"] = get_token_expiry(token) or 0
+                token_state["endpoint"] = token_response.get("ws_endpoint")
             params = urlencode({"token": token, "org": ORG})
-            ws_url = f"ws://{SERVER_IP}:{SERVER_PORT}/auth/ws/{system_uuid}?{params}"
+            ws_base = token_state["endpoint"] or f"ws://{SERVER_IP}:{SERVER_PORT}"
+            ws_url = f"{ws_base}/auth/ws/{system_uuid}?{params}"
             # logger.debug(f"client: formatted ws url: {ws_url}")
 
-            # intializing ws connection
-            async with websockets.connect(ws_url) as ws:
-                logger.info("client: websocket connected.")
+            # binary framing is negotiated through the ws subprotocol; older servers fall back to text
+            subprotocols = [BINARY_SUBPROTOCOL] if WS_PROTOCOL == PROTO_BINARY else None
+
+            # intializing ws connection; the websockets keepalive pings every PING_INTERVAL
+            # seconds and closes the socket if no pong arrives within PING_TIMEOUT
+            async with websockets.connect(
+                ws_url, subprotocols=subprotocols, ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT
+            ) as ws:
+                protocol = PROTO_BINARY if ws.subprotocol == BINARY_SUBPROTOCOL else PROTO_TEXT
+                logger.info(f"client: websocket connected ({protocol}).")
+                outbox = asyncio.Queue()
+                link.update(ws=ws, protocol=protocol, outbox=outbox)
+                receiver = asyncio.create_task(receive_loop(ws, protocol, token_state))
+                sender = asyncio.create_task(send_loop(ws, protocol, outbox))
+                stop = asyncio.create_task(shutdown.wait())
+                helpers = [
+                    asyncio.create_task(token_refresh_loop(ws, protocol, token_state, TOKEN_REFRESH_MARGIN)),
+                    asyncio.create_task(upload_loop(ws, protocol)),
+                    asyncio.create_task(drain_loop(ws, protocol, SPOOL_DRAIN_BATCH, SPOOL_DRAIN_RATE, SPOOL_DRAIN_JITTER))
+                ]
                 try:
-                    retry_attempts = 0  # Reset retry attempts after a successful connection
-                    
-                    # agent main loop
-                    while running:
-                        # You can send or receive data from the WebSocket server if needed
-                        # Example: await websocket.send("Some data")
-                        # Or some form of inbound message handling
-                        # msg = await ws.recv()
-                        # logger.debug(f"Received message: {msg}")
-                        if ws.state != websockets.protocol.State.OPEN:
-                            logger.warning("client: webSocket connection closed.")
-                            break
-                        
-                        # Sleep for 5 seconds before the next operation
-                        await interruptible_sleep(5)
+                    wait_time = BACKOFF_FACTOR  # Reset the backoff after a successful connection
+
+                    # agent main loop: the receiver returns the moment the socket closes (server
+                    # gone, or a keepalive ping went unanswered), so there's nothing to poll
+                    await asyncio.wait([receiver, sender, stop], return_when=asyncio.FIRST_COMPLETED)
+                    if not stop.done():
+                        logger.warning(f"client: webSocket connection closed (code {ws.close_code}).")
 
                 except Exception as e:
                     logger.error(f"some error: {e}")
+                finally:
+                    link.update(ws=None, protocol=None, outbox=None)
+                    for task in (receiver, sender, stop, *helpers):
+                        task.cancel()
+                    await asyncio.gather(sender, return_exceptions=True)  # let it spool what it was holding
+                    while not outbox.empty():
+                        spool_records(outbox.get_nowait())
+
+        except InvalidStatus as e:
+            # handshake rejected (e.g. token no longer accepted); fetch a new one on the next attempt
+            logger.warning(f"client: websocket handshake rejected: {e}")
+            token_state["token"] = None
+            wait_time = decorrelated_jitter(wait_time, BACKOFF_FACTOR, MAX_BACKOFF_TIME)
+            await interruptible_sleep(wait_time)
 
         except Exception as e:
             logger.error("client: looks like the server &/ rabbit is down ☠️")
             if str(e):
                 logger.error(f"{e}")
-            retry_attempts += 1
-            wait_time = min(BACKOFF_FACTOR ** retry_attempts, MAX_BACKOFF_TIME)  # Exponential backoff, capped
-            logger.info(f"client: retrying WebSocket connection in {wait_time} seconds...")
+            if token_state["endpoint"]:
+                # the shard's node may be gone; ask the configured server for the current owner
+                token_state.update(token=None, endpoint=None)
+            wait_time = decorrelated_jitter(wait_time, BACKOFF_FACTOR, MAX_BACKOFF_TIME)  # Jittered backoff, capped
+            logger.info(f"client: retrying WebSocket connection in {wait_time:.1f} seconds...")
             await interruptible_sleep(wait_time)
 
-    if not running:
+    graceful = shutdown.is_set()
+    shutdown.set()  # also stops the collectors when the loop ended on an auth failure
+    await collecting  # last flush lands in the spool
+    await http.aclose()
+    spool.close()
+    if graceful:
         logger.info("client: graceful shutdown target reached...")
 
 if __name__ == "__main__":
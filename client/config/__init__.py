@@ -1,2 +1,2 @@
 from .sys_config import load_config
-from .rich_logger import logger
\ No newline at end of file
+from .rich_logger import logger, console_handler
\ No newline at end of file
@@ -14,46 +14,79 @@ depending on how tightly things are coupled).
 
 import re 
 import logging
-from rich.console import Console
-from rich.theme import Theme
-from rich.logging import RichHandler
+import threading
 
 from client.config import load_config
 
-# Define a custom vivid theme
-custom_theme = Theme({
-    "logging.level.debug": "cyan",
-    "logging.level.info": "bold bright_white",
-    "logging.level.info": "bold bright_green",
-    "logging.level.warning": "bold yellow",
-    "logging.level.error": "bold red",
-    "logging.level.critical": "bold reverse red",
-})
+def _build_rich_handler() -> logging.Handler:
+    # rich costs ~30 ms of import time; it's only loaded here, see DeferredRichHandler
+    from rich.console import Console
+    from rich.theme import Theme
+    from rich.logging import RichHandler
 
-# Create a console using the custom theme
-custom_console = Console(theme=custom_theme)
+    # Define a custom vivid theme
+    custom_theme = Theme({
+        "logging.level.debug": "cyan",
+        "logging.level.info": "bold bright_white",
+        "logging.level.info": "bold bright_green",
+        "logging.level.warning": "bold yellow",
+        "logging.level.error": "bold red",
+        "logging.level.critical": "bold reverse red",
+    })
+
+    # Create a console using the custom theme
+    custom_console = Console(theme=custom_theme)
+
+    class PurplePrefixRichHandler(RichHandler):
+        def emit(self, record: logging.LogRecord) -> None:
+            # Save original message
+            original_msg = record.getMessage()
+
+            # Try to extract a prefix (e.g., "rmq_manager_conn: some message")
+            match = re.match(r"^(.*?):\s(.*)", original_msg)
+            if match:
+                prefix, rest = match.groups()
+                # Pad prefix to a fixed width (e.g., 20 characters)
+                padded_prefix = f"{prefix:<20}"
+                # Rewrite the message to include colored prefix
+                record.msg = f"[purple]{padded_prefix}[/purple]: {rest}"
+                # record.args = None  # Avoid issues with %-formatting
+                record.args = () # fixes websocket conn
+            else:
+                # Keep it unchanged if no prefix found
+                record.msg = original_msg
+                record.args = ()  # <- just in case this branch gets used too
+
+            super().emit(record)
+
+    return PurplePrefixRichHandler(
+        console=custom_console,
+        markup=True,
+        rich_tracebacks=True,
+        show_path=False
+    )
+
+class DeferredRichHandler(logging.Handler):
+    """
+    Stands in for the rich console handler until the first record is logged (or
+    `load()` is called, which the agent does off the event loop at startup), so
+    importing the logger doesn't import rich.
+    """
+    def __init__(self):
+        super().__init__()
+        self._handler = None
+        self._loading = threading.Lock()
+
+    def load(self) -> logging.Handler:
+        with self._loading:
+            if self._handler is None:
+                self._handler = _build_rich_handler()
+        return self._handler
 
-class PurplePrefixRichHandler(RichHandler):
     def emit(self, record: logging.LogRecord) -> None:
-        # Save original message
-        original_msg = record.getMessage()
-
-        # Try to extract a prefix (e.g., "rmq_manager_conn: some message")
-        match = re.match(r"^(.*?):\s(.*)", original_msg)
-        if match:
-            prefix, rest = match.groups()
-            # Pad prefix to a fixed width (e.g., 20 characters)
-            padded_prefix = f"{prefix:<20}"
-            # Rewrite the message to include colored prefix
-            record.msg = f"[purple]{padded_prefix}[/purple]: {rest}"
-            # record.args = None  # Avoid issues with %-formatting
-            record.args = () # fixes websocket conn
-        else:
-            # Keep it unchanged if no prefix found
-            record.msg = original_msg
-            record.args = ()  # <- just in case this branch gets used too
-
-        super().emit(record)
+        (self._handler or self.load()).handle(record)
+
+console_handler = DeferredRichHandler()
 
 # Get the log level from the config and convert it to a valid logging level
 log_level = load_config().get("LOG_LEVEL", "INFO").upper()
@@ -72,12 +105,7 @@ logging.basicConfig(
     level=log_level_map.get(log_level, logging.INFO),
     format="%(message)s",  # No timestamp or extra fields
     datefmt="[%Y-%m-%d %H:%M:%S]",
-    handlers=[PurplePrefixRichHandler(
-        console=custom_console,
-        markup=True,
-        rich_tracebacks=True,
-        show_path=False
-    )]
+    handlers=[console_handler]
 )
 
 # Silence AMQP & Mongo related noise aggressively before anything else
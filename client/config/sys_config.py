@@ -1,6 +1,8 @@
 import os
+import re
 import sys
-import commentjson
+import json
+import functools
 
 # Get the directory where the executable is located
 BIN_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
@@ -8,13 +10,25 @@ BIN_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
 # Construct the full path to the config file
 CONFIG_FILE_PATH = os.path.join(BIN_DIR, "config.jsonc")
 
+# a string literal (kept) or a // / /* */ comment (dropped)
+_JSONC_TOKEN = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+def _strip_comments(text):
+    return _JSONC_TOKEN.sub(lambda m: m.group(1) or "", text)
+
+@functools.lru_cache(maxsize=None)
 def load_config():
     """
-    Load the configuration from the JSONC file.
+    Load the configuration from the JSONC file (parsed once per process).
     """
     if not os.path.exists(CONFIG_FILE_PATH):
         raise FileNotFoundError(f"Configuration file not found: {CONFIG_FILE_PATH}")
     
     with open(CONFIG_FILE_PATH, 'r') as f:
-        config = commentjson.load(f)
-    return config
\ No newline at end of file
+        text = f.read()
+    try:
+        # stdlib fast path; commentjson (lark grammar) alone takes longer to import than the agent takes to start
+        return json.loads(_strip_comments(text))
+    except ValueError:
+        import commentjson
+        return commentjson.loads(text)
@@ -1 +1,21 @@
-from .uuid_info import get_system_uuid
\ No newline at end of file
+from .uuid_info import get_system_uuid
+from .framing import encode_frame, decode_frame, pack_records, unpack_message, BINARY_SUBPROTOCOL, PROTO_BINARY, PROTO_TEXT
+from .token_info import get_token_expiry
+from .backoff import decorrelated_jitter
+from .collectors import load_average, process_stats
+
+# these log through client.config, which loads config.jsonc on import; load them on
+# first use so config-free users of client.utils (bench/swarm) don't need an agent config
+_LAZY = {
+    "FileUploader": ".filestream",
+    "TelemetrySpool": ".spool",
+    "TelemetryPipeline": ".telemetry",
+    "encode_series": ".telemetry",
+    "SERIES_RECORD": ".telemetry",
+}
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
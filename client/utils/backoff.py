@@ -0,0 +1,9 @@
+import random
+
+def decorrelated_jitter(previous, base, cap):
+    """
+    Next retry delay using "decorrelated jitter": a random pick between `base` and
+    three times the previous delay, capped at `cap`. Agents that dropped together
+    drift apart after a couple of attempts instead of reconnecting in lockstep.
+    """
+    return min(cap, random.uniform(base, max(previous, base) * 3))
@@ -0,0 +1,28 @@
+"""
+Built-in telemetry collectors (stdlib only). Each returns a flat dict of values,
+or None when the platform doesn't provide the data.
+"""
+
+import os
+import sys
+import time
+
+def load_average():
+    if not hasattr(os, "getloadavg"):
+        return None  # Windows
+    one, five, fifteen = os.getloadavg()
+    return {"1m": one, "5m": five, "15m": fifteen}
+
+def process_stats():
+    """Resource usage of the agent process itself."""
+    stats = {"cpu_time": time.process_time()}
+    if sys.platform != "win32":
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        stats.update({
+            "max_rss": usage.ru_maxrss,
+            "minor_faults": usage.ru_minflt,
+            "major_faults": usage.ru_majflt,
+            "ctx_switches": usage.ru_nvcsw + usage.ru_nivcsw
+        })
+    return stats
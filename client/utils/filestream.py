@@ -0,0 +1,223 @@
+"""
+Chunked, resumable file uploads to the server over the agent's websocket
+(see server/comms/filestream.py for the protocol).
+
+- At most `window` chunks are un-acknowledged at any time, so uploads interleave
+  with telemetry on the same socket instead of flooding it.
+- The upload id is derived from the file's path, size and mtime; after a reconnect
+  `file.begin` returns the server's committed offset and the upload resumes there.
+- A file that changes while it's being shipped (rotated, truncated, appended to)
+  is restarted from a fresh stat, up to `max_restarts` times; an upload the
+  server keeps rewinding is given up after `max_rewinds`. Either way the file is
+  dropped and the rest of the queue goes on.
+"""
+
+import os
+import zlib
+import base64
+import asyncio
+import hashlib
+
+from client.config import logger
+from client.utils.framing import PROTO_BINARY
+
+def _upload_id(path, stat):
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+class FileChanged(Exception):
+    """The file no longer matches the stat its upload was started from."""
+
+def _check_unchanged(f, stat):
+    now = os.fstat(f.fileno())
+    if (now.st_size, now.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        raise FileChanged(f.name)
+
+def _sha256(path, stat):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+        _check_unchanged(f, stat)
+    return digest.hexdigest()
+
+def _read_at(path, offset, size, stat):
+    with open(path, "rb") as f:
+        _check_unchanged(f, stat)
+        f.seek(offset)
+        data = f.read(size)
+    if len(data) != size:
+        raise FileChanged(path)
+    return data
+
+class _Upload:
+    def __init__(self, path, upload_id, size, sha256):
+        self.path = path
+        self.upload_id = upload_id
+        self.size = size
+        self.sha256 = sha256
+        self.acked = -1  # committed offset reported by the server (-1 = no answer yet)
+        self.error = None
+        self.done = None
+        self.changed = asyncio.Event()
+
+class FileUploader:
+    def __init__(self, chunk_size=256 * 1024, window=4, allowed_dirs=None, max_restarts=3, max_rewinds=8):
+        self.chunk_size = chunk_size
+        self.window = window
+        self.max_restarts = max_restarts  # fresh starts of a file that changed mid-upload
+        self.max_rewinds = max_rewinds  # server-requested rewinds (crc, incomplete, sha256) per upload
+        self.allowed_dirs = [os.path.realpath(d) for d in (allowed_dirs or [])]
+        self.uploads = {}  # upload_id -> _Upload
+        self.pending = []  # paths still to upload (survive reconnects)
+        self._work = None  # set when a path is requested; created on first wait (the uploader outlives event loops)
+
+    def is_allowed(self, path):
+        real = os.path.realpath(path)
+        return any(os.path.commonpath([real, d]) == d for d in self.allowed_dirs)
+
+    def request(self, path):
+        """Queue a file for upload; it's shipped on the current or next connection."""
+        if not self.is_allowed(path):
+            logger.warning(f"filestream: refusing to upload '{path}' (outside UPLOAD_DIRS)")
+            return False
+        if path not in self.pending:
+            self.pending.append(path)
+        if self._work is not None:
+            self._work.set()
+        return True
+
+    async def wait_for_work(self, timeout=None):
+        """Block until another file is requested (or `timeout` seconds pass)."""
+        if self._work is None:
+            self._work = asyncio.Event()
+        self._work.clear()
+        try:
+            await asyncio.wait_for(self._work.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # --- inbound records ---
+
+    def on_ack(self, record):
+        payload = record.get("payload") or {}
+        upload = self.uploads.get(payload.get("upload_id"))
+        if upload:
+            upload.acked = payload.get("offset", 0)
+            upload.error = payload.get("error")
+            upload.changed.set()
+
+    def on_done(self, record):
+        payload = record.get("payload") or {}
+        upload = self.uploads.get(payload.get("upload_id"))
+        if upload:
+            upload.done = payload
+            upload.changed.set()
+
+    # --- outbound ---
+
+    async def run(self, send, protocol):
+        """Ship every pending file over this connection; returns when done or the socket dies."""
+        while self.pending:
+            path = self.pending[0]
+            if await self.upload(send, protocol, path):
+                self.pending.pop(0)
+            else:
+                return
+
+    async def upload(self, send, protocol, path):
+        """
+        Ship one file. Returns False if the server stopped answering (the file stays
+        queued for the next connection), True once it's done with: uploaded,
+        refused, or skipped because it couldn't be read or kept changing.
+        """
+        for attempt in range(self.max_restarts + 1):
+            try:
+                return await self._upload(send, protocol, path)
+            except FileChanged:
+                self._forget(path)
+                logger.warning(f"filestream: '{path}' changed during upload (attempt {attempt + 1}/{self.max_restarts + 1})")
+            except OSError as e:
+                self._forget(path)
+                logger.error(f"filestream: cannot upload '{path}', skipping it: {e}")
+                return True
+        logger.error(f"filestream: giving up on '{path}', it keeps changing")
+        return True
+
+    def _forget(self, path):
+        for upload_id in [k for k, upload in self.uploads.items() if upload.path == path]:
+            del self.uploads[upload_id]
+
+    async def _upload(self, send, protocol, path):
+        stat = os.stat(path)
+        upload_id = _upload_id(path, stat)
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            sha256 = await asyncio.to_thread(_sha256, path, stat)
+            upload = self.uploads[upload_id] = _Upload(path, upload_id, stat.st_size, sha256)
+        upload.acked, upload.error, upload.done = -1, None, None
+
+        begin = {"upload_id": upload_id, "name": os.path.basename(path), "size": upload.size, "sha256": upload.sha256}
+        await send([{"type": "file.begin", "payload": begin}])
+        if not await self._wait(upload, lambda: upload.acked >= 0 or upload.done):
+            return False
+        if upload.done and not upload.done.get("ok"):
+            logger.error(f"filestream: server refused '{path}': {upload.done.get('error')}")
+            self.uploads.pop(upload_id, None)
+            return True  # nothing more to do with this one
+
+        logger.info(f"filestream: uploading '{path}' from offset {upload.acked}/{upload.size}")
+        offset = upload.acked
+        rewinds = 0
+        while not upload.done:
+            if upload.error:
+                # the server rejected something (crc, incomplete, sha256); go back to what it committed
+                rewinds += 1
+                if rewinds > self.max_rewinds:
+                    logger.error(f"filestream: giving up on '{path}' after {self.max_rewinds} rewinds (last: {upload.error})")
+                    self.uploads.pop(upload_id, None)
+                    return True
+                offset, upload.error = upload.acked, None
+
+            if offset < upload.size:
+                # keep at most `window` chunks un-acked
+                if offset - upload.acked >= self.window * self.chunk_size:
+                    if not await self._wait(upload, lambda: offset - upload.acked < self.window * self.chunk_size or upload.error or upload.done):
+                        return False
+                    continue
+
+                size = min(self.chunk_size, upload.size - offset)
+                data = await asyncio.to_thread(_read_at, path, offset, size, stat)
+                chunk = {
+                    "upload_id": upload_id,
+                    "offset": offset,
+                    "data": data if protocol == PROTO_BINARY else base64.b64encode(data).decode(),
+                    "crc32": zlib.crc32(data)
+                }
+                await send([{"type": "file.chunk", "payload": chunk}])
+                offset += len(data)
+                continue
+
+            if not await self._wait(upload, lambda: upload.acked >= upload.size or upload.error or upload.done):
+                return False
+            if upload.error or upload.done:
+                continue
+
+            await send([{"type": "file.end", "payload": {"upload_id": upload_id}}])
+            if not await self._wait(upload, lambda: upload.done or upload.error):
+                return False
+
+        ok = upload.done.get("ok")
+        self.uploads.pop(upload_id, None)
+        logger.info(f"filestream: upload of '{path}' {'completed' if ok else 'failed'}")
+        return True
+
+    async def _wait(self, upload, predicate, timeout=60):
+        while not predicate():
+            upload.changed.clear()
+            try:
+                await asyncio.wait_for(upload.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"filestream: no answer from server for upload {upload.upload_id}")
+                return False
+        return True
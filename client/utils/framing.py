@@ -0,0 +1,72 @@
+"""
+Client side of the server's binary websocket framing (see server/comms/framing.py).
+
+    [flags: u8][len: u32 BE][record][len: u32 BE][record]...
+"""
+
+import itertools
+import json
+import struct
+import time
+import zlib
+import msgpack
+
+PROTO_TEXT = "text"
+PROTO_BINARY = "binary"
+
+BINARY_SUBPROTOCOL = "trex.binary.v1"
+
+FLAG_ZLIB = 0x01
+
+_LEN = struct.Struct(">I")
+
+_seq = itertools.count(1)  # envelope sequence numbers, per agent process
+
+def encode_frame(records, compress=False):
+    """Pack many records into one binary frame."""
+    parts = []
+    for record in records:
+        body = msgpack.packb(record, use_bin_type=True)
+        parts.append(_LEN.pack(len(body)))
+        parts.append(body)
+
+    body = b"".join(parts)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+
+    return bytes((flags,)) + body
+
+def decode_frame(frame):
+    """Unpack a binary frame into its records."""
+    flags = frame[0]
+    body = memoryview(frame)[1:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+
+    records = []
+    offset = 0
+    while offset < len(body):
+        (length,) = _LEN.unpack_from(body, offset)
+        offset += _LEN.size
+        records.append(msgpack.unpackb(body[offset:offset + length], raw=False))
+        offset += length
+    return records
+
+def pack_records(records, protocol, compress=False):
+    """Encode outbound records for the negotiated protocol (bytes for binary, str for text)."""
+    now = time.time()
+    for record in records:
+        record.setdefault("seq", next(_seq))
+        record.setdefault("ts", now)
+    if protocol == PROTO_BINARY:
+        return encode_frame(records, compress)
+    return json.dumps(records[0] if len(records) == 1 else records)
+
+def unpack_message(message, protocol):
+    """Decode an inbound ws message into records."""
+    if isinstance(message, bytes):
+        return decode_frame(message)
+    decoded = json.loads(message)
+    return decoded if isinstance(decoded, list) else [decoded]
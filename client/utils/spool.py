@@ -0,0 +1,232 @@
+"""
+Bounded, append-only on-disk spool for telemetry produced while the server is
+unreachable.
+
+The spool is a directory of fixed-size, memory-mapped segment files:
+
+    <seq:012d>.seg    [len: u32 BE][crc32: u32 BE][msgpack record]...[zeros]
+
+- Appends are a memcpy into the tail segment's mapping; the page cache writes it
+  back, so a crashed agent loses nothing that was appended before the crash.
+- The body is written before its header, so a torn write reads as an empty or
+  corrupt header and the segment is cut there when it is reopened.
+- At most `max_bytes` of segments are kept; when a new segment would exceed the
+  cap the oldest one is dropped (oldest-first eviction).
+- Records are read back with `peek()` and only forgotten on `commit()`, which
+  also persists the read cursor, so a restart resumes draining where it stopped.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+import msgpack
+
+from client.config import logger
+
+_HEADER = struct.Struct(">II")   # record length, crc32
+_CURSOR = struct.Struct(">QI")   # segment seq, offset
+
+CURSOR_FILE = "cursor"
+SEGMENT_SUFFIX = ".seg"
+
+class _Segment:
+    def __init__(self, directory, seq, size):
+        self.seq = seq
+        self.path = os.path.join(directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+        self.size = size
+        self.end = 0     # where the next record goes
+        self.count = 0   # records in the segment
+        self.file = None
+        self.mm = None
+
+    def open(self):
+        if self.mm is None:
+            self.file = open(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+            if os.fstat(self.file.fileno()).st_size < self.size:
+                self.file.truncate(self.size)
+            self.mm = mmap.mmap(self.file.fileno(), self.size)
+        return self
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
+            self.mm = self.file = None
+
+    def walk(self, offset=0):
+        """Yield (offset, body end) of every intact record from `offset` on."""
+        mm = self.mm
+        while offset + _HEADER.size <= self.size:
+            length, crc = _HEADER.unpack_from(mm, offset)
+            start = offset + _HEADER.size
+            if length == 0 or start + length > self.size or zlib.crc32(mm[start:start + length]) != crc:
+                return
+            yield offset, start + length
+            offset = start + length
+
+    def recover(self):
+        """Find the end of the intact records and wipe whatever a torn write left behind."""
+        self.end, self.count = 0, 0
+        for _, end in self.walk():
+            self.end = end
+            self.count += 1
+        if self.end < self.size:
+            self.mm[self.end:] = bytes(self.size - self.end)
+
+    def append(self, body):
+        start = self.end + _HEADER.size
+        if start + len(body) > self.size:
+            return False
+        self.mm[start:start + len(body)] = body
+        _HEADER.pack_into(self.mm, self.end, len(body), zlib.crc32(body))
+        self.end = start + len(body)
+        self.count += 1
+        return True
+
+class TelemetrySpool:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_size=4 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max(max_bytes // segment_size, 2)  # one being read, one being written
+        self.segments = []   # oldest first; only the head (read) and tail (write) stay mapped
+        self.next_seq = 0
+        self.read_offset = 0
+        self.pending = 0     # records not yet committed
+        self.dropped = 0     # records lost to eviction
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self):
+        return self.pending
+
+    # --- startup ---
+
+    def _load(self):
+        seqs = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for seq in seqs:
+            segment = _Segment(self.directory, seq, self.segment_size)
+            segment.size = os.path.getsize(segment.path) or self.segment_size  # may predate a SPOOL_SEGMENT_SIZE change
+            segment.open().recover()
+            segment.close()
+            self.segments.append(segment)
+            self.pending += segment.count
+
+        cursor_seq, cursor_offset = self._read_cursor()
+        self.next_seq = max(seqs[-1] + 1 if seqs else 0, cursor_seq)  # never reuse a seq the cursor has passed
+        while self.segments and self.segments[0].seq < cursor_seq:
+            self._drop_head()  # fully drained before the last shutdown
+        if self.segments and self.segments[0].seq == cursor_seq:
+            head = self.segments[0].open()
+            for offset, _ in head.walk():
+                if offset >= cursor_offset:
+                    break
+                self.pending -= 1
+            self.read_offset = min(cursor_offset, head.end)
+
+        if self.segments:
+            self.segments[-1].open()
+        if self.pending:
+            logger.info(f"spool: {self.pending} spooled records found in {len(self.segments)} segment(s)")
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "rb") as f:
+                return _CURSOR.unpack(f.read(_CURSOR.size))
+        except (OSError, struct.error):
+            return 0, 0
+
+    def _write_cursor(self):
+        seq = self.segments[0].seq if self.segments else self.next_seq
+        with open(os.path.join(self.directory, CURSOR_FILE), "wb") as f:
+            f.write(_CURSOR.pack(seq, self.read_offset))
+
+    # --- segments ---
+
+    def _drop_head(self):
+        segment = self.segments.pop(0)
+        segment.close()
+        try:
+            os.remove(segment.path)
+        except OSError as e:
+            logger.warning(f"spool: could not remove {segment.path}: {e}")
+        self.read_offset = 0
+        if self.segments:
+            self.segments[0].open()
+
+    def _evict_head(self):
+        head = self.segments[0].open()
+        lost = sum(1 for offset, _ in head.walk(self.read_offset))
+        self.pending -= lost
+        self.dropped += lost
+        logger.warning(f"spool: size cap reached, evicted {lost} oldest records ({self.dropped} total)")
+        self._drop_head()
+        self._write_cursor()
+
+    def _rotate(self):
+        tail = self.segments[-1] if self.segments else None
+        if tail is not None:
+            tail.mm.flush()
+            if len(self.segments) > 1:
+                tail.close()  # the head stays mapped for reading
+        if len(self.segments) >= self.max_segments:
+            self._evict_head()
+        segment = _Segment(self.directory, self.next_seq, self.segment_size).open()
+        self.next_seq += 1
+        self.segments.append(segment)
+        return segment
+
+    # --- public api ---
+
+    def append(self, record):
+        """Spool one record; returns False if it can't ever fit in a segment."""
+        body = msgpack.packb(record, use_bin_type=True)
+        if len(body) + _HEADER.size > self.segment_size:
+            logger.warning(f"spool: dropping {len(body)} byte record (larger than a segment)")
+            return False
+
+        tail = self.segments[-1] if self.segments else None
+        if tail is None or not tail.append(body):
+            self._rotate().append(body)
+        self.pending += 1
+        return True
+
+    def peek(self, max_records):
+        """
+        Read up to `max_records` of the oldest spooled records without removing them.
+        Returns (records, cursor); pass the cursor to `commit()` once they're delivered.
+        """
+        if not self.pending:
+            return [], None
+        head = self.segments[0].open()
+        if self.read_offset >= head.end and len(self.segments) > 1:
+            self._drop_head()
+            head = self.segments[0]
+
+        records = []
+        end = self.read_offset
+        for offset, end in head.walk(self.read_offset):
+            records.append(msgpack.unpackb(head.mm[offset + _HEADER.size:end], raw=False))
+            if len(records) >= max_records:
+                break
+        return records, (head.seq, end, len(records))
+
+    def commit(self, cursor):
+        """Forget the records returned by the `peek()` that produced `cursor`."""
+        if cursor is None or not self.segments or self.segments[0].seq != cursor[0]:
+            return  # evicted in the meantime
+        seq, offset, count = cursor
+        self.read_offset = offset
+        self.pending -= count
+        if self.read_offset >= self.segments[0].end and len(self.segments) > 1:
+            self._drop_head()
+        self._write_cursor()
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,122 @@
+"""
+Telemetry collectors and the pipeline that ships their samples.
+
+Collectors are plain callables (sync or async) returning a flat dict of values,
+registered with their own sampling interval. Samples are buffered and, once per
+flush window, every collector's samples become one columnar `telemetry.series`
+record (see server/comms/series.py for the decoder):
+
+    {"collector": "system.load", "keys": ["1m", "5m", "15m"], "delta": [1, 1, 1],
+     "ts": [t0_ms, +dt, +dt...], "rows": [[v...], [+dv...], ...]}
+
+- Numeric columns are delta-encoded against the previous sample in the same
+  record; counters and slowly moving gauges turn into small ints that msgpack
+  packs in a byte or two, and the whole frame is zlib-compressed on top.
+- Each record carries its own first sample in full, so records stay independent:
+  one dropped or spooled record never breaks the decoding of another.
+"""
+
+import time
+import asyncio
+
+from client.config import logger
+
+SERIES_RECORD = "telemetry.series"
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def encode_series(collector, samples):
+    """Turn [(ts, {key: value}), ...] into one columnar, delta-encoded record payload."""
+    keys = []
+    for _, values in samples:
+        keys.extend(key for key in values if key not in keys)
+    columns = [[values.get(key) for _, values in samples] for key in keys]
+    delta = [all(_is_number(value) for value in column) for column in columns]
+
+    for column, is_delta in zip(columns, delta):
+        if not is_delta:
+            continue
+        previous = column[0]
+        for n in range(1, len(column)):
+            step = column[n] - previous
+            previous += step  # track what the decoder will rebuild, so float error can't accumulate
+            column[n] = step
+
+    ts = [int(t * 1000) for t, _ in samples]
+    ts[1:] = [b - a for a, b in zip(ts, ts[1:])]
+    return {
+        "collector": collector,
+        "keys": keys,
+        "delta": [int(d) for d in delta],
+        "ts": ts,
+        "rows": [list(row) for row in zip(*columns)]
+    }
+
+class _Collector:
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.samples = []
+
+class TelemetryPipeline:
+    def __init__(self, flush_interval=5, max_samples=1000):
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples  # per collector per window; oldest dropped beyond it
+        self.collectors = {}  # name -> _Collector
+
+    def register(self, name, fn, interval):
+        """Sample `fn()` every `interval` seconds. Sync collectors run on the loop, so keep them cheap."""
+        self.collectors[name] = _Collector(name, fn, interval)
+
+    def collector(self, name, interval):
+        """Decorator form of `register`."""
+        def wrap(fn):
+            self.register(name, fn, interval)
+            return fn
+        return wrap
+
+    async def run(self, send, stop):
+        """
+        Sample every collector and hand one flush window of records to `send(records)`
+        until `stop` (an asyncio.Event) is set; whatever is buffered is flushed on the way out.
+        """
+        tasks = [asyncio.create_task(self._sample_loop(c, stop)) for c in self.collectors.values()]
+        logger.info(f"telemetry: {len(tasks)} collector(s) running, flushing every {self.flush_interval}s")
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush(send)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def flush(self, send):
+        records = []
+        for c in self.collectors.values():
+            if c.samples:
+                samples, c.samples = c.samples, []
+                records.append({"type": SERIES_RECORD, "payload": encode_series(c.name, samples)})
+        if records:
+            await send(records)
+
+    async def _sample_loop(self, c, stop):
+        while not stop.is_set():
+            try:
+                values = c.fn()
+                if asyncio.iscoroutine(values):
+                    values = await values
+                if values:
+                    c.samples.append((time.time(), values))
+                    if len(c.samples) > self.max_samples:
+                        del c.samples[0]
+            except Exception as e:
+                logger.error(f"telemetry: collector '{c.name}' failed: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), c.interval)
+            except asyncio.TimeoutError:
+                pass
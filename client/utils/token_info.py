@@ -0,0 +1,14 @@
+import json
+import base64
+
+def get_token_expiry(token):
+    """
+    Read the `exp` claim of a JWT without verifying it (the server does that).
+    Returns the expiry as a unix timestamp, or None if it can't be read.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)  # restore base64 padding
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (IndexError, ValueError, AttributeError):
+        return None
@@ -1,7 +1,18 @@
 import platform
 import subprocess
 
+# exposed by the kernel; usually root-only, in which case we fall back to dmidecode
+DMI_PRODUCT_UUID = "/sys/class/dmi/id/product_uuid"
+
 def get_system_uuid_linux():
+    try:
+        with open(DMI_PRODUCT_UUID) as f:
+            uuid = f.read().strip()
+        if uuid:
+            return uuid
+    except OSError:
+        pass
+
     try:
         result = subprocess.check_output(['sudo', 'dmidecode', '-s', 'system-uuid']).decode().strip()
         return result
@@ -44,7 +55,36 @@ def normalize_uuid(uuid):
     # return re.sub(r'[^a-z0-9]', '', uuid.lower())
     return uuid.lower()
 
-def get_system_uuid():
+def read_cached_uuid(cache_path):
+    try:
+        with open(cache_path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_cached_uuid(cache_path, uuid):
+    try:
+        with open(cache_path, "w") as f:
+            f.write(uuid)
+    except OSError as e:
+        print(f"Could not cache system UUID at {cache_path}: {e}")
+
+def get_system_uuid(cache_path=None):
+    """
+    Resolve the machine's UUID. With `cache_path`, it's resolved once and read back
+    from that file on later starts (no dmidecode / PowerShell / ioreg subprocess).
+    """
+    if cache_path:
+        cached = read_cached_uuid(cache_path)
+        if cached:
+            return cached
+
+    uuid = resolve_system_uuid()
+    if uuid and cache_path:
+        write_cached_uuid(cache_path, uuid)
+    return uuid
+
+def resolve_system_uuid():
     os_name = platform.system()
 
     if os_name == "Linux":
@@ -58,4 +98,4 @@ def get_system_uuid():
         return None
 
     # Normalize the UUID
-    return normalize_uuid(uuid)
\ No newline at end of file
+    return normalize_uuid(uuid) if uuid else None
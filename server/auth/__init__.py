@@ -1 +1,2 @@
-from .router import auth_router
\ No newline at end of file
+from .router import auth_router
+from .core import require_admin
\ No newline at end of file
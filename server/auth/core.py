@@ -9,7 +9,12 @@ Auth validation & JWT logic
 """
 
 import jwt
+import hmac
+import time
+import hashlib
 
+from collections import OrderedDict
+from fastapi import Header, HTTPException
 from server.config import CONFIG
 from datetime import datetime, timedelta, timezone
 
@@ -29,12 +34,75 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, CONFIG["JWT_KEY"], algorithm=CONFIG["ALGORITHM"])
     return encoded_jwt
 
+def issue_agent_token(system_uuid: str) -> dict:
+    """
+    Token response shared by `/auth/get_token` and the in-connection refresh.
+    """
+    expires_in = CONFIG["ACCESS_TOKEN_EXPIRE_MINUTES"] * 60
+    token = create_access_token(data={"system_uuid": system_uuid})
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_in}
+
+class VerifiedTokenCache:
+    """
+    Small TTL-bounded LRU of already verified tokens, keyed by the token's SHA-256 digest.
+    An entry never outlives the token's own `exp`.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[bytes, tuple]" = OrderedDict()  # digest -> (valid_until, payload)
+
+    def get(self, digest: bytes):
+        entry = self.entries.get(digest)
+        if entry is None:
+            return None
+
+        valid_until, payload = entry
+        if valid_until <= time.time():
+            del self.entries[digest]
+            return None
+
+        self.entries.move_to_end(digest)
+        return payload
+
+    def put(self, digest: bytes, payload: dict):
+        valid_until = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            valid_until = min(valid_until, exp)
+
+        self.entries[digest] = (valid_until, payload)
+        self.entries.move_to_end(digest)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+verified_token_cache = VerifiedTokenCache(CONFIG["TOKEN_CACHE_SIZE"], CONFIG["TOKEN_CACHE_TTL"])
+
 def verify_access_token(token: str):
+    # reconnect storms replay the same tokens; skip HMAC verification for ones we've already seen
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = verified_token_cache.get(digest)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, CONFIG["JWT_KEY"], algorithms=[CONFIG["ALGORITHM"]]) # a list is needed here for algorithms
-        return payload
     except jwt.PyJWTError:
         return None
+
+    verified_token_cache.put(digest, payload)
+    return payload
     
 def verify_agent_uuid(system_uuid, token_uuid):
-    return system_uuid == token_uuid
\ No newline at end of file
+    return system_uuid == token_uuid
+
+def require_admin(authorization: str = Header(None)):
+    """
+    Dependency for operator endpoints: `Authorization: Bearer <ADMIN_TOKEN>`.
+    With no ADMIN_TOKEN configured the endpoints stay closed.
+    """
+    if not CONFIG["ADMIN_TOKEN"]:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN is not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), CONFIG["ADMIN_TOKEN"].encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin credentials")
@@ -6,20 +6,43 @@ Auth logic
 Agent authentication endpoints
 """
 
+import time
+
+from typing import Optional
 from fastapi import APIRouter, HTTPException, WebSocket, Query
 from pydantic import BaseModel
 
 from .core import *
 from server.decorators.json_response import json_response
-from server.config import logger
-from server.comms import ws_manager_conn
+from server.config import CONFIG, logger
+from server.comms import ws_manager_conn, cluster
+from server.comms.framing import negotiate_protocol
+from server.comms.envelope import Envelope
+from server.metrics import registry
+
+TOKENS_ISSUED = registry.counter("trex_auth_tokens_issued_total", "Access tokens issued, per channel.", ["via"])
+TOKENS_DENIED = registry.counter("trex_auth_token_denials_total", "Token requests rejected for invalid credentials.")
+TOKEN_ISSUE_SECONDS = registry.histogram("trex_auth_token_issue_seconds", "Time spent signing an access token.")
 
 auth_router = APIRouter()
 
+def _issue_token(system_uuid: str, via: str, org: Optional[str] = None) -> dict:
+    started = time.perf_counter()
+    token_response = issue_agent_token(system_uuid)
+    TOKEN_ISSUE_SECONDS.observe(time.perf_counter() - started)
+    TOKENS_ISSUED.labels(via).inc()
+
+    # with sharding on, point the agent at the node that owns its shard
+    endpoint = cluster.endpoint_for(system_uuid, org)
+    if endpoint:
+        token_response["ws_endpoint"] = endpoint
+    return token_response
+
 # token request model for client auth.
 class TokenRequest(BaseModel):
     system_uuid: str
     password: str
+    org: Optional[str] = None  # lets org-affinity sharding pick the agent's node
 
 @auth_router.post("/get_token")
 @json_response(status_code=200)
@@ -31,12 +54,13 @@ async def get_token(token_request: TokenRequest):
     # Validate user credentials
     if not validate_agent_credentials(system_uuid, password):
         logger.debug(f"auth: agent with ID: {system_uuid} tried to acquire a token with invalid credentials")
+        TOKENS_DENIED.inc()
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     # Create and return the token
-    token = create_access_token(data={"system_uuid": system_uuid})
+    token_response = _issue_token(system_uuid, "http", token_request.org)
     logger.debug(f"auth: agent with ID: {system_uuid} successfully acquired an access token")
-    return {"access_token": token, "token_type": "bearer"}
+    return token_response
 
 # WebSocket endpoint
 @auth_router.websocket("/ws/{system_uuid}")
@@ -63,6 +87,25 @@ async def websocket_endpoint(
         await websocket.close(code=4002)  # Another custom close code
         return
 
+    # binary agents advertise the framed protocol as a ws subprotocol, text agents offer none
+    protocol = negotiate_protocol(websocket.scope.get("subprotocols"))
+
     logger.debug(f"auth: agent with ID: {system_uuid} attempted ws with a valid access token")
-    await ws_manager_conn.connect(websocket, system_uuid, org)
-    await ws_manager_conn.receive_data(websocket, system_uuid)
\ No newline at end of file
+    owner = cluster.owner(system_uuid, org)
+    if owner and owner != CONFIG["NODE_ID"]:
+        # stale ring on the agent's side; accept, it moves on its next token refresh
+        logger.debug(f"auth: agent with ID: {system_uuid} connected outside its shard (owner: {owner})")
+    await ws_manager_conn.connect(websocket, system_uuid, org, protocol)
+    await ws_manager_conn.receive_data(websocket, system_uuid)
+
+# In-connection token refresh
+async def refresh_token_in_connection(system_uuid: str, record: Envelope):
+    """
+    Agents ask for a fresh token over their open websocket ({"type": "auth.refresh"})
+    instead of tearing it down; the connection itself was authenticated at the handshake.
+    """
+    token_response = _issue_token(system_uuid, "ws", ws_manager_conn.org_of(system_uuid))
+    await ws_manager_conn.send_to_agent(system_uuid, {"type": "auth.token", "payload": token_response})
+    logger.debug(f"auth: agent with ID: {system_uuid} refreshed its access token over ws")
+
+ws_manager_conn.register_control_handler("auth.refresh", refresh_token_in_connection)
\ No newline at end of file
@@ -1,3 +1,12 @@
 from .rmq_manager import rmq_manager_conn
 from .ws_manager import ws_manager_conn
-from .mongo_manager import mongo_manager_conn
\ No newline at end of file
+from .envelope import envelope_codec
+from .mongo_manager import mongo_manager_conn
+from .agent_status import agent_status_writer
+from .inventory import agent_inventory
+from .registry import connection_registry
+from .cluster import cluster
+from .ingest import ingest_pipeline
+from .filestream import filestream_manager
+from .actions import action_dispatcher
+from .timeseries import telemetry_store
@@ -0,0 +1,203 @@
+# server/comms/actions.py
+
+"""
+Action dispatch
+-x-x-
+RPC-style commands for agents, fed through the RabbitMQ "action" queue.
+
+    producer -> RMQ_ACTION_QUEUE          {"system_uuid", "action", "params", "timeout"}
+                                          (correlation_id / reply_to as AMQP properties)
+    server   -> agent (ws)                action.request {id, action, params, timeout, node}
+    agent    -> server (ws)               action.result  {id, node, ok, result | error}
+    server   -> reply_to (or RMQ_ACTION_REPLY_QUEUE)
+                                          {"correlation_id", "system_uuid", "ok", "result" | "error"}
+
+- Every task is handled in its own asyncio task; `RMQ_ACTION_PREFETCH` bounds how
+  many are in flight, so thousands of commands are pipelined instead of served one
+  at a time.
+- Each task waits on a future keyed by its correlation id, for at most its own
+  `timeout` (capped at `ACTION_MAX_TIMEOUT`).
+- The RMQ message is acked once the agent has answered (successfully or not) and
+  nacked without requeue when the agent is offline or didn't answer in time; a
+  reply is published either way. Malformed tasks are rejected.
+- When the agent sits on another node, its answer arrives there and is routed back
+  to the node holding the future (the `node` the request carried).
+"""
+
+import json
+import math
+import uuid
+import asyncio
+import msgpack
+import msgspec
+
+from typing import Any, Dict, Optional, Set
+
+from server.config import CONFIG, logger
+from server.comms.rmq_manager import rmq_manager_conn
+from server.comms.ws_manager import ws_manager_conn
+from server.comms.envelope import Envelope
+
+class ActionResult(msgspec.Struct, gc=False):
+    id: str
+    ok: bool = False
+    node: Optional[str] = None
+    result: Any = None
+    error: Any = None
+
+class _PendingAction:
+    __slots__ = ("system_uuid", "future")
+
+    def __init__(self, system_uuid: str, future: asyncio.Future):
+        self.system_uuid = system_uuid
+        self.future = future
+
+class ActionDispatcher:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ActionDispatcher, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.pending: Dict[str, _PendingAction] = {}  # correlation id -> future awaiting the agent's answer
+            self.tasks: Set[asyncio.Task] = set()
+            self.initialized = True
+
+    async def start(self):
+        """
+        Start consuming the action queue.
+        """
+        await rmq_manager_conn.consume_actions(self._on_message)
+
+    async def stop(self):
+        # unacked tasks go back to the broker when the connection closes
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    # --- RMQ side --------------------------------------------------------
+
+    async def _on_message(self, message):
+        task = asyncio.create_task(self._handle(message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    @staticmethod
+    def _decode(message) -> dict:
+        if message.content_type == "application/json":
+            return json.loads(message.body)
+        return msgpack.unpackb(message.body, raw=False)
+
+    async def _handle(self, message):
+        try:
+            task = self._decode(message)
+            system_uuid = task["system_uuid"]
+            action = task["action"]
+            timeout = float(task.get("timeout") or CONFIG["ACTION_DEFAULT_TIMEOUT"])
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise ValueError(f"invalid timeout {timeout!r}")
+        except Exception as e:
+            logger.warning(f"actions: rejecting malformed task: {e}")
+            await message.reject(requeue=False)
+            return
+
+        correlation_id = message.correlation_id or task.get("id") or uuid.uuid4().hex
+        reply_to = message.reply_to or CONFIG["RMQ_ACTION_REPLY_QUEUE"]
+        timeout = min(timeout, CONFIG["ACTION_MAX_TIMEOUT"])
+        if correlation_id in self.pending:
+            # the first task keeps its waiter; answering this one would be ambiguous
+            logger.warning(f"actions: rejecting task with duplicate id {correlation_id}")
+            await message.reject(requeue=False)
+            try:
+                await self._reply(reply_to, correlation_id, system_uuid, {"ok": False, "error": "duplicate id"})
+            except Exception as e:
+                logger.error(f"actions: failed to answer duplicate task {correlation_id}: {e}")
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[correlation_id] = _PendingAction(system_uuid, future)
+        try:
+            request = {
+                "id": correlation_id,
+                "action": action,
+                "params": task.get("params") or {},
+                "timeout": timeout,
+                "node": CONFIG["NODE_ID"]
+            }
+            delivered = await ws_manager_conn.send_to_agent(system_uuid, {"type": "action.request", "payload": request})
+            if not delivered:
+                await self._reply(reply_to, correlation_id, system_uuid, {"ok": False, "error": "agent not connected"})
+                await message.nack(requeue=False)
+                return
+
+            try:
+                answer = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"actions: '{action}' on {system_uuid} timed out after {timeout}s ({correlation_id})")
+                await self._reply(reply_to, correlation_id, system_uuid, {"ok": False, "error": "timeout"})
+                await message.nack(requeue=False)
+                return
+
+            result = {"ok": answer.ok}
+            result["result" if answer.ok else "error"] = answer.result if answer.ok else answer.error
+            await self._reply(reply_to, correlation_id, system_uuid, result)
+            await message.ack()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"actions: failed to dispatch '{action}' to {system_uuid}: {e}")
+            await message.nack(requeue=True)
+        finally:
+            self.pending.pop(correlation_id, None)
+
+    async def _reply(self, reply_to: str, correlation_id: str, system_uuid: str, result: dict):
+        body = msgpack.packb({"correlation_id": correlation_id, "system_uuid": system_uuid, **result}, use_bin_type=True)
+        await rmq_manager_conn.publish("action", reply_to, body, correlation_id=correlation_id)
+
+    # --- agent side ------------------------------------------------------
+
+    async def on_result(self, system_uuid: str, record: Envelope):
+        """
+        Control handler for `action.result` records sent by agents.
+        """
+        answer: ActionResult = record.payload
+        if self._resolve(system_uuid, answer):
+            return
+
+        if answer.node and answer.node != CONFIG["NODE_ID"]:
+            body = msgpack.packb(
+                {"kind": "action.result", "system_uuid": system_uuid, "payload": msgspec.to_builtins(answer)},
+                use_bin_type=True
+            )
+            await rmq_manager_conn.publish_to_node(answer.node, body)
+        else:
+            logger.debug(f"actions: late or unknown result {answer.id} from {system_uuid}")
+
+    async def on_routed_result(self, envelope: dict):
+        """
+        Results forwarded by the node the agent is connected to.
+        """
+        try:
+            answer = msgspec.convert(envelope.get("payload"), ActionResult)
+        except msgspec.ValidationError as e:
+            logger.warning(f"actions: dropping malformed routed result: {e}")
+            return
+        if not self._resolve(envelope.get("system_uuid"), answer):
+            logger.debug(f"actions: late or unknown routed result {answer.id}")
+
+    def _resolve(self, system_uuid: str, answer: ActionResult) -> bool:
+        pending = self.pending.get(answer.id)
+        # only the agent the task was sent to may answer it
+        if pending is None or pending.system_uuid != system_uuid or pending.future.done():
+            return False
+        pending.future.set_result(answer)
+        return True
+
+# Singleton instance to use app-wide
+action_dispatcher = ActionDispatcher()
+
+ws_manager_conn.register_control_handler("action.result", action_dispatcher.on_result, payload=ActionResult)
+ws_manager_conn.register_routed_handler("action.result", action_dispatcher.on_routed_result)
@@ -0,0 +1,166 @@
+# server/comms/agent_status.py
+
+"""
+Agent status writer
+-x-x-
+Connect/disconnect transitions are queued in memory and merged per `system_uuid`,
+then written to the `agent_status` collection in a single `bulk_write` every
+`AGENT_STATUS_FLUSH_INTERVAL` seconds.
+
+- The websocket handshake never waits on Mongo.
+- A connect followed by a disconnect (or the reverse) inside one flush window
+  collapses into a single upsert carrying the latest state.
+- Pending state is at most one entry per agent, so an unreachable Mongo can't
+  grow it beyond the fleet size.
+"""
+
+import asyncio
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+
+AGENT_STATUS_COLLECTION = "agent_status"
+
+class _PendingStatus:
+    __slots__ = ("org", "connected_at", "disconnected_at", "status")
+
+    def __init__(self):
+        self.org: Optional[str] = None
+        self.connected_at: Optional[datetime] = None
+        self.disconnected_at: Optional[datetime] = None
+        self.status: Optional[str] = None
+
+class AgentStatusWriter:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(AgentStatusWriter, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.pending: Dict[str, _PendingStatus] = {}
+            self._flusher = None
+            self._closing = False
+            self.initialized = True
+
+    async def ensure_indexes(self):
+        col = mongo_manager_conn.get_db()[AGENT_STATUS_COLLECTION]
+        try:
+            await col.create_index([("system_uuid", ASCENDING)], unique=True, name="system_uuid_unique")
+            logger.info("agent_status: ensured unique index on system_uuid.")
+        except PyMongoError as e:
+            # e.g. pre-existing duplicate documents; the upserts still work, just without the guarantee
+            logger.error(f"agent_status: failed to create unique index on system_uuid: {e}")
+
+        try:
+            # inventory filters (org, status) and pages by system_uuid
+            await col.create_index(
+                [("org", ASCENDING), ("status", ASCENDING), ("system_uuid", ASCENDING)], name="org_status_uuid"
+            )
+            await col.create_index([("status", ASCENDING), ("system_uuid", ASCENDING)], name="status_uuid")
+            logger.info("agent_status: ensured inventory indexes.")
+        except PyMongoError as e:
+            logger.error(f"agent_status: failed to create inventory indexes: {e}")
+
+    def start(self):
+        if self._flusher is None:
+            self._closing = False
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """
+        Stop the flusher and write out whatever is still pending.
+        """
+        if self._flusher:
+            self._closing = True
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    def mark_connected(self, system_uuid: str, org: str):
+        entry = self._entry(system_uuid)
+        entry.org = org
+        entry.connected_at = datetime.now(timezone.utc)
+        entry.status = "connected"
+
+    def mark_disconnected(self, system_uuid: str):
+        entry = self._entry(system_uuid)
+        entry.disconnected_at = datetime.now(timezone.utc)
+        entry.status = "disconnected"
+
+    def _entry(self, system_uuid: str) -> _PendingStatus:
+        entry = self.pending.get(system_uuid)
+        if entry is None:
+            entry = self.pending[system_uuid] = _PendingStatus()
+        return entry
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        ops = [self._build_op(system_uuid, entry) for system_uuid, entry in batch.items()]
+
+        try:
+            col = mongo_manager_conn.get_db()[AGENT_STATUS_COLLECTION]
+            await col.bulk_write(ops, ordered=False)
+            logger.debug(f"agent_status: flushed {len(ops)} status transition(s).")
+        except (PyMongoError, RuntimeError) as e:
+            logger.error(f"agent_status: failed to flush {len(ops)} status transition(s): {e}")
+            for system_uuid, entry in batch.items():
+                newer = self.pending.get(system_uuid)
+                if newer is None:
+                    self.pending[system_uuid] = entry
+                    continue
+                # a newer transition arrived meanwhile: its status wins, but keep what only
+                # the failed entry knew (e.g. the connect behind a disconnect-only entry)
+                if newer.connected_at is None:
+                    newer.connected_at = entry.connected_at
+                if newer.org is None:
+                    newer.org = entry.org
+                if newer.disconnected_at is None:
+                    newer.disconnected_at = entry.disconnected_at
+
+    async def _flush_loop(self):
+        interval = CONFIG["AGENT_STATUS_FLUSH_INTERVAL"]
+        while not self._closing:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"agent_status: flush loop error: {e}")
+
+    @staticmethod
+    def _build_op(system_uuid: str, entry: _PendingStatus) -> UpdateOne:
+        if entry.connected_at is None:
+            # only a disconnect in this window; leave the row alone if another node holds the agent now
+            return UpdateOne(
+                {"system_uuid": system_uuid, "status": "connected", "node": {"$in": [CONFIG["NODE_ID"], None]}},
+                {"$set": {"status": "disconnected", "last_disconnected": entry.disconnected_at}}
+            )
+
+        update = {
+            "$set": {
+                "system_uuid": system_uuid,
+                "org": entry.org,
+                "status": entry.status,
+                "node": CONFIG["NODE_ID"],
+                "connected_at": entry.connected_at
+            }
+        }
+        if entry.disconnected_at is not None:
+            update["$set"]["last_disconnected"] = entry.disconnected_at
+        else:
+            update["$setOnInsert"] = {"last_disconnected": None}
+
+        return UpdateOne({"system_uuid": system_uuid}, update, upsert=True)
+
+# Singleton instance to use app-wide
+agent_status_writer = AgentStatusWriter()
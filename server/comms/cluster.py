@@ -0,0 +1,155 @@
+# server/comms/cluster.py
+
+"""
+Cluster membership & sharding
+-x-x-
+Assigns every agent to one server node through a consistent-hash ring, so the
+fleet can grow by adding nodes.
+
+- Nodes announce themselves (`NODE_ID`, public `NODE_ENDPOINT`) in the
+  `cluster_nodes` collection and heartbeat every `CLUSTER_HEARTBEAT_INTERVAL`
+  seconds; a node missing heartbeats for `CLUSTER_NODE_TTL` seconds leaves the ring.
+- Each node sits on the ring at `CLUSTER_VNODES` points. A join or leave only
+  moves the keys between the changed node's points and their neighbours, about
+  1/N of the fleet.
+- The shard key is the agent's org (`CLUSTER_SHARDING = "org"`, an org lives on
+  one node so org-wide broadcasts stay local) or its `system_uuid` ("uuid").
+- `/auth/get_token` (and the in-connection refresh) tells the agent which
+  endpoint owns it; agents already connected elsewhere move over on their next
+  token refresh.
+"""
+
+import bisect
+import asyncio
+import hashlib
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+from server.metrics import registry
+
+CLUSTER_COLLECTION = "cluster_nodes"
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Immutable consistent-hash ring over {node_id: endpoint}.
+    """
+    def __init__(self, nodes: Dict[str, str], vnodes: int):
+        self.nodes = dict(nodes)
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node_id}#{i}"), node_id) for node_id in self.nodes for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    def lookup(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect_right(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+class ClusterMembership:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ClusterMembership, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.mode = CONFIG["CLUSTER_SHARDING"]
+            self.ring = HashRing({}, CONFIG["CLUSTER_VNODES"])
+            self._heartbeat = None
+            self.initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("org", "uuid")
+
+    def _col(self):
+        return mongo_manager_conn.get_db()[CLUSTER_COLLECTION]
+
+    async def start(self):
+        if not self.enabled:
+            return
+        if not CONFIG["NODE_ENDPOINT"]:
+            logger.warning("cluster: CLUSTER_SHARDING is set but NODE_ENDPOINT is empty; sharding disabled.")
+            self.mode = "off"
+            return
+
+        try:
+            await self._col().create_index([("heartbeat_at", ASCENDING)], name="heartbeat_at")
+        except PyMongoError as e:
+            logger.error(f"cluster: failed to create index on '{CLUSTER_COLLECTION}': {e}")
+        await self._beat()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"cluster: node '{CONFIG['NODE_ID']}' joined at {CONFIG['NODE_ENDPOINT']} ({self.mode} sharding).")
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+            try:
+                # leave right away instead of waiting out CLUSTER_NODE_TTL
+                await self._col().delete_one({"_id": CONFIG["NODE_ID"]})
+            except PyMongoError as e:
+                logger.warning(f"cluster: failed to deregister node: {e}")
+
+    async def _beat(self):
+        """
+        Refresh this node's heartbeat and rebuild the ring from the live nodes.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            col = self._col()
+            await col.update_one(
+                {"_id": CONFIG["NODE_ID"]},
+                {"$set": {"endpoint": CONFIG["NODE_ENDPOINT"], "heartbeat_at": now}},
+                upsert=True
+            )
+            cutoff = now - timedelta(seconds=CONFIG["CLUSTER_NODE_TTL"])
+            docs = await col.find({"heartbeat_at": {"$gte": cutoff}}, {"endpoint": 1}).to_list(length=None)
+        except PyMongoError as e:
+            logger.error(f"cluster: heartbeat failed, keeping the current ring: {e}")
+            return
+
+        nodes = {doc["_id"]: doc["endpoint"] for doc in docs}
+        nodes[CONFIG["NODE_ID"]] = CONFIG["NODE_ENDPOINT"]
+        if nodes != self.ring.nodes:
+            joined, left = nodes.keys() - self.ring.nodes.keys(), self.ring.nodes.keys() - nodes.keys()
+            self.ring = HashRing(nodes, CONFIG["CLUSTER_VNODES"])
+            logger.info(f"cluster: ring now has {len(nodes)} node(s) (joined: {sorted(joined)}, left: {sorted(left)})")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(CONFIG["CLUSTER_HEARTBEAT_INTERVAL"])
+            await self._beat()
+
+    def shard_key(self, system_uuid: str, org: Optional[str]) -> str:
+        return org if self.mode == "org" and org else system_uuid
+
+    def owner(self, system_uuid: str, org: Optional[str] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return self.ring.lookup(self.shard_key(system_uuid, org))
+
+    def endpoint_for(self, system_uuid: str, org: Optional[str] = None) -> Optional[str]:
+        """
+        Public ws endpoint of the node that owns this agent, or None when sharding is off.
+        """
+        node_id = self.owner(system_uuid, org)
+        return self.ring.nodes.get(node_id) if node_id else None
+
+# Singleton instance to use app-wide
+cluster = ClusterMembership()
+
+registry.gauge("trex_cluster_nodes", "Live nodes on this node's hash ring.", callback=lambda: len(cluster.ring.nodes))
@@ -0,0 +1,144 @@
+# server/comms/envelope.py
+
+"""
+Record envelope
+-x-x-
+Every record an agent sends is an envelope:
+
+    {"type": str, "seq": int, "ts": float | null, "payload": ...}
+
+- Decoding is done with msgspec decoders that are built once (`compile()`, at
+  startup) instead of per message: the envelope decoder reads `type`/`seq`/`ts`
+  and leaves `payload` as raw bytes, then the payload is decoded by the decoder
+  compiled for that record type's schema (a `msgspec.Struct`), or into plain
+  Python objects for types without one. Every payload byte is parsed once.
+- Schemas are registered next to their handlers via
+  `WSManager.register_control_handler(record_type, handler, payload=Schema)`
+  (handled inline) or `IngestPipeline.register_handler(...)` (queued).
+- A record that doesn't match the envelope or its type's schema is dropped on
+  its own (counted in `trex_ws_records_invalid_total`); the rest of the frame
+  is kept.
+- Text agents that send something other than envelopes (plain strings, scalars)
+  still get wrapped as "raw" records.
+"""
+
+import json
+import msgspec
+
+from typing import Any, Dict, List, Optional, Union
+
+from server.config import logger
+from server.metrics import registry
+
+INVALID_RECORDS = registry.counter(
+    "trex_ws_records_invalid_total", "Agent records dropped for not matching the envelope or their type's schema."
+)
+
+class Envelope(msgspec.Struct, gc=False):
+    type: str
+    seq: int = 0  # per-agent sequence number (0: not set)
+    ts: Optional[float] = None  # unix seconds the agent created the record at
+    payload: Any = None  # a schema instance for registered types, plain objects otherwise
+
+class _WireEnvelope(msgspec.Struct, gc=False):
+    type: str
+    seq: int = 0
+    ts: Optional[float] = None
+    payload: msgspec.Raw = msgspec.Raw()  # decoded in a second step, by type
+
+class EnvelopeCodec:
+    def __init__(self):
+        self.schemas: Dict[str, type] = {}
+        self._compiled = False
+
+    def register(self, record_type: str, schema: type):
+        self.schemas[record_type] = schema
+        self._compiled = False
+
+    def compile(self):
+        """
+        Build the decoders. Called at startup, once every schema is registered;
+        decoding before that compiles lazily.
+        """
+        self._envelope_msgpack = msgspec.msgpack.Decoder(_WireEnvelope)
+        self._envelope_json = msgspec.json.Decoder(Union[_WireEnvelope, List[_WireEnvelope]])
+        self._payload_msgpack = {t: msgspec.msgpack.Decoder(s) for t, s in self.schemas.items()}
+        self._payload_json = {t: msgspec.json.Decoder(s) for t, s in self.schemas.items()}
+        self._any_msgpack = msgspec.msgpack.Decoder()
+        self._any_json = msgspec.json.Decoder()
+        self._compiled = True
+        logger.debug(f"envelope: compiled decoders for {len(self.schemas)} payload schema(s)")
+
+    def _finish(self, wire: _WireEnvelope, decoders: Dict[str, Any], fallback) -> Optional[Envelope]:
+        payload = None
+        try:
+            if wire.payload:
+                payload = decoders.get(wire.type, fallback).decode(wire.payload)
+            elif wire.type in decoders:
+                raise msgspec.ValidationError("missing payload")
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            INVALID_RECORDS.inc()
+            logger.debug(f"envelope: dropping '{wire.type}' record: {e}")
+            return None
+        return Envelope(wire.type, wire.seq, wire.ts, payload)
+
+    def decode_msgpack(self, data) -> Optional[Envelope]:
+        """
+        One binary-frame record (see `framing.decode_frame`); None if it's invalid.
+        """
+        if not self._compiled:
+            self.compile()
+        try:
+            wire = self._envelope_msgpack.decode(data)
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            INVALID_RECORDS.inc()
+            logger.debug(f"envelope: dropping record: {e}")
+            return None
+        return self._finish(wire, self._payload_msgpack, self._any_msgpack)
+
+    def decode_text(self, message: str) -> List[Envelope]:
+        """
+        A text-mode message: one envelope, a JSON array of envelopes, or (legacy)
+        anything else, wrapped as "raw" records.
+        """
+        if not self._compiled:
+            self.compile()
+        try:
+            decoded = self._envelope_json.decode(message)
+        except (msgspec.ValidationError, msgspec.DecodeError):
+            return self._decode_legacy_text(message)
+
+        wires = decoded if isinstance(decoded, list) else (decoded,)
+        records = []
+        for wire in wires:
+            record = self._finish(wire, self._payload_json, self._any_json)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def _decode_legacy_text(self, message: str) -> List[Envelope]:
+        try:
+            decoded = json.loads(message)
+        except ValueError:
+            return [Envelope("raw", payload=message)]
+
+        items = decoded if isinstance(decoded, list) else [decoded]
+        records = []
+        for item in items:
+            if not isinstance(item, dict) or "type" not in item:
+                records.append(Envelope("raw", payload=item))
+                continue
+            # an envelope-like object in a mixed array (or a broken one); validate it on its own
+            try:
+                wire = self._envelope_json.decode(json.dumps(item))
+            except (msgspec.ValidationError, msgspec.DecodeError) as e:
+                INVALID_RECORDS.inc()
+                logger.debug(f"envelope: dropping record: {e}")
+                continue
+            record = self._finish(wire, self._payload_json, self._any_json)
+            if record is not None:
+                records.append(record)
+        return records
+
+# app-wide codec; schemas are registered through the control and ingest handler tables
+envelope_codec = EnvelopeCodec()
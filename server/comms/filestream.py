@@ -0,0 +1,310 @@
+# server/comms/filestream.py
+
+"""
+File streaming
+-x-x-
+Chunked, resumable agent -> server file uploads (logs, core dumps, captures) over
+the agent's websocket.
+
+    agent                                   server
+    file.begin {upload_id, name, size, sha256}  ->
+                                            <-  file.ack  {upload_id, offset}   (resume point)
+    file.chunk {upload_id, offset, data, crc32} ->
+                                            <-  file.ack  {upload_id, offset}   (per chunk)
+    file.end   {upload_id}                  ->
+                                            <-  file.done {upload_id, ok, ...}
+
+- Chunks are appended to `FILESTORE_DIR/partial/<system_uuid>/<upload_id>.part`
+  off the event loop; the committed offset is simply the partial file's size, so a
+  reconnecting agent resumes from the last acknowledged byte.
+- A chunk at the wrong offset or with a bad crc32 is not written; the ack carries
+  the committed offset and the agent rewinds.
+- Chunks for an upload that wasn't begun, or that would run past its declared
+  size, are refused with `file.done` (ok: false) and the partial file discarded.
+- File records are handled inline on the receive loop: a slow disk pushes back on
+  that agent's socket instead of buffering chunks in memory.
+- Completed files are verified (size, sha256), moved into the local store or
+  streamed into GridFS, and announced on the "filestream" RMQ channel.
+"""
+
+import os
+import json
+import hashlib
+import asyncio
+import zlib
+import msgpack
+import msgspec
+
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+from server.comms.rmq_manager import rmq_manager_conn
+from server.comms.ws_manager import ws_manager_conn
+from server.comms.envelope import Envelope
+
+_COPY_CHUNK = 1024 * 1024  # read size when hashing / streaming a finished file
+
+class FileBegin(msgspec.Struct, gc=False):
+    upload_id: str
+    size: int = 0
+    sha256: Optional[str] = None
+    name: Optional[str] = None
+
+class FileChunk(msgspec.Struct, gc=False):
+    upload_id: str
+    offset: int
+    data: bytes  # msgpack bin from binary agents, base64 from text agents
+    crc32: int
+
+class FileEnd(msgspec.Struct, gc=False):
+    upload_id: str
+
+def _safe_id(value: str) -> str:
+    # upload ids and uuids become path components; keep them boring
+    return "".join(c for c in str(value) if c.isalnum() or c in "-_.")[:128].lstrip(".")
+
+class FileStreamManager:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(FileStreamManager, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.root = CONFIG["FILESTORE_DIR"]
+            self.meta: Dict[Tuple[str, str], dict] = {}  # (system_uuid, upload_id) -> meta of uploads in progress
+            self.initialized = True
+
+    async def setup(self):
+        """
+        Declare the completion queue on the "filestream" channel.
+        """
+        channel = rmq_manager_conn.get_channel("filestream")
+        if channel is not None:
+            await channel.declare_queue(CONFIG["RMQ_FILESTREAM_QUEUE"], durable=True)
+
+    # --- paths -----------------------------------------------------------
+
+    def _partial_path(self, system_uuid: str, upload_id: str) -> str:
+        return os.path.join(self.root, "partial", _safe_id(system_uuid), f"{_safe_id(upload_id)}.part")
+
+    def _meta_path(self, system_uuid: str, upload_id: str) -> str:
+        return os.path.join(self.root, "partial", _safe_id(system_uuid), f"{_safe_id(upload_id)}.meta")
+
+    def _complete_path(self, system_uuid: str, upload_id: str, name: str) -> str:
+        return os.path.join(self.root, "complete", _safe_id(system_uuid), f"{_safe_id(upload_id)}-{_safe_id(name)}")
+
+    # --- blocking helpers (run in a thread) ------------------------------
+
+    @staticmethod
+    def _committed_offset(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _write_meta(path: str, meta: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def _read_meta(path: str):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _append(path: str, offset: int, data: bytes) -> int:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            if f.tell() != offset:
+                return f.tell()  # raced with another write; report what's committed
+            f.write(data)
+            return f.tell()
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_COPY_CHUNK), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # --- record handlers -------------------------------------------------
+
+    async def on_begin(self, system_uuid: str, record: Envelope):
+        payload: FileBegin = record.payload
+        upload_id = _safe_id(payload.upload_id)
+        if not upload_id:
+            return
+
+        size = payload.size
+        if size > CONFIG["FILESTORE_MAX_FILE_BYTES"]:
+            await self._reply(system_uuid, "file.done", {"upload_id": upload_id, "ok": False, "error": "too large"})
+            return
+
+        meta_path = self._meta_path(system_uuid, upload_id)
+        meta = await asyncio.to_thread(self._read_meta, meta_path)
+        if meta is None or meta.get("size") != size or meta.get("sha256") != payload.sha256:
+            # new upload (or the file changed underneath the agent): start over
+            meta = {"name": payload.name or upload_id, "size": size, "sha256": payload.sha256}
+            await asyncio.to_thread(self._write_meta, meta_path, meta)
+            await asyncio.to_thread(self._truncate, self._partial_path(system_uuid, upload_id))
+        self.meta[(system_uuid, upload_id)] = meta
+
+        offset = await asyncio.to_thread(self._committed_offset, self._partial_path(system_uuid, upload_id))
+        logger.info(f"filestream: {system_uuid} upload '{meta['name']}' ({size} bytes) starting at offset {offset}")
+        await self._ack(system_uuid, upload_id, offset)
+
+    async def on_chunk(self, system_uuid: str, record: Envelope):
+        payload: FileChunk = record.payload
+        upload_id = _safe_id(payload.upload_id)
+        offset = payload.offset
+        data = payload.data
+
+        meta = await self._load_meta(system_uuid, upload_id)
+        if meta is None:
+            await self._reply(system_uuid, "file.done", {"upload_id": upload_id, "ok": False, "error": "unknown upload"})
+            return
+        if offset < 0 or offset + len(data) > min(meta["size"], CONFIG["FILESTORE_MAX_FILE_BYTES"]):
+            logger.warning(f"filestream: {system_uuid} upload {upload_id} ran past its declared size ({meta['size']} bytes); discarding")
+            await asyncio.to_thread(self._discard, system_uuid, upload_id)
+            await self._reply(system_uuid, "file.done", {"upload_id": upload_id, "ok": False, "error": "exceeds declared size"})
+            return
+
+        path = self._partial_path(system_uuid, upload_id)
+        if zlib.crc32(data) != payload.crc32:
+            logger.warning(f"filestream: crc mismatch from {system_uuid} for upload {upload_id} at offset {offset}")
+            committed = await asyncio.to_thread(self._committed_offset, path)
+            await self._ack(system_uuid, upload_id, committed, error="crc")
+            return
+
+        committed = await asyncio.to_thread(self._append, path, offset, data)
+        await self._ack(system_uuid, upload_id, committed)
+
+    async def on_end(self, system_uuid: str, record: Envelope):
+        upload_id = _safe_id(record.payload.upload_id)
+        partial = self._partial_path(system_uuid, upload_id)
+        meta = await self._load_meta(system_uuid, upload_id)
+        if meta is None:
+            await self._reply(system_uuid, "file.done", {"upload_id": upload_id, "ok": False, "error": "unknown upload"})
+            return
+
+        size = await asyncio.to_thread(self._committed_offset, partial)
+        if size != meta["size"]:
+            await self._ack(system_uuid, upload_id, size, error="incomplete")
+            return
+
+        sha256 = await asyncio.to_thread(self._sha256, partial)
+        if meta.get("sha256") and sha256 != meta["sha256"]:
+            logger.error(f"filestream: sha256 mismatch for {system_uuid} upload {upload_id}; discarding")
+            await asyncio.to_thread(self._truncate, partial)
+            await self._ack(system_uuid, upload_id, 0, error="sha256")
+            return
+
+        location = await self._finalize(system_uuid, upload_id, meta, partial)
+        logger.info(f"filestream: {system_uuid} upload '{meta['name']}' complete ({size} bytes) -> {location}")
+        await self._reply(system_uuid, "file.done", {"upload_id": upload_id, "ok": True, "sha256": sha256, "size": size})
+
+        event = {
+            "system_uuid": system_uuid,
+            "upload_id": upload_id,
+            "name": meta["name"],
+            "size": size,
+            "sha256": sha256,
+            "location": location,
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            await rmq_manager_conn.publish("filestream", CONFIG["RMQ_FILESTREAM_QUEUE"], msgpack.packb(event, use_bin_type=True))
+        except Exception as e:
+            logger.error(f"filestream: failed to publish completion of {upload_id}: {e}")
+
+    async def _load_meta(self, system_uuid: str, upload_id: str) -> Optional[dict]:
+        """
+        Meta of an upload in progress; read back from disk after a server restart.
+        """
+        meta = self.meta.get((system_uuid, upload_id))
+        if meta is None:
+            meta = await asyncio.to_thread(self._read_meta, self._meta_path(system_uuid, upload_id))
+            if meta is not None:
+                self.meta[(system_uuid, upload_id)] = meta
+        return meta
+
+    # --- finalization ----------------------------------------------------
+
+    async def _finalize(self, system_uuid: str, upload_id: str, meta: dict, partial: str) -> str:
+        if CONFIG["FILESTORE_BACKEND"] == "gridfs":
+            file_id = await self._stream_to_gridfs(system_uuid, upload_id, meta, partial)
+            await asyncio.to_thread(self._discard, system_uuid, upload_id)
+            return f"gridfs:{file_id}"
+
+        target = self._complete_path(system_uuid, upload_id, meta["name"])
+        await asyncio.to_thread(self._move, partial, target)
+        await asyncio.to_thread(self._discard, system_uuid, upload_id)
+        return target
+
+    async def _stream_to_gridfs(self, system_uuid: str, upload_id: str, meta: dict, partial: str):
+        bucket = AsyncIOMotorGridFSBucket(mongo_manager_conn.get_db(), bucket_name=CONFIG["FILESTORE_GRIDFS_BUCKET"])
+        stream = bucket.open_upload_stream(
+            meta["name"],
+            metadata={"system_uuid": system_uuid, "upload_id": upload_id, "sha256": meta.get("sha256")}
+        )
+        try:
+            with open(partial, "rb") as f:
+                while True:
+                    block = await asyncio.to_thread(f.read, _COPY_CHUNK)
+                    if not block:
+                        break
+                    await stream.write(block)
+            await stream.close()
+        except Exception:
+            await stream.abort()
+            raise
+        return stream._id
+
+    @staticmethod
+    def _truncate(path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+
+    @staticmethod
+    def _move(source: str, target: str):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+
+    def _discard(self, system_uuid: str, upload_id: str):
+        self.meta.pop((system_uuid, upload_id), None)
+        for path in (self._partial_path(system_uuid, upload_id), self._meta_path(system_uuid, upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # --- replies ---------------------------------------------------------
+
+    async def _ack(self, system_uuid: str, upload_id: str, offset: int, error: str = None):
+        payload = {"upload_id": upload_id, "offset": offset}
+        if error:
+            payload["error"] = error
+        await self._reply(system_uuid, "file.ack", payload)
+
+    async def _reply(self, system_uuid: str, record_type: str, payload: dict):
+        await ws_manager_conn.send_to_agent(system_uuid, {"type": record_type, "payload": payload})
+
+# Singleton instance to use app-wide
+filestream_manager = FileStreamManager()
+
+# file records are handled inline on the receive loop (not queued for ingest)
+ws_manager_conn.register_control_handler("file.begin", filestream_manager.on_begin, payload=FileBegin)
+ws_manager_conn.register_control_handler("file.chunk", filestream_manager.on_chunk, payload=FileChunk)
+ws_manager_conn.register_control_handler("file.end", filestream_manager.on_end, payload=FileEnd)
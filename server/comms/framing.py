@@ -0,0 +1,123 @@
+# server/comms/framing.py
+
+"""
+WS Framing
+-x-x-
+Wire format for agent <-> server websocket traffic.
+
+Two protocols are negotiated at the `/auth/ws/{system_uuid}` handshake via the
+websocket subprotocol header:
+
+- text   : (default, no subprotocol) one JSON document / raw string per frame.
+- binary : (`trex.binary.v1`) length-prefixed msgpack records, many per frame.
+
+Binary frame layout:
+
+    [flags: u8][len: u32 BE][record][len: u32 BE][record]...
+
+- flags bit 0 (FLAG_ZLIB) marks everything after the flags byte as zlib-compressed.
+- every record is a msgpack encoded map, e.g. {"type": "telemetry", "payload": {...}}
+  (an envelope, see `envelope.py`)
+"""
+
+import struct
+import zlib
+import msgpack
+
+from typing import Any, Callable, Iterable, List
+
+PROTO_TEXT = "text"
+PROTO_BINARY = "binary"
+
+# websocket subprotocol advertised by binary-capable agents
+BINARY_SUBPROTOCOL = "trex.binary.v1"
+
+FLAG_ZLIB = 0x01
+
+_LEN = struct.Struct(">I")  # precompiled record length prefix
+
+class FrameError(ValueError):
+    """Raised when an inbound frame is malformed or exceeds the configured limits."""
+
+def negotiate_protocol(offered: Iterable[str]) -> str:
+    """
+    Pick the wire protocol from the subprotocols offered by the agent.
+    Agents that offer nothing (legacy/text agents) stay on the text protocol.
+    """
+    return PROTO_BINARY if BINARY_SUBPROTOCOL in (offered or ()) else PROTO_TEXT
+
+def encode_frame(records: Iterable[dict], compress: bool = False) -> bytes:
+    """
+    Pack many records into a single binary frame.
+    """
+    parts = []
+    for record in records:
+        body = msgpack.packb(record, use_bin_type=True)
+        parts.append(_LEN.pack(len(body)))
+        parts.append(body)
+
+    body = b"".join(parts)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+
+    return bytes((flags,)) + body
+
+def _unpack(data) -> dict:
+    return msgpack.unpackb(data, raw=False)
+
+def decode_frame(frame: bytes, max_bytes: int, max_records: int, decode_record: Callable[[Any], Any] = _unpack) -> list:
+    """
+    Unpack a binary frame into its records.
+
+    `max_bytes` bounds the (decompressed) frame size and `max_records` bounds the
+    number of records, so a single frame can't balloon server memory.
+    `decode_record` turns one record's bytes into a record (plain msgpack by
+    default); records it returns None for are left out, and anything it raises
+    while unpacking is reported as FrameError.
+    """
+    if not frame:
+        raise FrameError("empty frame")
+    if len(frame) > max_bytes:
+        raise FrameError(f"frame of {len(frame)} bytes exceeds limit of {max_bytes}")
+
+    flags = frame[0]
+    view = memoryview(frame)[1:]
+
+    if flags & FLAG_ZLIB:
+        inflater = zlib.decompressobj()
+        try:
+            inflated = inflater.decompress(view, max_bytes)
+        except zlib.error as e:
+            raise FrameError(f"corrupt compressed frame: {e}") from e
+        if inflater.unconsumed_tail:
+            raise FrameError(f"decompressed frame exceeds limit of {max_bytes}")
+        view = memoryview(inflated)
+
+    records = []
+    offset = 0
+    end = len(view)
+    while offset < end:
+        if len(records) >= max_records:
+            raise FrameError(f"frame carries more than {max_records} records")
+        if offset + _LEN.size > end:
+            raise FrameError("truncated record length prefix")
+
+        (length,) = _LEN.unpack_from(view, offset)
+        offset += _LEN.size
+        if offset + length > end:
+            raise FrameError("truncated record body")
+
+        try:
+            record = decode_record(view[offset:offset + length])
+        except FrameError:
+            raise
+        except (msgpack.UnpackException, ValueError, TypeError) as e:
+            # ExtraData, FormatError, StackError, ... and unhashable map keys (TypeError)
+            raise FrameError(f"malformed record {len(records)}: {e!r}") from e
+        if record is not None:
+            records.append(record)
+        offset += length
+
+    return records
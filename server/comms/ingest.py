@@ -0,0 +1,258 @@
+# server/comms/ingest.py
+
+"""
+Ingest pipeline
+-x-x-
+Decouples reading from agent websockets from processing what they send.
+
+- Every agent gets a bounded queue; the receive loop only enqueues.
+- A fixed pool of worker tasks drains the queues. Agents with pending records are
+  scheduled on a shared ready-queue, and each turn drains at most `INGEST_BATCH`
+  records, so one chatty agent can't monopolize the workers.
+- What happens when an agent's queue is full depends on the record's type (its
+  "message class"), see `INGEST_POLICIES`:
+    block       : the receive loop waits (TCP backpressure on that agent only)
+    drop_oldest : evict the oldest queued record to make room
+    sample      : past the high watermark keep 1 in `INGEST_SAMPLE_RATE`; drop when full
+- Workers hand records to a per-type handler table (`register_handler`, typed
+  payloads like the control handlers); `telemetry` and `telemetry.series` are
+  registered here.
+"""
+
+import asyncio
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+from server.comms.envelope import Envelope, envelope_codec
+from server.comms.series import SERIES_RECORD, Series, decode_series
+from server.comms.timeseries import Telemetry, telemetry_store
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_SAMPLE = "sample"
+
+RecordHandler = Callable[[str, str, List[Envelope]], Awaitable[None]]
+TypedRecordHandler = Callable[[str, str, Envelope, datetime], Awaitable[None]]
+
+AGENT_RECORDS_COLLECTION = "agent_records"  # non-telemetry records
+
+class AgentQueue:
+    __slots__ = ("system_uuid", "org", "records", "capacity", "scheduled", "closed", "space", "dropped", "sample_seq")
+
+    def __init__(self, system_uuid: str, org: str, capacity: int):
+        self.system_uuid = system_uuid
+        self.org = org
+        self.records = deque()
+        self.capacity = capacity
+        self.scheduled = False  # already sitting on the ready-queue
+        self.closed = False     # agent disconnected; dropped once drained
+        self.space = asyncio.Event()
+        self.space.set()
+        self.dropped = 0
+        self.sample_seq = 0
+
+async def store_records(system_uuid: str, org: str, records: List[Envelope]):
+    """
+    Default record handler. Records of a type registered with `IngestPipeline.register_handler`
+    go to that type's handler (telemetry: the time-series store); anything else is kept
+    as-is in `agent_records`. Writes go through the write-behind buffer.
+    """
+    received_at = datetime.now(timezone.utc)
+    handlers = ingest_pipeline.record_handlers
+    for record in records:
+        handler = handlers.get(record.type)
+        if handler is None:
+            await mongo_manager_conn.buffered_write(
+                AGENT_RECORDS_COLLECTION,
+                {
+                    "type": record.type,
+                    "seq": record.seq,
+                    "ts": record.ts,
+                    "payload": record.payload,
+                    "system_uuid": system_uuid,
+                    "org": org,
+                    "received_at": received_at
+                }
+            )
+            continue
+        try:
+            await handler(system_uuid, org, record, received_at)
+        except Exception as e:
+            logger.error(f"ingest: handler for '{record.type}' failed for {system_uuid}: {e}")
+
+async def store_telemetry(system_uuid: str, org: str, record: Envelope, received_at: datetime):
+    sample: Telemetry = record.payload
+    await telemetry_store.add(
+        system_uuid, org, sample.collector, record.ts or received_at.timestamp(), sample.values, received_at
+    )
+
+async def store_series(system_uuid: str, org: str, record: Envelope, received_at: datetime):
+    try:
+        samples = decode_series(record.payload)
+    except ValueError as e:
+        logger.warning(f"ingest: dropping series record from {system_uuid}: {e}")
+        return
+    for sample in samples:
+        await telemetry_store.add(system_uuid, org, sample["collector"], sample["ts"], sample["values"], received_at)
+
+class IngestPipeline:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(IngestPipeline, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.queues: Dict[str, AgentQueue] = {}
+            self.ready: asyncio.Queue = None
+            self.workers: List[asyncio.Task] = []
+            self.inflight = 0  # records taken off a queue but not yet processed
+            self.handler: RecordHandler = store_records
+            # record type -> handler `store_records` hands that type's records to
+            self.record_handlers: Dict[str, TypedRecordHandler] = {}
+            self.policies: Dict[str, str] = CONFIG["INGEST_POLICIES"]
+            self.initialized = True
+
+    def register_handler(self, record_type: str, handler: TypedRecordHandler, payload: Optional[type] = None):
+        """
+        Have `store_records` hand records of `record_type` to `handler`. Unlike control
+        handlers these are still queued, so the type's ingest policy applies. With
+        `payload` (a msgspec.Struct), the record's payload is decoded into it and
+        records that don't match are dropped before they're queued.
+        """
+        self.record_handlers[record_type] = handler
+        if payload is not None:
+            envelope_codec.register(record_type, payload)
+
+    def start(self):
+        if self.workers:
+            return
+        self.ready = asyncio.Queue()
+        self.workers = [
+            asyncio.create_task(self._worker(n)) for n in range(CONFIG["INGEST_WORKERS"])
+        ]
+        logger.info(f"ingest: started {len(self.workers)} worker(s).")
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Give the workers `timeout` seconds to drain what's queued, then stop them.
+        """
+        if not self.workers:
+            return
+
+        try:
+            await asyncio.wait_for(self._drained(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ingest: stopping with {self.total_depth()} record(s) still queued")
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def open(self, system_uuid: str, org: str):
+        queue = self.queues.get(system_uuid)
+        if queue is None:
+            queue = AgentQueue(system_uuid, org, CONFIG["INGEST_QUEUE_SIZE"])
+            self.queues[system_uuid] = queue
+        else:
+            # quick reconnect while the old queue is still draining; keep its records
+            queue.org = org
+            queue.closed = False
+        return queue
+
+    def close(self, system_uuid: str):
+        queue = self.queues.get(system_uuid)
+        if queue is None:
+            return
+        queue.closed = True
+        queue.space.set()  # release a receive loop parked on a full queue
+        if not queue.records and not queue.scheduled:
+            self.queues.pop(system_uuid, None)
+
+    async def submit(self, system_uuid: str, records: List[Envelope]):
+        queue = self.queues.get(system_uuid)
+        if queue is None:
+            logger.warning(f"ingest: no open queue for {system_uuid}; dropping {len(records)} record(s)")
+            return
+
+        default_policy = self.policies.get("default", POLICY_DROP_OLDEST)
+        for record in records:
+            policy = self.policies.get(record.type, default_policy)
+            if policy == POLICY_BLOCK:
+                while len(queue.records) >= queue.capacity and not queue.closed:
+                    queue.space.clear()
+                    await queue.space.wait()
+            elif policy == POLICY_SAMPLE:
+                if not self._sample(queue):
+                    queue.dropped += 1
+                    continue
+            elif len(queue.records) >= queue.capacity:
+                queue.records.popleft()
+                queue.dropped += 1
+
+            queue.records.append(record)
+
+        if queue.records and not queue.scheduled:
+            queue.scheduled = True
+            self.ready.put_nowait(system_uuid)
+
+    def queue_depths(self) -> Dict[str, dict]:
+        return {
+            system_uuid: {"org": queue.org, "depth": len(queue.records), "capacity": queue.capacity, "dropped": queue.dropped}
+            for system_uuid, queue in self.queues.items()
+        }
+
+    def total_depth(self) -> int:
+        return sum(len(queue.records) for queue in self.queues.values())
+
+    def _sample(self, queue: AgentQueue) -> bool:
+        depth = len(queue.records)
+        if depth >= queue.capacity:
+            return False
+        if depth < queue.capacity * CONFIG["INGEST_SAMPLE_WATERMARK"]:
+            return True
+        queue.sample_seq += 1
+        return queue.sample_seq % CONFIG["INGEST_SAMPLE_RATE"] == 0
+
+    async def _drained(self):
+        while self.total_depth() or self.inflight:
+            await asyncio.sleep(0.05)
+
+    async def _worker(self, n: int):
+        batch_size = CONFIG["INGEST_BATCH"]
+        while True:
+            system_uuid = await self.ready.get()
+            queue = self.queues.get(system_uuid)
+            if queue is None:
+                continue
+
+            batch = [queue.records.popleft() for _ in range(min(batch_size, len(queue.records)))]
+            queue.space.set()
+            self.inflight += len(batch)
+
+            try:
+                await self.handler(system_uuid, queue.org, batch)
+            except Exception as e:
+                logger.error(f"ingest: worker {n} failed to process {len(batch)} record(s) from {system_uuid}: {e}")
+            finally:
+                self.inflight -= len(batch)
+
+            if queue.records:
+                self.ready.put_nowait(system_uuid)  # back of the line, fair across agents
+            else:
+                queue.scheduled = False
+                if queue.closed and self.queues.get(system_uuid) is queue:
+                    self.queues.pop(system_uuid, None)
+
+# Singleton instance to use app-wide
+ingest_pipeline = IngestPipeline()
+
+ingest_pipeline.register_handler("telemetry", store_telemetry, payload=Telemetry)
+ingest_pipeline.register_handler(SERIES_RECORD, store_series, payload=Series)
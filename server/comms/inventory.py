@@ -0,0 +1,244 @@
+# server/comms/inventory.py
+
+"""
+Agent inventory
+-x-x-
+In-memory presence index behind the `/agents` endpoint; Mongo (`agent_status`)
+is only read once, at startup, to seed it.
+
+- Kept in sync by `WSManager.connect`/`disconnect`. Transitions made on this node
+  are coalesced per agent and fanned out to the other nodes every
+  `AGENT_STATUS_FLUSH_INTERVAL` seconds, so every node's index covers the fleet.
+- Each (org, status) selection, including the wildcards, is a sorted list of
+  `system_uuid`s: counting is `len()` and a page is a bisect + slice, whatever
+  the fleet size.
+- Every agent remembers the node holding its socket. A disconnect only counts when
+  it comes from that node, and a change older than the agent's last one is
+  dropped, so an agent that moved nodes doesn't end up "disconnected" when the old
+  node's fan-out (or its idle timeout) lands after the new node's connect.
+- "connected" rows seeded from Mongo are only trusted for other nodes that are
+  still alive (see `cluster.py`); anything this node held before a restart is gone.
+"""
+
+import bisect
+import asyncio
+import msgpack
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from pymongo.errors import PyMongoError
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+from server.comms.rmq_manager import rmq_manager_conn
+from server.comms.agent_status import AGENT_STATUS_COLLECTION
+from server.comms.cluster import cluster
+
+class _Agent:
+    __slots__ = ("org", "status", "node", "connected_at", "last_disconnected")
+
+    def __init__(self, org: str, status: str, node=None, connected_at=None, last_disconnected=None):
+        self.org = org
+        self.status = status
+        self.node: Optional[str] = node  # node holding (or last holding) the agent's socket
+        self.connected_at: Optional[datetime] = connected_at
+        self.last_disconnected: Optional[datetime] = last_disconnected
+
+    def last_change(self) -> Optional[datetime]:
+        return max((at for at in (self.connected_at, self.last_disconnected) if at is not None), default=None)
+
+    def to_dict(self, system_uuid: str) -> dict:
+        return {
+            "system_uuid": system_uuid,
+            "org": self.org,
+            "status": self.status,
+            "node": self.node,
+            "connected_at": self.connected_at.isoformat() if self.connected_at else None,
+            "last_disconnected": self.last_disconnected.isoformat() if self.last_disconnected else None
+        }
+
+def _utc(value):
+    # motor hands back naive UTC datetimes unless the client is tz_aware
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+class AgentInventory:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(AgentInventory, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.agents: Dict[str, _Agent] = {}
+            # (org | None, status | None) -> sorted system_uuids; None matches any
+            self.index: Dict[Tuple[Optional[str], Optional[str]], List[str]] = {}
+            self.outbox: Dict[str, dict] = {}  # local transitions not yet fanned out, per agent
+            self._publisher = None
+            self._closing = False
+            self.initialized = True
+
+    async def load(self):
+        """
+        Seed the index from `agent_status`. Live transitions seen before or during the
+        load take precedence over what Mongo returns. Runs after `cluster.start()`,
+        so the ring tells which other nodes are alive.
+        """
+        col = mongo_manager_conn.get_db()[AGENT_STATUS_COLLECTION]
+        projection = {"_id": 0, "system_uuid": 1, "org": 1, "status": 1, "node": 1, "connected_at": 1, "last_disconnected": 1}
+        loaded = stale = 0
+        try:
+            async for doc in col.find({}, projection):
+                system_uuid = doc.get("system_uuid")
+                if not system_uuid or system_uuid in self.agents:
+                    continue
+                status, node = doc.get("status") or "disconnected", doc.get("node")
+                if status == "connected" and not self._node_alive(node):
+                    status = "disconnected"
+                    stale += 1
+                self._apply(
+                    system_uuid, doc.get("org"), status, node,
+                    _utc(doc.get("connected_at")), _utc(doc.get("last_disconnected"))
+                )
+                loaded += 1
+            logger.info(f"inventory: loaded {loaded} agent(s) from '{AGENT_STATUS_COLLECTION}' ({stale} stale connection(s) dropped).")
+        except PyMongoError as e:
+            logger.error(f"inventory: failed to load agents, starting from live connections only: {e}")
+
+    @staticmethod
+    def _node_alive(node: Optional[str]) -> bool:
+        if node == CONFIG["NODE_ID"]:
+            return False  # this node just started; whatever it held before is gone
+        if cluster.enabled:
+            return node in cluster.ring.nodes
+        return True  # no membership to check against (single node, or sharding off)
+
+    def start(self):
+        if self._publisher is None:
+            self._closing = False
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def stop(self):
+        if self._publisher:
+            self._closing = True
+            await self._publisher
+            self._publisher = None
+        await self.publish()
+
+    # --- writes ----------------------------------------------------------
+
+    def mark_connected(self, system_uuid: str, org: str):
+        now = datetime.now(timezone.utc)
+        self._apply(system_uuid, org, "connected", CONFIG["NODE_ID"], connected_at=now)
+        self.outbox[system_uuid] = {"system_uuid": system_uuid, "org": org, "status": "connected", "at": now.timestamp()}
+
+    def mark_disconnected(self, system_uuid: str):
+        agent = self.agents.get(system_uuid)
+        if agent is None or agent.node not in (None, CONFIG["NODE_ID"]):
+            return  # the agent has reconnected to another node meanwhile
+        now = datetime.now(timezone.utc)
+        self._apply(system_uuid, agent.org, "disconnected", last_disconnected=now)
+        self.outbox[system_uuid] = {"system_uuid": system_uuid, "org": agent.org, "status": "disconnected", "at": now.timestamp()}
+
+    def _apply(self, system_uuid: str, org: str, status: str, node=None, connected_at=None, last_disconnected=None):
+        agent = self.agents.get(system_uuid)
+        if agent is None:
+            agent = self.agents[system_uuid] = _Agent(org, status, node, connected_at, last_disconnected)
+            for key in self._keys(org, status):
+                bisect.insort(self.index.setdefault(key, []), system_uuid)
+            return
+
+        if (agent.org, agent.status) != (org, status):
+            for key in self._keys(agent.org, agent.status):
+                self._remove(key, system_uuid)
+            for key in self._keys(org, status):
+                bisect.insort(self.index.setdefault(key, []), system_uuid)
+            agent.org, agent.status = org, status
+        if node is not None:
+            agent.node = node
+        if connected_at is not None:
+            agent.connected_at = connected_at
+        if last_disconnected is not None:
+            agent.last_disconnected = last_disconnected
+
+    @staticmethod
+    def _keys(org: str, status: str):
+        # the (None, None) list is the whole fleet
+        return ((org, status), (org, None), (None, status), (None, None))
+
+    def _remove(self, key, system_uuid: str):
+        members = self.index.get(key)
+        if not members:
+            return
+        i = bisect.bisect_left(members, system_uuid)
+        if i < len(members) and members[i] == system_uuid:
+            del members[i]
+            if not members:
+                del self.index[key]
+
+    # --- fan-out ---------------------------------------------------------
+
+    async def publish(self):
+        if not self.outbox:
+            return
+
+        batch, self.outbox = self.outbox, {}
+        body = msgpack.packb(
+            {"kind": "presence", "origin": CONFIG["NODE_ID"], "changes": list(batch.values())},
+            use_bin_type=True
+        )
+        try:
+            await rmq_manager_conn.publish_broadcast(body)
+        except Exception as e:
+            logger.error(f"inventory: failed to fan out {len(batch)} presence change(s): {e}")
+            for system_uuid, change in batch.items():
+                self.outbox.setdefault(system_uuid, change)
+
+    async def _publish_loop(self):
+        interval = CONFIG["AGENT_STATUS_FLUSH_INTERVAL"]
+        while not self._closing:
+            await asyncio.sleep(interval)
+            await self.publish()
+
+    async def on_presence(self, envelope: dict):
+        """
+        Presence changes fanned out by other nodes.
+        """
+        origin = envelope.get("origin")
+        if origin == CONFIG["NODE_ID"]:
+            return
+        for change in envelope.get("changes") or ():
+            at = datetime.fromtimestamp(change["at"], tz=timezone.utc)
+            agent = self.agents.get(change["system_uuid"])
+            if agent is not None:
+                last = agent.last_change()
+                if last is not None and at < last:
+                    continue  # older than what we have; flushed late by its node
+            if change["status"] == "connected":
+                self._apply(change["system_uuid"], change["org"], "connected", origin, connected_at=at)
+            elif agent is None or agent.node in (None, origin):
+                self._apply(change["system_uuid"], change["org"], "disconnected", last_disconnected=at)
+
+    # --- reads -----------------------------------------------------------
+
+    def count(self, org: Optional[str] = None, status: Optional[str] = None) -> int:
+        return len(self.index.get((org, status), ()))
+
+    def page(self, org: Optional[str] = None, status: Optional[str] = None, after: Optional[str] = None, limit: int = 100) -> dict:
+        """
+        Agents matching `org`/`status`, ordered by `system_uuid`, starting after `after`.
+        """
+        members = self.index.get((org, status), [])
+        start = bisect.bisect_right(members, after) if after else 0
+        uuids = members[start:start + limit]
+        return {
+            "total": len(members),
+            "agents": [self.agents[system_uuid].to_dict(system_uuid) for system_uuid in uuids],
+            "next": uuids[-1] if start + limit < len(members) else None
+        }
+
+# Singleton instance to use app-wide
+agent_inventory = AgentInventory()
@@ -0,0 +1,183 @@
+# server/comms/mongo_buffer.py
+
+"""
+Mongo write-behind buffer
+-x-x-
+Groups writes per collection and flushes them as a single `insert_many` /
+`bulk_write` round trip, either when a collection's batch fills up or when the
+flush interval elapses (whichever comes first).
+
+- Memory is bounded by `max_pending` operations (queued + in-flight). Producers
+  calling `add()` wait once the budget is exhausted, so a slow Mongo pushes back
+  on ingest instead of growing the buffer without limit.
+- `flush()` drains everything; it's called during the `lifespan` shutdown.
+- Writes that fail for good (bad documents, exhausted retries) are logged,
+  counted in `trex_mongo_buffer_dropped_total` and dropped; their budget is
+  always given back. A chunk holding a document BSON can't encode (e.g. an
+  agent-supplied int past 2^63) is split in halves until the bad documents are
+  isolated, so only those are dropped.
+"""
+
+import asyncio
+
+from collections import defaultdict
+from typing import Dict, List, Union
+from bson.errors import InvalidDocument
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, NetworkTimeout, PyMongoError
+
+from server.config import logger
+from server.metrics import registry
+
+DROPPED_WRITES = registry.counter(
+    "trex_mongo_buffer_dropped_total", "Buffered writes dropped after failing, per collection.", ["collection"]
+)
+
+# a plain document is queued as an insert; anything else must be a pymongo write op
+BufferedOp = Union[dict, InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany]
+
+class WriteBehindBuffer:
+    def __init__(self, db, max_batch: int, flush_interval: float, max_pending: int, max_retries: int = 3):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self.pending: Dict[str, List[BufferedOp]] = defaultdict(list)
+        self.pending_count = 0  # queued + in-flight ops, what the memory budget is charged against
+
+        self._space = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = None
+        self._closing = False
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def add(self, collection: str, op: BufferedOp):
+        """
+        Queue a document (insert) or a pymongo write op for `collection`.
+        Waits while the buffer is over its memory budget.
+        """
+        if self.pending_count >= self.max_pending:
+            logger.debug(f"mongo_buffer: budget of {self.max_pending} ops exhausted, applying backpressure")
+            async with self._space:
+                await self._space.wait_for(lambda: self.pending_count < self.max_pending)
+
+        batch = self.pending[collection]
+        batch.append(op)
+        self.pending_count += 1
+
+        if len(batch) >= self.max_batch:
+            self._wakeup.set()  # size limit hit; don't wait for the timer
+
+    async def add_many(self, collection: str, ops: List[BufferedOp]):
+        for op in ops:
+            await self.add(collection, op)
+
+    async def flush(self):
+        """
+        Write out everything currently queued.
+        """
+        async with self._flush_lock:
+            batches = {name: ops for name, ops in self.pending.items() if ops}
+            self.pending = defaultdict(list)
+            if batches:
+                await asyncio.gather(*(self._write_collection(name, ops) for name, ops in batches.items()))
+
+    async def stop(self):
+        """
+        Stop the background flusher and do a final flush.
+        """
+        if self._flusher:
+            # let an in-flight flush finish instead of cancelling it mid-write
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+
+        await self.flush()
+        logger.info("mongo_buffer: final flush complete.")
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"mongo_buffer: flush failed: {e}")
+
+    async def _write_collection(self, name: str, ops: List[BufferedOp]):
+        collection = self.db[name]
+        released = 0
+        try:
+            for start in range(0, len(ops), self.max_batch):
+                chunk = ops[start:start + self.max_batch]
+                try:
+                    await self._write_chunk(collection, chunk)
+                except Exception as e:
+                    # e.g. bson.errors.InvalidDocument; one bad chunk must not take the rest down
+                    logger.error(f"mongo_buffer: dropping {len(chunk)} writes to '{name}': {e!r}")
+                    DROPPED_WRITES.labels(name).inc(len(chunk))
+                await self._release(len(chunk))
+                released += len(chunk)
+        finally:
+            if released < len(ops):
+                await self._release(len(ops) - released)
+
+    async def _write_chunk(self, collection, chunk: List[BufferedOp]):
+        attempt = 0
+        while True:
+            try:
+                if all(isinstance(op, dict) for op in chunk):
+                    await collection.insert_many(chunk, ordered=False)
+                else:
+                    await collection.bulk_write(
+                        [InsertOne(op) if isinstance(op, dict) else op for op in chunk],
+                        ordered=False
+                    )
+                return
+
+            except BulkWriteError as e:
+                # unordered writes: everything but the failed ops went through
+                errors = e.details.get("writeErrors", [])
+                logger.warning(f"mongo_buffer: {len(errors)}/{len(chunk)} writes to '{collection.name}' failed")
+                DROPPED_WRITES.labels(collection.name).inc(len(errors))
+                return
+
+            except (InvalidDocument, OverflowError) as e:
+                # raised while encoding, before anything was sent; isolate the offending op(s)
+                if len(chunk) == 1:
+                    logger.warning(f"mongo_buffer: dropping a write to '{collection.name}' BSON can't encode: {e!r}")
+                    DROPPED_WRITES.labels(collection.name).inc()
+                    return
+                mid = len(chunk) // 2
+                await self._write_chunk(collection, chunk[:mid])
+                await self._write_chunk(collection, chunk[mid:])
+                return
+
+            except (AutoReconnect, NetworkTimeout) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"mongo_buffer: dropping {len(chunk)} writes to '{collection.name}' after {self.max_retries} retries: {e}")
+                    DROPPED_WRITES.labels(collection.name).inc(len(chunk))
+                    return
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+
+            except PyMongoError as e:
+                logger.error(f"mongo_buffer: dropping {len(chunk)} writes to '{collection.name}': {e}")
+                DROPPED_WRITES.labels(collection.name).inc(len(chunk))
+                return
+
+    async def _release(self, count: int):
+        self.pending_count -= count
+        async with self._space:
+            self._space.notify_all()
@@ -1,10 +1,36 @@
 # server/comms/mongo_manager.py
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 from pymongo.errors import PyMongoError
 import asyncio
 
 from server.config import CONFIG, logger
+from server.comms.mongo_buffer import WriteBehindBuffer, BufferedOp
+from server.metrics import registry
+
+MONGO_COMMAND_SECONDS = registry.histogram(
+    "trex_mongo_command_seconds", "Round trip of Mongo commands, as measured by the driver.", ["command"]
+)
+MONGO_COMMAND_FAILURES = registry.counter(
+    "trex_mongo_command_failures_total", "Mongo commands that returned an error.", ["command"]
+)
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Driver-level command listener: times every command the client sends (direct
+    calls and write-behind flushes alike) without wrapping each call site.
+    Runs on the driver's threads, not the event loop.
+    """
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name).inc()
 
 class MongoManager:
     _instance = None
@@ -19,11 +45,12 @@ class MongoManager:
             self.client = None
             self.db = None
             self.connected = False
+            self.buffer = None  # write-behind buffer, created once connected
             self.initialized = True
 
     async def connect_to_mongo(self):
         try:
-            self.client = AsyncIOMotorClient(CONFIG["MONGO_URL"])
+            self.client = AsyncIOMotorClient(CONFIG["MONGO_URL"], event_listeners=[CommandMetrics()])
             self.db = self.client[CONFIG["MONGO_ROOT_DB"]]
 
             # Force early connection validation with timeout
@@ -32,6 +59,14 @@ class MongoManager:
             self.connected = True
             logger.info("mongo_manager: connected to MongoDB successfully.")
 
+            self.buffer = WriteBehindBuffer(
+                self.db,
+                max_batch=CONFIG["MONGO_BUFFER_MAX_BATCH"],
+                flush_interval=CONFIG["MONGO_BUFFER_FLUSH_INTERVAL"],
+                max_pending=CONFIG["MONGO_BUFFER_MAX_PENDING"]
+            )
+            self.buffer.start()
+
         except (PyMongoError, asyncio.TimeoutError) as e:
             self.connected = False
             logger.error(f"mongo_manager: failed to connect to MongoDB: {e}")
@@ -42,9 +77,31 @@ class MongoManager:
             raise RuntimeError("mongo_manager: Database not initialized. Did you forget to call connect_to_mongo()?")
 
         return self.db
+
+    async def buffered_write(self, collection: str, op: BufferedOp):
+        """
+        Queue a document (insert) or a pymongo write op through the write-behind buffer.
+        Waits only when the buffer is over its memory budget.
+        """
+        if self.buffer is None:
+            raise RuntimeError("mongo_manager: write buffer not initialized. Did you forget to call connect_to_mongo()?")
+
+        await self.buffer.add(collection, op)
+
+    async def flush(self):
+        """
+        Drain the write-behind buffer; called during shutdown before the client is closed.
+        """
+        if self.buffer:
+            try:
+                await self.buffer.stop()
+            except Exception as e:
+                logger.warning(f"mongo_manager: failed to flush write buffer: {e}")
+            self.buffer = None
     
     async def close(self):
         try:
+            await self.flush()
             if self.client:
                 self.client.close()
                 logger.info("mongo_manager: MongoDB connection closed.")
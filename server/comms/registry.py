@@ -0,0 +1,91 @@
+# server/comms/registry.py
+
+"""
+Connection registry
+-x-x-
+Maps `system_uuid` -> the node (uvicorn worker / server instance) that holds the
+agent's websocket, so any worker can reach any agent.
+
+- local : in-process dict; the stand-in for single-node, single-worker deployments.
+- mongo : shared `connection_registry` collection; use with `uvicorn --workers N`
+          or several servers behind a load balancer.
+
+Messages for agents held elsewhere are routed to the owning node over RabbitMQ
+(see `RMQManager.setup_node_routing`).
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from pymongo.errors import PyMongoError
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+
+REGISTRY_COLLECTION = "connection_registry"
+
+class LocalConnectionRegistry:
+    """
+    Single-node stand-in; every agent lives on this node.
+    """
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.nodes: Dict[str, str] = {}
+
+    async def register(self, system_uuid: str, org: str):
+        self.nodes[system_uuid] = self.node_id
+
+    async def unregister(self, system_uuid: str):
+        self.nodes.pop(system_uuid, None)
+
+    async def lookup(self, system_uuid: str) -> Optional[str]:
+        return self.nodes.get(system_uuid)
+
+    async def clear_node(self):
+        self.nodes.clear()
+
+class MongoConnectionRegistry:
+    """
+    Registry shared by every worker/node through Mongo.
+    """
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+
+    def _col(self):
+        return mongo_manager_conn.get_db()[REGISTRY_COLLECTION]
+
+    async def register(self, system_uuid: str, org: str):
+        # last writer wins; an agent reconnecting to another node simply moves
+        await self._col().update_one(
+            {"_id": system_uuid},
+            {"$set": {"node_id": self.node_id, "org": org, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def unregister(self, system_uuid: str):
+        # only drop the entry if it still points here (the agent may have moved already)
+        await self._col().delete_one({"_id": system_uuid, "node_id": self.node_id})
+
+    async def lookup(self, system_uuid: str) -> Optional[str]:
+        doc = await self._col().find_one({"_id": system_uuid}, {"node_id": 1})
+        return doc["node_id"] if doc else None
+
+    async def clear_node(self):
+        try:
+            result = await self._col().delete_many({"node_id": self.node_id})
+            logger.info(f"registry: cleared {result.deleted_count} entries for node {self.node_id}")
+        except PyMongoError as e:
+            logger.warning(f"registry: failed to clear entries for node {self.node_id}: {e}")
+
+def build_registry(backend: str, node_id: str):
+    registries = {
+        "local": LocalConnectionRegistry,
+        "mongo": MongoConnectionRegistry,
+    }
+    registry_cls = registries.get(backend)
+    if registry_cls is None:
+        logger.warning(f"registry: unknown backend '{backend}', falling back to 'local'")
+        registry_cls = LocalConnectionRegistry
+    return registry_cls(node_id)
+
+# app-wide registry (backend picked from config)
+connection_registry = build_registry(CONFIG["CONNECTION_REGISTRY"], CONFIG["NODE_ID"])
@@ -6,11 +6,73 @@ RMQ Manager
 This module follows the Singleton design pattern to manage the RabbitMQ connection.
 Only a single instance of the RMQManager class is created, ensuring that the RabbitMQ
 connection is shared app-wide and reused throughout the application.
+
+Publishing goes through a pool of confirm-enabled channels per logical group
+("action", "telemetry", "filestream"). Publishes are spread round-robin across
+the pool and their broker confirms are awaited together, so concurrent
+publishers no longer serialize behind a single channel.
 """
 
+import time
+import asyncio
+import itertools
 import aio_pika
 
+from pamqp.commands import Basic
+from typing import Dict, List, Union
+
 from server.config import CONFIG, logger
+from server.metrics import registry
+
+LOGICAL_GROUPS = ("action", "telemetry", "filestream")
+
+RMQ_PUBLISH_SECONDS = registry.histogram(
+    "trex_rmq_publish_seconds", "RabbitMQ publish latency, including the broker confirm for pooled groups.", ["group"]
+)
+RMQ_PUBLISH_FAILURES = registry.counter(
+    "trex_rmq_publish_failures_total", "RabbitMQ publishes that failed or were nacked.", ["group"]
+)
+
+class ChannelPool:
+    """
+    Round-robin pool of publisher-confirm channels for one logical group.
+    `max_inflight` bounds unconfirmed publishes across the whole pool.
+    """
+    def __init__(self, name: str, channels: list, max_inflight: int):
+        self.name = name
+        self.channels = channels
+        self._cursor = itertools.cycle(channels)
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._exchanges: Dict[tuple, aio_pika.abc.AbstractExchange] = {}
+        self._latency = RMQ_PUBLISH_SECONDS.labels(name)
+        self._failures = RMQ_PUBLISH_FAILURES.labels(name)
+
+    async def exchange(self, exchange_name: str = ""):
+        channel = next(self._cursor)
+        if not exchange_name:
+            return channel.default_exchange
+
+        key = (id(channel), exchange_name)
+        exchange = self._exchanges.get(key)
+        if exchange is None:
+            # the exchange is declared by whoever owns it; just bind a handle to this channel
+            exchange = await channel.get_exchange(exchange_name, ensure=False)
+            self._exchanges[key] = exchange
+        return exchange
+
+    async def publish(self, exchange, message: aio_pika.Message, routing_key: str):
+        async with self._inflight:
+            started = time.perf_counter()
+            try:
+                result = await exchange.publish(message, routing_key=routing_key)
+            except Exception:
+                self._failures.inc()
+                raise
+            finally:
+                self._latency.observe(time.perf_counter() - started)
+            if isinstance(result, Basic.Nack):
+                self._failures.inc()
+            return result
 
 class RMQManager:
     _instance = None
@@ -25,6 +87,9 @@ class RMQManager:
             self.rabbit_connection = None
             self.channels = {}  # Replaces the old self.channel
             self.queues = {}
+            self.pools: Dict[str, ChannelPool] = {}  # publisher channel pools per logical group
+            self.route_exchange = None  # node-to-node routing (see setup_node_routing)
+            self.broadcast_exchange = None  # fan-out to every node
             self.rabbit_connected = False
             self.initialized = True
 
@@ -44,11 +109,14 @@ class RMQManager:
             channel = rmq_manager.get_channel("telemetry")
             queue = await channel.declare_queue("some_telemetry_queue", durable=True)
             """
-            self.channels = {
-                "action": await self.rabbit_connection.channel(),
-                "telemetry": await self.rabbit_connection.channel(),
-                "filestream": await self.rabbit_connection.channel()
-            }
+            pool_size = max(1, CONFIG["RMQ_CHANNEL_POOL_SIZE"])
+            for group in LOGICAL_GROUPS:
+                channels = [
+                    await self.rabbit_connection.channel(publisher_confirms=True)
+                    for _ in range(pool_size)
+                ]
+                self.pools[group] = ChannelPool(group, channels, CONFIG["RMQ_MAX_INFLIGHT_PUBLISHES"])
+                self.channels[group] = channels[0]  # consumers & declarations keep using one channel per group
 
             self.rabbit_connected = True
             logger.info("rmq_manager_conn: connected to RabbitMQ and initialized logical channels.")
@@ -58,6 +126,137 @@ class RMQManager:
             logger.error(f"rmq_manager_conn: failed to connect to RabbitMQ: {e}")
             raise RuntimeError("rmq_manager_conn: rabbitMQ connection failed. Shutting down.")
 
+    async def setup_node_routing(self, node_id: str, on_message):
+        """
+        Cross-worker routing: every node consumes its own exclusive queue bound to a
+        direct exchange under its `node_id`, so any worker can hand a message to the
+        node that holds a given agent's websocket.
+        """
+        try:
+            channel = await self.rabbit_connection.channel()
+            self.channels["route"] = channel
+
+            self.route_exchange = await channel.declare_exchange(
+                CONFIG["RMQ_ROUTE_EXCHANGE"], aio_pika.ExchangeType.DIRECT
+            )
+            queue = await channel.declare_queue(
+                f"{CONFIG['RMQ_ROUTE_EXCHANGE']}.{node_id}", exclusive=True, auto_delete=True
+            )
+            await queue.bind(self.route_exchange, routing_key=node_id)
+
+            # the same queue also receives fleet/org-wide broadcasts addressed to every node
+            self.broadcast_exchange = await channel.declare_exchange(
+                CONFIG["RMQ_BROADCAST_EXCHANGE"], aio_pika.ExchangeType.FANOUT
+            )
+            await queue.bind(self.broadcast_exchange)
+            await queue.consume(on_message, no_ack=True)  # best-effort, like a direct ws send
+            self.queues["route"] = queue
+
+            logger.info(f"rmq_manager_conn: node routing ready for node '{node_id}'.")
+
+        except Exception as e:
+            logger.error(f"rmq_manager_conn: failed to set up node routing: {e}")
+            raise RuntimeError("rmq_manager_conn: node routing setup failed. Shutting down.")
+
+    async def consume_actions(self, on_message):
+        """
+        Consume the action task queue on a dedicated channel. `RMQ_ACTION_PREFETCH` bounds
+        the unacked tasks the broker hands this node, i.e. how many run concurrently.
+        Messages are acked/nacked by `on_message`'s owner.
+        """
+        try:
+            channel = await self.rabbit_connection.channel()
+            await channel.set_qos(prefetch_count=CONFIG["RMQ_ACTION_PREFETCH"])
+            self.channels["action_consumer"] = channel
+
+            queue = await channel.declare_queue(CONFIG["RMQ_ACTION_QUEUE"], durable=True)
+            await channel.declare_queue(CONFIG["RMQ_ACTION_REPLY_QUEUE"], durable=True)
+            await queue.consume(on_message, no_ack=False)
+            self.queues["action"] = queue
+
+            logger.info(f"rmq_manager_conn: consuming '{CONFIG['RMQ_ACTION_QUEUE']}' (prefetch {CONFIG['RMQ_ACTION_PREFETCH']}).")
+
+        except Exception as e:
+            logger.error(f"rmq_manager_conn: failed to set up the action consumer: {e}")
+            raise RuntimeError("rmq_manager_conn: action consumer setup failed. Shutting down.")
+
+    async def publish_to_node(self, node_id: str, body: bytes):
+        if self.route_exchange is None:
+            raise RuntimeError("rmq_manager_conn: node routing not initialized. Did you forget to call setup_node_routing()?")
+
+        started = time.perf_counter()
+        try:
+            await self.route_exchange.publish(aio_pika.Message(body=body), routing_key=node_id)
+        except Exception:
+            RMQ_PUBLISH_FAILURES.labels("route").inc()
+            raise
+        finally:
+            RMQ_PUBLISH_SECONDS.labels("route").observe(time.perf_counter() - started)
+
+    async def publish(
+        self,
+        group: str,
+        routing_key: str,
+        body: Union[bytes, aio_pika.Message],
+        exchange_name: str = "",
+        **message_kwargs
+    ):
+        """
+        Publish a single message through the group's channel pool and wait for its confirm.
+        `message_kwargs` (headers, correlation_id, reply_to, ...) are passed to `aio_pika.Message`.
+        """
+        await self.publish_many(group, routing_key, [body], exchange_name, **message_kwargs)
+
+    async def publish_many(
+        self,
+        group: str,
+        routing_key: str,
+        bodies: List[Union[bytes, aio_pika.Message]],
+        exchange_name: str = "",
+        **message_kwargs
+    ):
+        """
+        Publish many messages in one call. All frames go out back to back on one pooled
+        channel and the broker confirms are awaited together rather than one by one.
+        Raises if any message was nacked or failed to publish.
+        """
+        pool = self.pools.get(group)
+        if pool is None:
+            raise RuntimeError(f"rmq_manager_conn: no publisher pool for group '{group}'. Did you forget to call connect_to_rabbit()?")
+
+        exchange = await pool.exchange(exchange_name)
+        messages = [
+            body if isinstance(body, aio_pika.Message) else aio_pika.Message(body=body, **message_kwargs)
+            for body in bodies
+        ]
+
+        results = await asyncio.gather(
+            *(pool.publish(exchange, message, routing_key) for message in messages),
+            return_exceptions=True
+        )
+
+        failures = [result for result in results if isinstance(result, BaseException)]
+        nacks = sum(1 for result in results if isinstance(result, Basic.Nack))
+        if failures:
+            logger.error(f"rmq_manager_conn: {len(failures)}/{len(messages)} publishes to '{group}' failed: {failures[0]}")
+            raise failures[0]
+        if nacks:
+            logger.error(f"rmq_manager_conn: broker nacked {nacks}/{len(messages)} publishes to '{group}'")
+            raise RuntimeError(f"rmq_manager_conn: broker nacked {nacks} message(s)")
+
+    async def publish_broadcast(self, body: bytes):
+        if self.broadcast_exchange is None:
+            raise RuntimeError("rmq_manager_conn: node routing not initialized. Did you forget to call setup_node_routing()?")
+
+        started = time.perf_counter()
+        try:
+            await self.broadcast_exchange.publish(aio_pika.Message(body=body), routing_key="")
+        except Exception:
+            RMQ_PUBLISH_FAILURES.labels("broadcast").inc()
+            raise
+        finally:
+            RMQ_PUBLISH_SECONDS.labels("broadcast").observe(time.perf_counter() - started)
+
     def get_channel(self, name: str):
         channel = self.channels.get(name)
         if not channel:
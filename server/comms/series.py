@@ -0,0 +1,62 @@
+# server/comms/series.py
+
+"""
+Telemetry series decoding
+-x-x-
+Agents batch their collector samples into columnar `telemetry.series` records
+(see client/utils/telemetry.py):
+
+    {"collector": "system.load", "keys": ["1m", "5m", "15m"], "delta": [1, 1, 1],
+     "ts": [t0_ms, +dt, +dt...], "rows": [[v...], [+dv...], ...]}
+
+- `ts` holds the first timestamp (ms) followed by deltas.
+- Columns flagged in `delta` hold the first value followed by deltas; the rest
+  are stored as-is.
+- A record is self-contained (its first row is always absolute).
+- The payload is decoded into `Series` with the envelope, so a record with the
+  wrong field types never reaches `decode_series`.
+"""
+
+import msgspec
+
+from typing import Any, List
+
+SERIES_RECORD = "telemetry.series"
+
+class Series(msgspec.Struct, gc=False):
+    collector: str
+    keys: List[str]
+    delta: List[int]  # 1: the column is delta encoded
+    ts: List[float]   # ms: the first timestamp, then deltas
+    rows: List[List[Any]]
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def decode_series(series: Series) -> List[dict]:
+    """
+    Expand one series payload into per-sample dicts: {"collector", "ts" (unix seconds), "values"}.
+    Field types are checked by the schema when the envelope is decoded; raises ValueError
+    when the columns don't line up.
+    """
+    keys, delta = series.keys, series.delta
+    if len(series.ts) != len(series.rows) or len(delta) != len(keys):
+        raise ValueError("malformed series payload: column lengths differ")
+
+    samples = []
+    t = 0
+    previous = [0] * len(keys)
+    for n, (dt, row) in enumerate(zip(series.ts, series.rows)):
+        if len(row) != len(keys):
+            raise ValueError(f"malformed series payload: row {n} doesn't match keys")
+        t = dt if n == 0 else t + dt
+        values = {}
+        for i, (key, value) in enumerate(zip(keys, row)):
+            if delta[i]:
+                if not _is_number(value):
+                    raise ValueError(f"malformed series payload: non-numeric value in delta column '{key}'")
+                value = value if n == 0 else previous[i] + value
+                previous[i] = value
+            values[key] = value
+        samples.append({"collector": series.collector, "ts": t / 1000, "values": values})
+    return samples
@@ -0,0 +1,72 @@
+# server/comms/timer_wheel.py
+
+"""
+Hashed timer wheel
+-x-x-
+One task drives every per-connection timeout: a ring of `slots` buckets,
+advanced one bucket every `tick` seconds. Scheduling and cancelling are a set
+add/discard, and a tick only touches the keys that fall due in it, so 50k
+connections cost 50k set entries and one sleeping task rather than 50k timers.
+
+- Delays are rounded up to whole ticks. Delays longer than the wheel's span
+  (`tick * slots`) fire early, after one full turn; `on_expire` is expected to
+  check its own deadline and reschedule, which it has to do anyway for timers that
+  are only pushed back lazily.
+- `on_expire(key)` is called synchronously from the wheel task; it must not block.
+"""
+
+import asyncio
+import math
+
+from typing import Callable, Hashable, List, Set
+
+from server.config import logger
+
+class TimerWheel:
+    def __init__(self, tick: float, slots: int, on_expire: Callable[[Hashable], None]):
+        self.tick = tick
+        self.slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self.on_expire = on_expire
+        self.cursor = 0  # slot that fires on the next tick
+        self._task = None
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, key: Hashable, delay: float) -> int:
+        """
+        Fire `key` after about `delay` seconds. Returns the slot to pass to `cancel()`.
+        """
+        ticks = min(max(math.ceil(delay / self.tick), 1), len(self.slots))
+        slot = (self.cursor + ticks - 1) % len(self.slots)
+        self.slots[slot].add(key)
+        return slot
+
+    def cancel(self, key: Hashable, slot: int):
+        self.slots[slot].discard(key)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            next_tick += self.tick
+
+            due = self.slots[self.cursor]
+            self.slots[self.cursor] = set()
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            for key in due:
+                try:
+                    self.on_expire(key)
+                except Exception as e:
+                    logger.error(f"timer_wheel: expiry callback failed for {key}: {e}")
@@ -0,0 +1,268 @@
+# server/comms/timeseries.py
+
+"""
+Telemetry store
+-x-x-
+Raw samples go into a Mongo time-series collection (`telemetry`, meta field
+{system_uuid, org, collector}) through the write-behind buffer. Alongside, every
+numeric value is folded into 1-minute and 1-hour rollups (count/sum/min/max per
+bucket):
+
+- Rollups are accumulated in memory and merged into `telemetry_1m` / `telemetry_1h`
+  every `TELEMETRY_ROLLUP_FLUSH_INTERVAL` seconds with `$inc`/`$min`/`$max` upserts,
+  so they stay correct with many server nodes writing the same bucket and never
+  need a rescan of the raw samples.
+- `query()` picks its resolution from the range and the point budget before
+  reading anything: raw samples only when the points are finer than a minute (and
+  the samples fit the budget), otherwise the finest rollup that does (merging
+  hourly buckets further when even those are too many), so a dashboard over
+  months reads a few hundred docs.
+- A sample whose `ts` isn't a usable unix timestamp is skipped on its own.
+"""
+
+import asyncio
+import math
+import msgspec
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from server.config import CONFIG, logger
+from server.comms.mongo_manager import mongo_manager_conn
+
+TELEMETRY_COLLECTION = "telemetry"
+
+class Telemetry(msgspec.Struct, gc=False):
+    """
+    Payload of a single-sample `telemetry` record; the sample's time is the envelope's `ts`.
+    """
+    collector: str = "telemetry"
+    values: Dict[str, Any] = {}
+
+# resolution -> (bucket seconds, collection)
+ROLLUPS = {
+    "1m": (60, "telemetry_1m"),
+    "1h": (3600, "telemetry_1h"),
+}
+
+def _field(key: str) -> str:
+    # value names become update paths; keep them free of '.' and a leading '$'
+    return str(key).replace(".", "_").lstrip("$") or "_"
+
+def _utc(value: datetime) -> datetime:
+    # motor hands back naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+class _Bucket:
+    __slots__ = ("org", "count", "sum", "min", "max")
+
+    def __init__(self, org: str):
+        self.org = org
+        self.count: Dict[str, int] = {}
+        self.sum: Dict[str, float] = {}
+        self.min: Dict[str, float] = {}
+        self.max: Dict[str, float] = {}
+
+    def add(self, key: str, value: float):
+        if key in self.count:
+            self.count[key] += 1
+            self.sum[key] += value
+            self.min[key] = min(self.min[key], value)
+            self.max[key] = max(self.max[key], value)
+        else:
+            self.count[key], self.sum[key], self.min[key], self.max[key] = 1, value, value, value
+
+class TelemetryStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(TelemetryStore, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            # (resolution, system_uuid, collector, bucket start) -> aggregates not yet merged into Mongo
+            self.pending: Dict[Tuple[str, str, str, int], _Bucket] = {}
+            self._flusher = None
+            self._closing = False
+            self._wakeup = asyncio.Event()  # set by stop() to cut the flush interval short
+            self.initialized = True
+
+    async def ensure_collections(self):
+        db = mongo_manager_conn.get_db()
+        try:
+            if TELEMETRY_COLLECTION not in await db.list_collection_names():
+                options = {"timeseries": {"timeField": "ts", "metaField": "meta", "granularity": "seconds"}}
+                if CONFIG["TELEMETRY_RAW_TTL_DAYS"]:
+                    options["expireAfterSeconds"] = int(CONFIG["TELEMETRY_RAW_TTL_DAYS"] * 86400)
+                await db.create_collection(TELEMETRY_COLLECTION, **options)
+                logger.info(f"timeseries: created time-series collection '{TELEMETRY_COLLECTION}'.")
+
+            await db[TELEMETRY_COLLECTION].create_index(
+                [("meta.system_uuid", ASCENDING), ("meta.collector", ASCENDING), ("ts", ASCENDING)],
+                name="agent_collector_ts"
+            )
+            for _, collection in ROLLUPS.values():
+                await db[collection].create_index(
+                    [("system_uuid", ASCENDING), ("collector", ASCENDING), ("bucket", ASCENDING)],
+                    unique=True, name="agent_collector_bucket"
+                )
+                await db[collection].create_index([("org", ASCENDING), ("bucket", ASCENDING)], name="org_bucket")
+            logger.info("timeseries: ensured telemetry collections & indexes.")
+        except PyMongoError as e:
+            logger.error(f"timeseries: failed to set up telemetry collections: {e}")
+
+    def start(self):
+        if self._flusher is None:
+            self._closing = False
+            self._wakeup.clear()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """
+        Stop the flusher and hand whatever is still pending to the write buffer.
+        """
+        if self._flusher:
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    async def add(self, system_uuid: str, org: str, collector: str, ts: float, values: dict, received_at: datetime):
+        """
+        Store one sample (`ts` in unix seconds) and fold its numeric values into the rollups.
+        """
+        try:
+            at = datetime.fromtimestamp(ts, tz=timezone.utc)
+        except (TypeError, ValueError, OverflowError, OSError) as e:
+            logger.debug(f"timeseries: skipping {collector} sample from {system_uuid} with bad ts {ts!r}: {e}")
+            return
+
+        doc = {
+            "ts": at,
+            "meta": {"system_uuid": system_uuid, "org": org, "collector": collector},
+            "values": values,
+            "received_at": received_at
+        }
+        await mongo_manager_conn.buffered_write(TELEMETRY_COLLECTION, doc)
+
+        numeric = [(_field(key), value) for key, value in values.items() if _is_number(value)]
+        if not numeric:
+            return
+        for resolution, (seconds, _) in ROLLUPS.items():
+            key = (resolution, system_uuid, collector, int(ts // seconds * seconds))
+            bucket = self.pending.get(key)
+            if bucket is None:
+                bucket = self.pending[key] = _Bucket(org)
+            for name, value in numeric:
+                bucket.add(name, value)
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        for (resolution, system_uuid, collector, start), bucket in batch.items():
+            update = {
+                "$set": {"org": bucket.org},
+                "$inc": {
+                    **{f"count.{k}": v for k, v in bucket.count.items()},
+                    **{f"sum.{k}": v for k, v in bucket.sum.items()}
+                },
+                "$min": {f"min.{k}": v for k, v in bucket.min.items()},
+                "$max": {f"max.{k}": v for k, v in bucket.max.items()}
+            }
+            op = UpdateOne(
+                {"system_uuid": system_uuid, "collector": collector, "bucket": datetime.fromtimestamp(start, tz=timezone.utc)},
+                update,
+                upsert=True
+            )
+            await mongo_manager_conn.buffered_write(ROLLUPS[resolution][1], op)
+        logger.debug(f"timeseries: merged {len(batch)} rollup bucket(s).")
+
+    async def _flush_loop(self):
+        interval = CONFIG["TELEMETRY_ROLLUP_FLUSH_INTERVAL"]
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._closing:
+                break  # stop() does the final flush
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"timeseries: rollup flush failed: {e}")
+
+    # --- reads -----------------------------------------------------------
+
+    async def query(self, system_uuid: str, collector: str, start: datetime, end: datetime, points: int) -> dict:
+        """
+        Samples of one agent's collector in [start, end), at most `points` of them,
+        from the finest resolution that fits.
+        """
+        db = mongo_manager_conn.get_db()
+        start, end = _utc(start), _utc(end)
+
+        span = (end - start).total_seconds()
+        if span / points < ROLLUPS["1m"][0]:
+            # sub-minute points: raw samples, if there are few enough (at most points + 1 docs read);
+            # otherwise the 1m rollup, which fits since span < points minutes
+            cursor = db[TELEMETRY_COLLECTION].find(
+                {"meta.system_uuid": system_uuid, "meta.collector": collector, "ts": {"$gte": start, "$lt": end}},
+                {"_id": 0, "ts": 1, "values": 1}
+            ).sort("ts", ASCENDING).limit(points + 1)
+            raw = await cursor.to_list(length=points + 1)
+            if len(raw) <= points:
+                return {"resolution": "raw", "points": [{"ts": _utc(doc["ts"]).isoformat(), "values": doc["values"]} for doc in raw]}
+
+        for resolution, (seconds, collection) in ROLLUPS.items():
+            step = max(math.ceil(span / seconds / points), 1)  # buckets merged per returned point
+            if step > 1 and resolution != "1h":
+                continue  # too many buckets; try a coarser rollup
+
+            # include the bucket `start` falls into
+            first = datetime.fromtimestamp(start.timestamp() // seconds * seconds, tz=timezone.utc)
+            cursor = db[collection].find(
+                {"system_uuid": system_uuid, "collector": collector, "bucket": {"$gte": first, "$lt": end}},
+                {"_id": 0, "bucket": 1, "count": 1, "sum": 1, "min": 1, "max": 1}
+            ).sort("bucket", ASCENDING)
+            buckets = await cursor.to_list(length=None)
+            name = resolution if step == 1 else f"{step}x{resolution}"
+            return {"resolution": name, "points": self._merge(buckets, first, seconds * step)}
+
+    @staticmethod
+    def _merge(buckets: List[dict], start: datetime, width: float) -> List[dict]:
+        """Merge rollup buckets into `width`-second windows aligned on `start`."""
+        windows: Dict[int, Dict[str, dict]] = {}
+        for doc in buckets:
+            window = windows.setdefault(int((_utc(doc["bucket"]) - start).total_seconds() // width), {})
+            for key, count in (doc.get("count") or {}).items():
+                v = window.get(key)
+                if v is None:
+                    v = window[key] = {"count": 0, "sum": 0, "min": math.inf, "max": -math.inf}
+                v["count"] += count
+                v["sum"] += doc["sum"][key]
+                v["min"] = min(v["min"], doc["min"][key])
+                v["max"] = max(v["max"], doc["max"][key])
+
+        return [
+            {
+                "ts": datetime.fromtimestamp(start.timestamp() + n * width, tz=timezone.utc).isoformat(),
+                "values": {
+                    key: {"avg": v["sum"] / v["count"], "min": v["min"], "max": v["max"], "count": v["count"]}
+                    for key, v in window.items() if v["count"]
+                }
+            }
+            for n, window in sorted(windows.items())
+        ]
+
+# Singleton instance to use app-wide
+telemetry_store = TelemetryStore()
@@ -1,13 +1,63 @@
-import sys
+import json
+import time
+import asyncio
+import logging
+import msgpack
 
-from typing import Dict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
 from fastapi import WebSocket, WebSocketDisconnect
-from datetime import datetime, timezone
 
-from server.config import CONFIG, logger
+from server.config import CONFIG, logger, clear_console_line
+from server.comms.framing import (
+    PROTO_BINARY,
+    PROTO_TEXT,
+    BINARY_SUBPROTOCOL,
+    FrameError,
+    decode_frame,
+    encode_frame
+)
+from server.comms.envelope import Envelope, envelope_codec
+from server.comms.ingest import ingest_pipeline
+from server.comms.registry import connection_registry
+from server.comms.rmq_manager import rmq_manager_conn
+from server.comms.timer_wheel import TimerWheel
+from server.metrics import registry
 
 # mongo setup
-from server.comms.mongo_manager import mongo_manager_conn
+from server.comms.agent_status import agent_status_writer
+from server.comms.inventory import agent_inventory
+
+WS_FRAMES = registry.counter("trex_ws_frames_received_total", "Websocket frames received from agents.", ["protocol"])
+WS_BYTES = registry.counter(
+    "trex_ws_bytes_received_total", "Websocket payload received from agents (bytes, or characters for text frames).", ["protocol"]
+)
+WS_RECORDS = registry.counter("trex_ws_records_received_total", "Records decoded from agent frames.", ["protocol"])
+WS_IDLE_CLOSED = registry.counter("trex_ws_idle_closed_total", "Connections closed for not answering a heartbeat ping.")
+
+HEARTBEAT_PING = {"type": "heartbeat.ping"}
+
+class _Connection:
+    """
+    Everything the server keeps per connected agent; one slotted object instead of
+    a dict entry per attribute.
+    """
+    __slots__ = (
+        "websocket", "org", "protocol", "connected_at", "last_seen", "pinged_at",
+        "timer_slot", "last_seq", "frames_in", "records_in", "bytes_in"
+    )
+
+    def __init__(self, websocket: WebSocket, org: str, protocol: str, now: float):
+        self.websocket = websocket
+        self.org = org
+        self.protocol = protocol
+        self.connected_at = now  # time.monotonic()
+        self.last_seen = now  # last frame received
+        self.pinged_at = 0.0  # heartbeat ping still unanswered since (0: none)
+        self.timer_slot = -1  # heartbeat wheel slot
+        self.last_seq = 0  # highest record `seq` the agent sent
+        self.frames_in = 0
+        self.records_in = 0
+        self.bytes_in = 0
 
 class WSManager:
     _instance = None  # Singleton instance
@@ -19,75 +69,384 @@ class WSManager:
 
     def __init__(self):
         if not hasattr(self, 'initialized'):
-            self.active_connections: Dict[str, WebSocket] = {}
+            self.connections: Dict[str, _Connection] = {}  # system_uuid -> connection record
+            # idle connections are pinged, then dropped; one wheel drives every connection's timer
+            self.heartbeat = TimerWheel(CONFIG["WS_HEARTBEAT_TICK"], CONFIG["WS_HEARTBEAT_SLOTS"], self._on_heartbeat)
+            self.org_members: Dict[str, Set[str]] = {}  # org -> connected system_uuids
+            # record type -> handler run inline on the receive loop (bypasses the ingest queues);
+            # types without one are queued for ingest
+            self.control_handlers: Dict[str, Callable[[str, Envelope], Awaitable[None]]] = {}
+            # routed message kind -> handler for envelopes other nodes address to this one
+            self.routed_handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
             self.initialized = True
 
-    async def connect(self, websocket: WebSocket, system_uuid: str, org: str):
-        await websocket.accept()
-        self.active_connections[system_uuid] = websocket
-        logger.info(f"ws_manager_conn: '{org}' - {system_uuid} connected")
-        await self._log_connection(system_uuid, org)
-
-    async def disconnect(self, system_uuid: str):
-        websocket = self.active_connections.pop(system_uuid, None)
-        if websocket:
-            sys.stdout.write("\n")        # move to next line
-            sys.stdout.write("\033[F")    # move cursor up one line
-            sys.stdout.write("\033[K")    # clear the line
+    async def connect(self, websocket: WebSocket, system_uuid: str, org: str, protocol: str = PROTO_TEXT):
+        # echo the subprotocol back so binary agents know the negotiation succeeded
+        subprotocol = BINARY_SUBPROTOCOL if protocol == PROTO_BINARY else None
+        await websocket.accept(subprotocol=subprotocol)
+
+        previous = self.connections.get(system_uuid)
+        if previous is not None:
+            # the agent reconnected before its old socket was noticed gone
+            self._forget(system_uuid, previous)
+            asyncio.create_task(self._close_quietly(previous.websocket))
+
+        connection = _Connection(websocket, org, protocol, time.monotonic())
+        connection.timer_slot = self.heartbeat.schedule(system_uuid, CONFIG["WS_IDLE_TIMEOUT"])
+        self.connections[system_uuid] = connection
+        self.org_members.setdefault(org, set()).add(system_uuid)
+        ingest_pipeline.open(system_uuid, org)
+        logger.info(f"ws_manager_conn: '{org}' - {system_uuid} connected ({protocol})")
+        self._log_connection(system_uuid, org)
+
+        try:
+            await connection_registry.register(system_uuid, org)
+        except Exception as e:
+            logger.error(f"ws_manager_conn: failed to register {system_uuid} in the connection registry: {e}")
+
+    def org_of(self, system_uuid: str) -> Optional[str]:
+        connection = self.connections.get(system_uuid)
+        return connection.org if connection else None
+
+    def _forget(self, system_uuid: str, connection: _Connection):
+        self.heartbeat.cancel(system_uuid, connection.timer_slot)
+        members = self.org_members.get(connection.org)
+        if members is not None:
+            members.discard(system_uuid)
+            if not members:
+                del self.org_members[connection.org]
+
+    async def disconnect(self, system_uuid: str, websocket: Optional[WebSocket] = None):
+        """
+        Drop the agent's connection. With `websocket`, only if that is still the agent's
+        current socket (a replaced or already expired socket's receive loop ends later).
+        """
+        connection = self.connections.get(system_uuid)
+        if websocket is not None and (connection is None or connection.websocket is not websocket):
+            return
+        if connection is not None:
+            del self.connections[system_uuid]
+            self._forget(system_uuid, connection)
+        ingest_pipeline.close(system_uuid)
+        if connection:
+            clear_console_line()
             logger.info(f"ws_manager_conn: {system_uuid} disconnected.")
-            await self._log_disconnection(system_uuid)
+            self._log_disconnection(system_uuid)
+
+            try:
+                await connection_registry.unregister(system_uuid)
+            except Exception as e:
+                logger.error(f"ws_manager_conn: failed to unregister {system_uuid} from the connection registry: {e}")
         else:
             logger.warning(f"ws_manager_conn: no active connection found for {system_uuid}")
 
-    async def receive_data(self, websocket: WebSocket, system_uuid: str):
-        try:
-            while True:
-                message = await websocket.receive_text()
-                logger.info(f"ws_manager_conn: received from {system_uuid} -> {message}")
-                # Now do something with this message...
-                # You could decode JSON, route commands, store stuff, etc.
-        except WebSocketDisconnect:
-            await self.disconnect(system_uuid)
-        except Exception as e:
-            logger.error(f"ws_manager_conn: error in receive loop for {system_uuid}: {e}")
-            await self.disconnect(system_uuid)
+    def register_control_handler(
+        self,
+        record_type: str,
+        handler: Callable[[str, Envelope], Awaitable[None]],
+        payload: Optional[type] = None
+    ):
+        """
+        Handle records of `record_type` inline on the receive loop instead of queueing them
+        for ingest; meant for small control messages (token refresh, acks, ...).
+        With `payload` (a msgspec.Struct), the record's payload is decoded into it and
+        records that don't match are dropped before reaching `handler`.
+        """
+        self.control_handlers[record_type] = handler
+        if payload is not None:
+            envelope_codec.register(record_type, payload)
 
-    async def _log_connection(self, system_uuid: str, org: str):
-        try:
-            connected_at = datetime.now(timezone.utc)
-            agent_status_col = mongo_manager_conn.get_db()["agent_status"]
-            
-            await agent_status_col.update_one(
-                {"system_uuid": system_uuid},
+    def register_routed_handler(self, kind: str, handler: Callable[[dict], Awaitable[None]]):
+        """
+        Handle node-to-node envelopes of `kind` (see `_on_routed_message`) outside this module.
+        """
+        self.routed_handlers[kind] = handler
+
+    async def _handle_control(self, system_uuid: str, records: List[Envelope]) -> List[Envelope]:
+        remaining = []
+        handlers = self.control_handlers
+        for record in records:
+            handler = handlers.get(record.type)
+            if handler is None:
+                remaining.append(record)
+                continue
+            try:
+                await handler(system_uuid, record)
+            except Exception as e:
+                logger.error(f"ws_manager_conn: control handler for '{record.type}' failed for {system_uuid}: {e}")
+        return remaining
+
+    async def start_routing(self):
+        """
+        Start consuming messages routed to this node by other workers/nodes.
+        """
+        await rmq_manager_conn.setup_node_routing(CONFIG["NODE_ID"], self._on_routed_message)
+
+    def start_heartbeat(self):
+        self.heartbeat.start()
+
+    async def stop_heartbeat(self):
+        await self.heartbeat.stop()
+
+    def _on_heartbeat(self, system_uuid: str):
+        """
+        Wheel expiry for one connection. Frames only bump `last_seen`; the timer is
+        pushed back lazily here, so a busy connection costs one reschedule per
+        `WS_IDLE_TIMEOUT` rather than one per frame.
+        """
+        connection = self.connections.get(system_uuid)
+        if connection is None:
+            return
+
+        now = time.monotonic()
+        idle_timeout = CONFIG["WS_IDLE_TIMEOUT"]
+        if connection.pinged_at and connection.last_seen < connection.pinged_at:
+            if now - connection.pinged_at >= CONFIG["WS_PING_TIMEOUT"]:
+                # nothing since the ping: the peer is gone (or the TCP connection is half-open)
+                WS_IDLE_CLOSED.inc()
+                logger.info(f"ws_manager_conn: {system_uuid} missed its heartbeat, closing.")
+                asyncio.create_task(self._expire(system_uuid, connection))
+                return
+            delay = CONFIG["WS_PING_TIMEOUT"] - (now - connection.pinged_at)
+        elif now - connection.last_seen >= idle_timeout:
+            connection.pinged_at = now
+            asyncio.create_task(self._send_local(system_uuid, [HEARTBEAT_PING]))
+            delay = CONFIG["WS_PING_TIMEOUT"]
+        else:
+            connection.pinged_at = 0.0
+            delay = idle_timeout - (now - connection.last_seen)
+        connection.timer_slot = self.heartbeat.schedule(system_uuid, delay)
+
+    async def _expire(self, system_uuid: str, connection: _Connection):
+        await self._close_quietly(connection.websocket, code=1001)
+        await self.disconnect(system_uuid, connection.websocket)
+
+    async def send_to_agent(self, system_uuid: str, record: dict) -> bool:
+        """
+        Send a record to an agent, wherever it is connected.
+        Agents held by this node are written to directly; the rest are routed to
+        their owning node over RabbitMQ.
+        """
+        if system_uuid in self.connections:
+            return await self._send_local(system_uuid, [record])
+
+        node_id = await connection_registry.lookup(system_uuid)
+        if node_id is None or node_id == CONFIG["NODE_ID"]:
+            logger.warning(f"ws_manager_conn: no active connection found for {system_uuid}")
+            return False
+
+        body = msgpack.packb({"kind": "deliver", "system_uuid": system_uuid, "records": [record]}, use_bin_type=True)
+        await rmq_manager_conn.publish_to_node(node_id, body)
+        return True
+
+    async def broadcast(
+        self,
+        record: dict,
+        org: Optional[str] = None,
+        system_uuids: Optional[Iterable[str]] = None,
+        where: Optional[Callable[[str, str], bool]] = None,
+        all_nodes: Optional[bool] = None
+    ) -> dict:
+        """
+        Push one record to every agent in `org` (or the whole fleet when `org` is None),
+        optionally narrowed to `system_uuids` and/or a `where(system_uuid, org)` predicate.
+
+        The record is encoded (and compressed, if large) once per wire protocol and sent
+        concurrently, capped at `BROADCAST_CONCURRENCY` in-flight sends with a per-send
+        timeout. With `all_nodes` (the default unless `where` is given), the org/uuid
+        selection is also fanned out to the other nodes over RabbitMQ. A `where`
+        predicate can't travel to them, so it is local-only and combining it with
+        `all_nodes=True` raises ValueError.
+        """
+        if where is not None and all_nodes:
+            raise ValueError("broadcast: 'where' only filters this node's agents; it can't be combined with all_nodes")
+        if all_nodes is None:
+            all_nodes = where is None
+        if system_uuids is not None:
+            system_uuids = list(system_uuids)  # used twice below; a generator would be empty the second time
+
+        if all_nodes:
+            body = msgpack.packb(
                 {
-                    "$set": {
-                        "system_uuid": system_uuid,
-                        "org": org,
-                        "status": "connected",
-                        "connected_at": connected_at
-                    },
-                    "$setOnInsert": {
-                        "last_disconnected": None
-                    }
+                    "kind": "broadcast",
+                    "origin": CONFIG["NODE_ID"],
+                    "record": record,
+                    "org": org,
+                    "system_uuids": system_uuids
                 },
-                upsert=True
+                use_bin_type=True
             )
-            logger.debug(f"ws: logged connection for {system_uuid} at {connected_at}.")
+            try:
+                await rmq_manager_conn.publish_broadcast(body)
+            except Exception as e:
+                logger.error(f"ws_manager_conn: failed to fan broadcast out to other nodes: {e}")
+
+        return await self._broadcast_local(record, org, system_uuids, where)
+
+    async def _broadcast_local(self, record: dict, org=None, system_uuids=None, where=None) -> dict:
+        if org is not None:
+            targets = set(self.org_members.get(org, ()))
+        else:
+            targets = set(self.connections)
+        if system_uuids is not None:
+            targets.intersection_update(system_uuids)
+        if where is not None:
+            targets = {system_uuid for system_uuid in targets if where(system_uuid, self.org_of(system_uuid))}
+
+        # encode once per protocol, not once per agent
+        binary_frame = encode_frame([record])
+        if len(binary_frame) >= CONFIG["BROADCAST_COMPRESS_MIN_BYTES"]:
+            binary_frame = encode_frame([record], compress=True)
+        text_frame = json.dumps(record)
+
+        semaphore = asyncio.Semaphore(CONFIG["BROADCAST_CONCURRENCY"])
+        timeout = CONFIG["BROADCAST_SEND_TIMEOUT"]
+        stats = {"targets": len(targets), "sent": 0, "failed": 0, "timed_out": 0}
+
+        async def send_one(system_uuid: str):
+            connection = self.connections.get(system_uuid)
+            if connection is None:
+                stats["failed"] += 1
+                return
+            websocket = connection.websocket
+
+            async with semaphore:
+                try:
+                    if connection.protocol == PROTO_BINARY:
+                        await asyncio.wait_for(websocket.send_bytes(binary_frame), timeout)
+                    else:
+                        await asyncio.wait_for(websocket.send_text(text_frame), timeout)
+                    stats["sent"] += 1
+                except asyncio.TimeoutError:
+                    stats["timed_out"] += 1
+                    # a cancelled send may have left a partial frame on the wire; drop the socket
+                    logger.warning(f"ws_manager_conn: broadcast to {system_uuid} timed out after {timeout}s, closing")
+                    asyncio.create_task(self._close_quietly(websocket))
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.debug(f"ws_manager_conn: broadcast to {system_uuid} failed: {e}")
+
+        await asyncio.gather(*(send_one(system_uuid) for system_uuid in targets))
+        logger.info(
+            f"ws_manager_conn: broadcast to {stats['targets']} agent(s): "
+            f"{stats['sent']} sent, {stats['failed']} failed, {stats['timed_out']} timed out"
+        )
+        return stats
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int = 1011):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _send_local(self, system_uuid: str, records: list) -> bool:
+        connection = self.connections.get(system_uuid)
+        if connection is None:
+            logger.warning(f"ws_manager_conn: no active connection found for {system_uuid}")
+            return False
+        websocket = connection.websocket
+
+        try:
+            if connection.protocol == PROTO_BINARY:
+                await websocket.send_bytes(encode_frame(records))
+            else:
+                for record in records:
+                    await websocket.send_text(json.dumps(record))
+            return True
         except Exception as e:
-            logger.error(f"ws: failed to log connection for {system_uuid}: {e}")
+            logger.error(f"ws_manager_conn: failed to send to {system_uuid}: {e}")
+            return False
 
-    async def _log_disconnection(self, system_uuid: str):
+    async def _on_routed_message(self, message):
         try:
-            disconnected_at = datetime.now(timezone.utc)
-            agent_status_col = mongo_manager_conn.get_db()["agent_status"]
+            envelope = msgpack.unpackb(message.body, raw=False)
+        except Exception as e:
+            logger.error(f"ws_manager_conn: dropping malformed routed message: {e}")
+            return
 
-            await agent_status_col.update_one(
-                {"system_uuid": system_uuid, "status": "connected"},
-                {"$set": {"status": "disconnected", "last_disconnected": disconnected_at}}
-            )
-            logger.debug(f"ws: logged disconnection for {system_uuid} at {disconnected_at}.")
+        kind = envelope.get("kind")
+        if kind == "deliver":
+            await self._send_local(envelope["system_uuid"], envelope["records"])
+        elif kind == "broadcast":
+            if envelope.get("origin") != CONFIG["NODE_ID"]:  # the origin node already sent its share
+                await self._broadcast_local(envelope["record"], envelope.get("org"), envelope.get("system_uuids"))
+        elif kind in self.routed_handlers:
+            await self.routed_handlers[kind](envelope)
+        else:
+            logger.warning(f"ws_manager_conn: unknown routed message kind '{envelope.get('kind')}'")
+
+    async def receive_data(self, websocket: WebSocket, system_uuid: str):
+        connection = self.connections.get(system_uuid)
+        if connection is None or connection.websocket is not websocket:
+            return  # replaced or expired before its receive loop started
+        protocol = connection.protocol
+        max_bytes = CONFIG["WS_MAX_FRAME_BYTES"]
+        max_records = CONFIG["WS_MAX_FRAME_RECORDS"]
+        frames, received, decoded = WS_FRAMES.labels(protocol), WS_BYTES.labels(protocol), WS_RECORDS.labels(protocol)
+        monotonic = time.monotonic
+        decode_msgpack, decode_text = envelope_codec.decode_msgpack, envelope_codec.decode_text
+
+        try:
+            while True:
+                if protocol == PROTO_BINARY:
+                    # one frame carries many length-prefixed msgpack records
+                    data = await websocket.receive_bytes()
+                    records = decode_frame(data, max_bytes, max_records, decode_msgpack)
+                else:
+                    data = await websocket.receive_text()
+                    records = decode_text(data)
+
+                # any frame counts as a heartbeat; the wheel reads last_seen when it's due
+                connection.last_seen = monotonic()
+                connection.frames_in += 1
+                connection.bytes_in += len(data)
+                connection.records_in += len(records)
+                if records and records[-1].seq > connection.last_seq:
+                    connection.last_seq = records[-1].seq
+                frames.inc()
+                received.inc(len(data))
+                decoded.inc(len(records))
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"ws_manager_conn: received {len(records)} record(s) from {system_uuid}")
+
+                # typed dispatch: registered types are handled inline, the rest are queued
+                records = await self._handle_control(system_uuid, records)
+
+                # processing happens on the ingest workers; this only waits for "block" classes
+                if records:
+                    await ingest_pipeline.submit(system_uuid, records)
+        except WebSocketDisconnect:
+            await self.disconnect(system_uuid, websocket)
+        except FrameError as e:
+            logger.warning(f"ws_manager_conn: malformed frame from {system_uuid}: {e}")
+            await websocket.close(code=1003)
+            await self.disconnect(system_uuid, websocket)
         except Exception as e:
-            logger.error(f"ws: failed to log disconnection: {e}")
+            logger.error(f"ws_manager_conn: error in receive loop for {system_uuid}: {e}")
+            await self.disconnect(system_uuid, websocket)
+
+    def _log_connection(self, system_uuid: str, org: str):
+        # queued & coalesced per agent; flushed in bulk by the status writer
+        agent_status_writer.mark_connected(system_uuid, org)
+        agent_inventory.mark_connected(system_uuid, org)
+
+    def _log_disconnection(self, system_uuid: str):
+        agent_status_writer.mark_disconnected(system_uuid)
+        agent_inventory.mark_disconnected(system_uuid)
 
 # Singleton instance to use app-wide
-ws_manager_conn = WSManager()
\ No newline at end of file
+ws_manager_conn = WSManager()
+
+ws_manager_conn.register_routed_handler("presence", agent_inventory.on_presence)
+
+async def _on_pong(system_uuid: str, record: Envelope):
+    pass  # receiving the frame already refreshed last_seen
+
+ws_manager_conn.register_control_handler("heartbeat.pong", _on_pong)
+
+registry.gauge(
+    "trex_ws_connections", "Agents connected to this node, per org.", ["org"],
+    callback=lambda: {(org,): len(members) for org, members in list(ws_manager_conn.org_members.items())}
+)
\ No newline at end of file
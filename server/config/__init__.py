@@ -1,2 +1,2 @@
 from .config import CONFIG
-from .rich_logger import logger
\ No newline at end of file
+from .rich_logger import logger, clear_console_line
\ No newline at end of file
@@ -11,6 +11,7 @@ To manage app configuration from one place.
 """
 
 import os
+import socket
 
 """
 [PATCH]
@@ -26,9 +27,19 @@ CONFIG = {
     "JWT_KEY": os.getenv("JWT_KEY", "84Cfe@GjsysF?s/u(o`nZ@Ak*W@0^h"),  # Use a strong secret key
     "ALGORITHM": "HS256",  # JWT algorithm
     "ACCESS_TOKEN_EXPIRE_MINUTES": 5,  # Token expiration time
+    "TOKEN_CACHE_SIZE": int(os.getenv("TOKEN_CACHE_SIZE", 50000)),  # verified tokens kept in memory
+    "TOKEN_CACHE_TTL": float(os.getenv("TOKEN_CACHE_TTL", 60)),  # seconds a verified token is trusted without re-checking
+    "ADMIN_TOKEN": os.getenv("ADMIN_TOKEN", ""),  # bearer token for the operator endpoints (empty: they're disabled)
     
     # LOGGING
     "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO").upper(),  # default to INFO if not set in .env
+    "LOG_FORMAT": os.getenv("LOG_FORMAT", "rich").lower(),  # "rich" (console) or "json" (JSON lines, production)
+    "LOG_ASYNC": os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),  # format & write logs off the event loop
+
+    # METRICS
+    "METRICS_LOOP_LAG_INTERVAL": float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 0.5)),  # seconds between event-loop lag probes
+    "LOOP_LAG_THRESHOLD": float(os.getenv("LOOP_LAG_THRESHOLD", 0.1)),  # seconds of loop stall that get logged with a stack (0 = off)
+    "PROFILE_MAX_SECONDS": float(os.getenv("PROFILE_MAX_SECONDS", 60)),  # upper bound for one /admin/profile run
 
     # DATABASE
     # "MONGO_URL": os.getenv("MONGO_URL", "mongodb://localhost:27017"),
@@ -37,9 +48,69 @@ CONFIG = {
         "mongodb://localhost:27017/?connectTimeoutMS=3000&socketTimeoutMS=3000"
         ),
     "MONGO_ROOT_DB": os.getenv("MONGO_ROOT_DB", "trex_db"),
+    "MONGO_BUFFER_MAX_BATCH": int(os.getenv("MONGO_BUFFER_MAX_BATCH", 1000)),  # ops per insert_many/bulk_write
+    "MONGO_BUFFER_FLUSH_INTERVAL": float(os.getenv("MONGO_BUFFER_FLUSH_INTERVAL", 0.5)),  # seconds
+    "MONGO_BUFFER_MAX_PENDING": int(os.getenv("MONGO_BUFFER_MAX_PENDING", 50000)),  # memory budget (queued + in-flight ops)
+    "AGENT_STATUS_FLUSH_INTERVAL": float(os.getenv("AGENT_STATUS_FLUSH_INTERVAL", 0.25)),  # seconds between agent_status bulk writes
+    "AGENTS_PAGE_MAX": int(os.getenv("AGENTS_PAGE_MAX", 1000)),  # upper bound for an /agents page
+    "TELEMETRY_ROLLUP_FLUSH_INTERVAL": float(os.getenv("TELEMETRY_ROLLUP_FLUSH_INTERVAL", 10)),  # seconds between 1m/1h rollup merges
+    "TELEMETRY_RAW_TTL_DAYS": float(os.getenv("TELEMETRY_RAW_TTL_DAYS", 30)),  # raw samples expire after this (0 = keep forever)
+    "TELEMETRY_QUERY_MAX_POINTS": int(os.getenv("TELEMETRY_QUERY_MAX_POINTS", 5000)),  # upper bound for a query's point budget
 
     # RabbitMQ
     "RMQ_HOST": os.getenv("RMQ_HOST", "localhost"),
     "RMQ_USER": os.getenv("RMQ_USER", "guest"),
-    "RMQ_PASS": os.getenv("RMQ_PASS", "guest")
+    "RMQ_PASS": os.getenv("RMQ_PASS", "guest"),
+    "RMQ_CHANNEL_POOL_SIZE": int(os.getenv("RMQ_CHANNEL_POOL_SIZE", 4)),  # publisher channels per logical group
+    "RMQ_MAX_INFLIGHT_PUBLISHES": int(os.getenv("RMQ_MAX_INFLIGHT_PUBLISHES", 1000)),  # unconfirmed publishes per group
+    "RMQ_ROUTE_EXCHANGE": os.getenv("RMQ_ROUTE_EXCHANGE", "trex.route"),  # node-to-node routing exchange
+    "RMQ_BROADCAST_EXCHANGE": os.getenv("RMQ_BROADCAST_EXCHANGE", "trex.broadcast"),  # fan-out to every node
+    "RMQ_FILESTREAM_QUEUE": os.getenv("RMQ_FILESTREAM_QUEUE", "trex.filestream.completed"),  # completed upload events
+    "RMQ_ACTION_QUEUE": os.getenv("RMQ_ACTION_QUEUE", "trex.actions"),  # tasks for agents
+    "RMQ_ACTION_REPLY_QUEUE": os.getenv("RMQ_ACTION_REPLY_QUEUE", "trex.actions.replies"),  # results when a task has no reply_to
+    "RMQ_ACTION_PREFETCH": int(os.getenv("RMQ_ACTION_PREFETCH", 1000)),  # tasks in flight per node
+
+    # ACTIONS
+    "ACTION_DEFAULT_TIMEOUT": float(os.getenv("ACTION_DEFAULT_TIMEOUT", 30)),  # seconds an agent gets to answer a task
+    "ACTION_MAX_TIMEOUT": float(os.getenv("ACTION_MAX_TIMEOUT", 300)),  # upper bound for a task's own timeout
+
+    # FILE STREAMING
+    "FILESTORE_BACKEND": os.getenv("FILESTORE_BACKEND", "local"),  # "local" (FILESTORE_DIR) or "gridfs"
+    "FILESTORE_DIR": os.getenv("FILESTORE_DIR", "./filestore"),  # partial uploads (and completed ones, for "local")
+    "FILESTORE_GRIDFS_BUCKET": os.getenv("FILESTORE_GRIDFS_BUCKET", "agent_files"),
+    "FILESTORE_MAX_FILE_BYTES": int(os.getenv("FILESTORE_MAX_FILE_BYTES", 16 * 1024 ** 3)),  # per upload
+
+    # CLUSTER
+    # every uvicorn worker is its own node; the pid keeps ids unique across `--workers N`
+    "NODE_ID": os.getenv("NODE_ID", f"{socket.gethostname()}-{os.getpid()}"),
+    "CONNECTION_REGISTRY": os.getenv("CONNECTION_REGISTRY", "local"),  # "local" (single node) or "mongo" (shared)
+    "NODE_ENDPOINT": os.getenv("NODE_ENDPOINT", ""),  # this node's public ws base url, e.g. ws://10.0.0.5:8000
+    "CLUSTER_SHARDING": os.getenv("CLUSTER_SHARDING", "off").lower(),  # "off", "org" (org affinity) or "uuid"
+    "CLUSTER_VNODES": int(os.getenv("CLUSTER_VNODES", 128)),  # hash ring points per node
+    "CLUSTER_HEARTBEAT_INTERVAL": float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", 5)),  # seconds between node heartbeats
+    "CLUSTER_NODE_TTL": float(os.getenv("CLUSTER_NODE_TTL", 15)),  # seconds without a heartbeat before a node leaves the ring
+
+    # WEBSOCKET
+    "WS_MAX_FRAME_BYTES": int(os.getenv("WS_MAX_FRAME_BYTES", 1024 * 1024)),  # upper bound for a (decompressed) binary frame
+    "WS_MAX_FRAME_RECORDS": int(os.getenv("WS_MAX_FRAME_RECORDS", 1024)),  # upper bound for records per binary frame
+    "WS_IDLE_TIMEOUT": float(os.getenv("WS_IDLE_TIMEOUT", 60)),  # seconds without a frame before an agent is pinged
+    "WS_PING_TIMEOUT": float(os.getenv("WS_PING_TIMEOUT", 20)),  # seconds a pinged agent has to answer before it's dropped
+    "WS_HEARTBEAT_TICK": float(os.getenv("WS_HEARTBEAT_TICK", 1.0)),  # heartbeat timer wheel resolution (seconds)
+    "WS_HEARTBEAT_SLOTS": int(os.getenv("WS_HEARTBEAT_SLOTS", 128)),  # wheel size; span = tick * slots
+    "BROADCAST_CONCURRENCY": int(os.getenv("BROADCAST_CONCURRENCY", 500)),  # in-flight sends per broadcast
+    "BROADCAST_SEND_TIMEOUT": float(os.getenv("BROADCAST_SEND_TIMEOUT", 2.0)),  # seconds before a slow agent is skipped & dropped
+    "BROADCAST_COMPRESS_MIN_BYTES": int(os.getenv("BROADCAST_COMPRESS_MIN_BYTES", 1024)),  # zlib binary frames above this size
+
+    # INGEST
+    "INGEST_WORKERS": int(os.getenv("INGEST_WORKERS", 8)),  # worker tasks draining the per-agent queues
+    "INGEST_QUEUE_SIZE": int(os.getenv("INGEST_QUEUE_SIZE", 1000)),  # records buffered per agent
+    "INGEST_BATCH": int(os.getenv("INGEST_BATCH", 256)),  # records a worker takes from one agent per turn
+    "INGEST_SAMPLE_WATERMARK": 0.5,  # queue fill ratio past which "sample" classes get thinned
+    "INGEST_SAMPLE_RATE": 10,  # keep 1 in N "sample" records past the watermark
+    # full-queue policy per record type ("block", "drop_oldest" or "sample")
+    "INGEST_POLICIES": {
+        "default": "drop_oldest",
+        "telemetry": "sample",
+        "telemetry.series": "sample"
+    }
 }
\ No newline at end of file
@@ -5,9 +5,21 @@ Rich logger configuration
 -x-x-
 A custom logger configuration for functionality assertion
 and debugging.
+
+- LOG_FORMAT "rich" renders colored console output, "json" emits one JSON object
+  per line (no Rich rendering; meant for production/log shippers).
+- With LOG_ASYNC the event loop only enqueues records; formatting and I/O run on
+  a background QueueListener thread.
 """
 import re 
+import sys
+import json
+import atexit
 import logging
+import logging.handlers
+import queue
+
+from datetime import datetime, timezone
 from rich.console import Console
 from rich.theme import Theme
 from rich.logging import RichHandler
@@ -27,13 +39,16 @@ custom_theme = Theme({
 # Create a console using the custom theme
 custom_console = Console(theme=custom_theme)
 
+# "component: message" prefix used by every log line in the app
+PREFIX_PATTERN = re.compile(r"^(.*?):\s(.*)", re.DOTALL)
+
 class PurplePrefixRichHandler(RichHandler):
     def emit(self, record: logging.LogRecord) -> None:
         # Save original message
         original_msg = record.getMessage()
 
         # Try to extract a prefix (e.g., "rmq_manager_conn: some message")
-        match = re.match(r"^(.*?):\s(.*)", original_msg)
+        match = PREFIX_PATTERN.match(original_msg)
         if match:
             prefix, rest = match.groups()
             # Pad prefix to a fixed width (e.g., 20 characters)
@@ -47,6 +62,62 @@ class PurplePrefixRichHandler(RichHandler):
 
         super().emit(record)
 
+class JSONLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line; the "component: message" prefix becomes its own field.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+
+        match = PREFIX_PATTERN.match(message)
+        if match:
+            entry["component"], message = match.groups()
+        entry["msg"] = message
+
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, default=str)
+
+class EnqueueOnlyHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that skips `prepare()`; the stock one formats the message (and any
+    traceback) on the caller's thread. The queue is in-process, so the record can be
+    handed over as-is and formatted by the listener thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def build_output_handler(log_format: str) -> logging.Handler:
+    if log_format == "json":
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JSONLinesFormatter())
+        return handler
+
+    return PurplePrefixRichHandler(
+        console=custom_console,
+        markup=True,
+        rich_tracebacks=True,
+        show_path=False
+    )
+
+def clear_console_line():
+    """
+    Wipe the "^C" echo from the terminal before a shutdown/disconnect log line.
+    Not done for JSON output, where it would corrupt the line stream.
+    """
+    if log_format != "json":
+        sys.stdout.write("\n")        # move to next line
+        sys.stdout.write("\033[F")    # move cursor up one line
+        sys.stdout.write("\033[K")    # clear the line
+
 # Get the log level from the config and convert it to a valid logging level
 log_level = CONFIG.get("LOG_LEVEL", "INFO").upper()
 
@@ -72,17 +143,26 @@ log_level_map = {
 #     )]
 # )
 
+log_format = CONFIG.get("LOG_FORMAT", "rich").lower()
+output_handler = build_output_handler(log_format)
+log_listener = None
+
+if CONFIG.get("LOG_ASYNC", True):
+    # the event loop only pays for an enqueue; the listener thread formats & writes
+    log_queue = queue.SimpleQueue()
+    root_handlers = [EnqueueOnlyHandler(log_queue)]
+    log_listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # flush whatever is still queued on exit
+else:
+    root_handlers = [output_handler]
+
 # Configure logging
 logging.basicConfig(
     level=log_level_map.get(log_level, logging.INFO),
     format="%(message)s",  # No timestamp or extra fields
     datefmt="[%Y-%m-%d %H:%M:%S]",
-    handlers=[PurplePrefixRichHandler(
-        console=custom_console,
-        markup=True,
-        rich_tracebacks=True,
-        show_path=False
-    )]
+    handlers=root_handlers
 )
 
 # Suppress logs for Uvicorn
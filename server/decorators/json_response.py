@@ -2,31 +2,64 @@
 
 """
 Generic JSON response decorator
+-x-x-
+Wraps a handler's result in the {"status", "message", "data"} envelope.
+
+- Bodies are encoded with orjson (datetimes included) straight to bytes.
+- Message-only results (a handler returning a str, like the healthcheck) are
+  encoded once and the bytes reused on every later call.
+- `json_stream_response` streams one large list inside the envelope in chunks,
+  for results such as fleet inventories.
 """
 
-from fastapi.responses import JSONResponse
+import orjson
+
+from fastapi.responses import Response, StreamingResponse
 from functools import wraps
-from typing import Callable
+from typing import Callable, Dict, Iterator
+
+MEDIA_TYPE = "application/json"
+MAX_CACHED_MESSAGES = 64  # distinct message-only bodies kept per decorated handler
+
+def _dumps(content) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
+class FastJSONResponse(Response):
+    media_type = MEDIA_TYPE
+
+    def render(self, content) -> bytes:
+        return _dumps(content)
+
+def _envelope(result):
+    """(message, data) for a handler result."""
+    if isinstance(result, dict):
+        if "message" not in result:
+            return "success", result
+        data = dict(result)
+        # 'message' goes in the envelope, not in data
+        return data.pop("message"), data
+    if isinstance(result, str):
+        return result, {}  # use the string as the message
+    return "success", {}  # default message for other types
 
 def json_response(status_code: int = 200):
     def decorator(func: Callable):
+        encoded_messages: Dict[str, bytes] = {}
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             result = await func(*args, **kwargs)
 
-            if isinstance(result, dict):
-                message = result.get("message", "success")
-                # Remove 'message' key from result to avoid redundancy in data
-                data = {key: value for key, value in result.items() if key != "message"}  # exclude 'message' from data
-            elif isinstance(result, str):
-                message = result  # use the string as the message
-                data = {}  # set data to an empty object (empty dict) or None
-            else:
-                message = "success"  # default message for other types
-                data = {}  # set data to an empty object (empty dict) or None
-
-            return JSONResponse(
+            if isinstance(result, str):
+                body = encoded_messages.get(result)
+                if body is None:
+                    body = _dumps({"status": "ok", "message": result, "data": {}})
+                    if len(encoded_messages) < MAX_CACHED_MESSAGES:
+                        encoded_messages[result] = body
+                return Response(content=body, status_code=status_code, media_type=MEDIA_TYPE)
+
+            message, data = _envelope(result)
+            return FastJSONResponse(
                 status_code=status_code,
                 content={
                     "status": "ok",
@@ -35,4 +68,31 @@ def json_response(status_code: int = 200):
                 }
             )
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+def json_stream_response(items_key: str, status_code: int = 200, chunk_size: int = 500):
+    """
+    Like `json_response`, for handlers whose result holds one large list under
+    `items_key`: the envelope is written first and the list follows in chunks of
+    `chunk_size` items, encoded in the threadpool as the client reads them.
+    """
+    def decorator(func: Callable):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            result = await func(*args, **kwargs)
+            message, data = _envelope(result)
+            items = data.get(items_key) or []
+
+            def body() -> Iterator[bytes]:
+                # the list goes last so the head ends with `[]}}` and can be cut open there
+                head = {key: value for key, value in data.items() if key != items_key}
+                head[items_key] = []
+                yield _dumps({"status": "ok", "message": message, "data": head})[:-3]
+                for start in range(0, len(items), chunk_size):
+                    chunk = _dumps(items[start:start + chunk_size])[1:-1]
+                    yield chunk if start == 0 else b"," + chunk
+                yield b"]}}"
+
+            return StreamingResponse(body(), status_code=status_code, media_type=MEDIA_TYPE)
+        return wrapper
+    return decorator
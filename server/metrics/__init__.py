@@ -0,0 +1,3 @@
+from .core import registry, Counter, Gauge, Histogram
+from .loop import loop_lag_monitor
+from .profiler import sample_stacks, ProfilerBusy
@@ -0,0 +1,98 @@
+# server/metrics/loop.py
+
+"""
+Event-loop lag
+-x-x-
+A probe task sleeps `METRICS_LOOP_LAG_INTERVAL` seconds at a time and records how
+much later than requested it woke up. That overshoot is the time some callback
+kept the loop busy, i.e. how long every agent connection was stalled.
+
+While the loop is stuck, the probe can't report anything itself, so a watchdog
+thread watches its heartbeat: once the probe is `LOOP_LAG_THRESHOLD` seconds
+overdue, the watchdog logs the loop thread's current stack, which is the
+offending callback caught in the act.
+"""
+
+import sys
+import time
+import asyncio
+import threading
+import traceback
+
+from server.config import CONFIG, logger
+from server.metrics.core import registry
+
+LOOP_LAG = registry.histogram(
+    "trex_event_loop_lag_seconds",
+    "How late the event loop woke a probe sleeping METRICS_LOOP_LAG_INTERVAL seconds.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = registry.counter(
+    "trex_event_loop_stalls_total", "Probe wake-ups later than LOOP_LAG_THRESHOLD seconds."
+)
+
+class LoopLagMonitor:
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._loop_thread = None
+        self._deadline = 0.0  # perf_counter by which the probe should have woken up
+        self._reported = 0.0  # deadline of the last stall the watchdog already logged
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._deadline = time.perf_counter() + self.interval
+        self._task = asyncio.create_task(self._run())
+
+        if self.threshold > 0:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self):
+        logger.debug(f"loop_lag: probing every {self.interval}s (threshold {self.threshold}s)")
+        while True:
+            started = time.perf_counter()
+            self._deadline = started + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            LOOP_LAG.observe(lag)
+            if self.threshold > 0 and lag >= self.threshold:
+                LOOP_STALLS.inc()
+                logger.warning(f"loop_lag: event loop was blocked for {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        # poll often enough to catch a stall while it's still ongoing
+        period = min(self.threshold / 2, self.interval)
+        while not self._stopped.wait(period):
+            deadline = self._deadline
+            if deadline == self._reported or time.perf_counter() - deadline < self.threshold:
+                continue
+
+            self._reported = deadline
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"loop_lag: event loop blocked for over {self.threshold * 1000:.0f}ms in:\n{stack}")
+
+# app-wide monitor
+loop_lag_monitor = LoopLagMonitor(CONFIG["METRICS_LOOP_LAG_INTERVAL"], CONFIG["LOOP_LAG_THRESHOLD"])
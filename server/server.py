@@ -11,16 +11,31 @@ Central server app; All agents connect here.
 - Stores telemetry & interaction data in Mongo.
 """
 import sys
+import asyncio
 
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 
-from server.decorators.json_response import json_response
-from server.config import logger
-from server.auth import auth_router
+from server.decorators.json_response import json_response, json_stream_response
+from server.config import CONFIG, logger, clear_console_line
+from server.auth import auth_router, require_admin
+from server.metrics import registry, loop_lag_monitor, sample_stacks, ProfilerBusy
 from server.comms import (
     rmq_manager_conn,
-    mongo_manager_conn
+    mongo_manager_conn,
+    ws_manager_conn,
+    agent_status_writer,
+    agent_inventory,
+    connection_registry,
+    cluster,
+    ingest_pipeline,
+    filestream_manager,
+    action_dispatcher,
+    telemetry_store,
+    envelope_codec
 )
 
 """
@@ -42,23 +57,46 @@ async def lifespan(app: FastAPI):
     try:
         await rmq_manager_conn.connect_to_rabbit()
         await mongo_manager_conn.connect_to_mongo()
+        await agent_status_writer.ensure_indexes()
+        await cluster.start()  # before the inventory load, which checks node liveness against the ring
+        await agent_inventory.load()
+        await telemetry_store.ensure_collections()
+        envelope_codec.compile()  # every record schema is registered by now (handlers register at import)
+        await ws_manager_conn.start_routing()
+        await filestream_manager.setup()
+        await action_dispatcher.start()
     except RuntimeError:
         logger.error("server: RabbitMQ/Mongo services are down. Application cannot start.")
         sys.exit(1)
+
+    loop_lag_monitor.start()
+    ws_manager_conn.start_heartbeat()
+    agent_status_writer.start()
+    agent_inventory.start()
+    telemetry_store.start()
+    ingest_pipeline.start()
     
     try:
         # --- Yield to app ---
         yield
     finally:
         # --- Shutdown Logic ---
-        sys.stdout.write("\n")        # move to next line
-        sys.stdout.write("\033[F")    # move cursor up one line
-        sys.stdout.write("\033[K")    # clear the line
+        clear_console_line()
         logger.info("server: shutting down server... /ws/ will be closed")
 
-        # Clean up connections
+        # Drain ingest & flush buffered writes while Mongo is still reachable, then clean up connections
+        await ws_manager_conn.stop_heartbeat()
+        await action_dispatcher.stop()
+        await ingest_pipeline.stop()
+        await agent_status_writer.stop()
+        await agent_inventory.stop()
+        await telemetry_store.stop()
+        await connection_registry.clear_node()
+        await cluster.stop()
+        await mongo_manager_conn.flush()
         await mongo_manager_conn.close()
         await rmq_manager_conn.close()
+        await loop_lag_monitor.stop()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(auth_router, prefix="/auth")
@@ -70,6 +108,69 @@ async def healthcheck():
     logger.debug("server: healthcheck endpoint hit!")
     return "healthy"
 
+# Prometheus scrape target
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# sample every thread's stack for `seconds`; folded output for flamegraph.pl / speedscope
+@app.get("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def profile(seconds: float = 10, interval: float = 0.005):
+    seconds = max(0.1, min(seconds, CONFIG["PROFILE_MAX_SECONDS"]))
+    interval = max(interval, 0.001)
+    try:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks)
+
+# fleet inventory, served from the in-memory presence index; page with `after` = previous `next`
+@app.get("/agents", dependencies=[Depends(require_admin)])
+@json_stream_response("agents", status_code=200)
+async def list_agents(
+    org: Optional[str] = None,
+    status: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 100
+):
+    limit = max(1, min(limit, CONFIG["AGENTS_PAGE_MAX"]))
+    return agent_inventory.page(org, status, after, limit)
+
+# number of agents per org/status, e.g. /agents/count?org=acme&status=connected
+@app.get("/agents/count", dependencies=[Depends(require_admin)])
+@json_response(status_code=200)
+async def count_agents(org: Optional[str] = None, status: Optional[str] = None):
+    return {"org": org, "status": status, "count": agent_inventory.count(org, status)}
+
+# per-agent ingest queue depths
+@app.get("/ingest/queues", dependencies=[Depends(require_admin)])
+@json_response(status_code=200)
+async def ingest_queues():
+    return {"total_depth": ingest_pipeline.total_depth(), "queues": ingest_pipeline.queue_depths()}
+
+# ask an agent to upload a file (the agent only honours paths under its UPLOAD_DIRS)
+@app.post("/files/request/{system_uuid}", dependencies=[Depends(require_admin)])
+@json_response(status_code=200)
+async def request_file(system_uuid: str, path: str):
+    delivered = await ws_manager_conn.send_to_agent(system_uuid, {"type": "file.request", "payload": {"path": path}})
+    return {"system_uuid": system_uuid, "path": path, "delivered": delivered}
+
+# one agent's collector over [start, end), at most `points` samples/buckets
+@app.get("/telemetry/{system_uuid}/{collector}", dependencies=[Depends(require_admin)])
+@json_response(status_code=200)
+async def telemetry_series(
+    system_uuid: str,
+    collector: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 500
+):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    points = max(1, min(points, CONFIG["TELEMETRY_QUERY_MAX_POINTS"]))
+    series = await telemetry_store.query(system_uuid, collector, start, end, points)
+    return {"system_uuid": system_uuid, "collector": collector, **series}
+
 ascii_art = r"""
   ___                                      .-~. /_"-._
 `-._~-.                                  / /_ "~o\  :Y